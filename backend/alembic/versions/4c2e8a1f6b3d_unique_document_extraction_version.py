@@ -0,0 +1,33 @@
+"""unique document_id + extraction_version on document_extractions
+
+Revision ID: 4c2e8a1f6b3d
+Revises: 935609b37e90
+Create Date: 2026-10-18 11:05:27.481930
+
+"""
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '4c2e8a1f6b3d'
+down_revision: str | Sequence[str] | None = '935609b37e90'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    # Batch mode: compatibile anche con SQLite
+    with op.batch_alter_table("document_extractions") as batch_op:
+        batch_op.create_unique_constraint(
+            "uq_document_extractions_document_id_extraction_version",
+            ["document_id", "extraction_version"],
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("document_extractions") as batch_op:
+        batch_op.drop_constraint(
+            "uq_document_extractions_document_id_extraction_version",
+            type_="unique",
+        )
@@ -0,0 +1,30 @@
+"""add latency_ms and shadow to document_extractions
+
+Revision ID: 7d1f3b9a2c64
+Revises: 4c2e8a1f6b3d
+Create Date: 2026-10-18 12:20:03.918442
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '7d1f3b9a2c64'
+down_revision: str | Sequence[str] | None = '4c2e8a1f6b3d'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("document_extractions") as batch_op:
+        batch_op.add_column(sa.Column("latency_ms", sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column("shadow", sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("document_extractions") as batch_op:
+        batch_op.drop_column("shadow")
+        batch_op.drop_column("latency_ms")
@@ -0,0 +1,36 @@
+"""add duplicate_of to documents
+
+Revision ID: 935609b37e90
+Revises: 550015ebe63e
+Create Date: 2026-10-18 10:12:41.207113
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '935609b37e90'
+down_revision: str | Sequence[str] | None = '550015ebe63e'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    # Batch mode: compatibile anche con SQLite (FK aggiunta con ricreazione tabella)
+    with op.batch_alter_table("documents") as batch_op:
+        batch_op.add_column(sa.Column("duplicate_of", sa.String(length=36), nullable=True))
+        batch_op.create_foreign_key(
+            "fk_documents_duplicate_of_documents",
+            "documents",
+            ["duplicate_of"],
+            ["id"],
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("documents") as batch_op:
+        batch_op.drop_constraint("fk_documents_duplicate_of_documents", type_="foreignkey")
+        batch_op.drop_column("duplicate_of")
@@ -0,0 +1,43 @@
+"""add OCR/extractor version fingerprints to documents and document_extractions
+
+Revision ID: a3e5c7d9f1b2
+Revises: 7d1f3b9a2c64
+Create Date: 2026-10-18 15:02:41.207319
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3e5c7d9f1b2'
+down_revision: str | Sequence[str] | None = '7d1f3b9a2c64'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    # Le righe esistenti ricevono fingerprint "" (provenienza sconosciuta = obsolete)
+    with op.batch_alter_table("documents") as batch_op:
+        batch_op.add_column(sa.Column("ocr_fingerprint", sa.String(length=16), nullable=False, server_default=""))
+        batch_op.create_index("ix_documents_status_ocr_fingerprint", ["status", "ocr_fingerprint"])
+
+    with op.batch_alter_table("document_extractions") as batch_op:
+        batch_op.add_column(sa.Column("ocr_fingerprint", sa.String(length=16), nullable=False, server_default=""))
+        batch_op.add_column(sa.Column("extractor_fingerprint", sa.String(length=16), nullable=False, server_default=""))
+        batch_op.create_index(
+            "ix_document_extractions_version_fingerprint", ["extraction_version", "extractor_fingerprint"]
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("document_extractions") as batch_op:
+        batch_op.drop_index("ix_document_extractions_version_fingerprint")
+        batch_op.drop_column("extractor_fingerprint")
+        batch_op.drop_column("ocr_fingerprint")
+
+    with op.batch_alter_table("documents") as batch_op:
+        batch_op.drop_index("ix_documents_status_ocr_fingerprint")
+        batch_op.drop_column("ocr_fingerprint")
@@ -0,0 +1,48 @@
+"""add indexes for the expenses list query shapes
+
+Revision ID: c8d2e4f6a1b3
+Revises: a3e5c7d9f1b2
+Create Date: 2026-10-18 18:20:12.514093
+
+"""
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8d2e4f6a1b3'
+down_revision: str | Sequence[str] | None = 'a3e5c7d9f1b2'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+# filtro (prefisso) + ORDER BY expense_date desc, id desc di list_expenses
+_BTREE_INDEXES = {
+    "ix_expenses_date_id": ["expense_date", "id"],
+    "ix_expenses_category_date_id": ["category", "expense_date", "id"],
+    "ix_expenses_source_date_id": ["source", "expense_date", "id"],
+    "ix_expenses_review_date_id": ["needs_review", "expense_date", "id"],
+    "ix_expenses_amount": ["amount"],
+}
+
+
+def upgrade() -> None:
+    for name, columns in _BTREE_INDEXES.items():
+        op.create_index(name, "expenses", columns)
+
+    # merchant ILIKE '%x%': GIN a trigrammi su Postgres; altrove (SQLite) b-tree semplice, che il count
+    # usa come indice coprente più stretto della tabella
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "ix_expenses_merchant_trgm",
+        "expenses",
+        ["merchant"],
+        postgresql_using="gin",
+        postgresql_ops={"merchant": "gin_trgm_ops"},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_expenses_merchant_trgm", table_name="expenses")
+    for name in reversed(list(_BTREE_INDEXES)):
+        op.drop_index(name, table_name="expenses")
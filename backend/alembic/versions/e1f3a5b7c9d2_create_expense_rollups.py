@@ -0,0 +1,54 @@
+"""create expense_rollups (monthly aggregates) and backfill them from expenses
+
+Revision ID: e1f3a5b7c9d2
+Revises: c8d2e4f6a1b3
+Create Date: 2026-10-18 20:41:37.902415
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1f3a5b7c9d2'
+down_revision: str | Sequence[str] | None = 'c8d2e4f6a1b3'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "expense_rollups",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("category", sa.String(length=100), nullable=False),
+        sa.Column("merchant", sa.String(length=255), nullable=False),
+        sa.Column("currency", sa.String(length=3), nullable=False),
+        sa.Column("source", sa.String(length=20), nullable=False),
+        sa.Column("total_amount", sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column("expense_count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_expense_rollups")),
+        sa.UniqueConstraint(
+            "month", "category", "merchant", "currency", "source", name="uq_expense_rollups_grain"
+        ),
+    )
+
+    # Backfill: stessi aggregati di app.cli.rebuild_rollups, calcolati in SQL
+    if op.get_bind().dialect.name == "postgresql":
+        month = "CAST(date_trunc('month', expense_date) AS DATE)"
+    else:
+        month = "date(expense_date, 'start of month')"
+    op.execute(
+        f"""
+        INSERT INTO expense_rollups (month, category, merchant, currency, source, total_amount, expense_count)
+        SELECT {month}, COALESCE(category, ''), COALESCE(merchant, ''), currency, source, SUM(amount), COUNT(*)
+        FROM expenses
+        GROUP BY {month}, COALESCE(category, ''), COALESCE(merchant, ''), currency, source
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("expense_rollups")
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+"""
+Risposte su file statici (artefatti su disco) con validatori HTTP:
+ETag e Last-Modified dallo stat del file, 304 sulle richieste condizionali.
+Il contenuto viene inviato in streaming così com'è (niente parsing né copia in memoria).
+"""
+
+
+def file_etag(stat: os.stat_result, *, variant: str = "") -> str:
+    # Il file viene sempre sostituito (os.replace), mai riscritto: size + mtime bastano come validatore
+    suffix = f"-{variant}" if variant else ""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}{suffix}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # confronto "weak" (RFC 9110): il prefisso W/ viene ignorato
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates
+
+
+def is_not_modified(request: Request, *, etag: str, stat: os.stat_result) -> bool:
+    """True se il client ha già questa versione (If-None-Match, oppure If-Modified-Since)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(stat.st_mtime) <= since
+    return False
+
+
+def accepts_gzip(request: Request) -> bool:
+    """Accept-Encoding contiene gzip (o *) con q > 0."""
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.partition(";")
+        if coding.strip().lower() not in ("gzip", "*"):
+            continue
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def conditional_file_response(
+    request: Request,
+    path: Path,
+    *,
+    media_type: str,
+    content_encoding: str | None = None,
+    vary: str | None = None,
+) -> Response:
+    """FileResponse con ETag/Last-Modified, oppure 304 se il client ha già questa versione."""
+    stat = path.stat()
+    etag = file_etag(stat, variant=content_encoding or "")
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        # il client può tenerlo in cache ma deve rivalidarlo (richiesta condizionale)
+        "Cache-Control": "no-cache",
+    }
+    if vary:
+        headers["Vary"] = vary
+
+    if is_not_modified(request, etag=etag, stat=stat):
+        return Response(status_code=304, headers=headers)
+
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
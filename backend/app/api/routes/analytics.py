@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from datetime import date
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.db import get_db
+from app.schemas.analytics import ExpenseSummaryResponse, RollupDimension
+from app.services.analytics import summarize
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+db_dep = Depends(get_db)
+
+
+def _month(value: str | None, name: str) -> date | None:
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(f"{value}-01")
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"{name} must be YYYY-MM") from None
+
+
+@router.get("/expenses", response_model=ExpenseSummaryResponse)
+def expenses_summary_endpoint(
+    db: Session = db_dep,
+    group_by: Annotated[list[RollupDimension] | None, Query(description="dimensioni (ripetibile)")] = None,
+    month_from: Annotated[str | None, Query(description="primo mese incluso, YYYY-MM")] = None,
+    month_to: Annotated[str | None, Query(description="ultimo mese incluso, YYYY-MM")] = None,
+    category: str | None = None,
+    merchant: str | None = None,
+    currency: str | None = None,
+    source: str | None = None,
+) -> ExpenseSummaryResponse:
+    """
+    Totali e conteggi raggruppati per mese/categoria/merchant/valuta/source su un intervallo di mesi.
+    Letti dai rollup mensili: il costo dipende dal numero di gruppi, non dal numero di spese.
+    """
+    group_by = group_by or []
+    rows = summarize(
+        db,
+        group_by=group_by,
+        month_from=_month(month_from, "month_from"),
+        month_to=_month(month_to, "month_to"),
+        category=category,
+        merchant=merchant,
+        currency=currency,
+        source=source,
+    )
+    return ExpenseSummaryResponse(group_by=group_by, month_from=month_from, month_to=month_to, rows=rows)
@@ -1,24 +1,63 @@
 from __future__ import annotations
 
-import json
-from pathlib import Path as SysPath
+import tarfile
+import zipfile
+from typing import Any
 
-from fastapi import APIRouter, Depends, File, HTTPException, Path, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, File, HTTPException, Path, Query, Request, UploadFile
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.orm import Session
 
+from app.api.http_cache import accepts_gzip, conditional_file_response, file_etag, is_not_modified
 from app.core.config import settings
 from app.db import get_db
-from app.schemas.document import DocumentRead
+from app.ocr.artifact import OCR_ARTIFACT_FILENAME, OcrArtifact
+from app.ocr.cache import get_ocr_cache
+from app.schemas.document import (
+    BulkUploadRejected,
+    DocumentBulkUploadResponse,
+    DocumentRead,
+    OcrCacheStats,
+)
 from app.schemas.extraction import DocumentExtractionResponse
-from app.services.documents import create_document, get_document, process_document_ocr
+from app.schemas.job import OcrBatchItem, OcrBatchRequest, OcrBatchResponse, OcrJobRead
+from app.services.documents import (
+    OCR_JSON_GZ_FILENAME,
+    create_document,
+    create_documents,
+    find_original_by_sha256,
+    get_document,
+    list_document_ids_by_status,
+)
 from app.services.expenses import create_expense
-from app.services.extraction import extract_fields_for_document
-from app.storage import is_allowed_mime, save_uploaded_document
+from app.services.extraction import extract_fields_for_document, resolve_ocr_json_path
+from app.services.ocr_jobs import ocr_job_queue
+from app.storage import (
+    DuplicateLookup,
+    UploadTooLarge,
+    discard_saved_document,
+    is_allowed_mime,
+    iter_upload_members,
+    save_document_stream,
+    save_uploaded_document,
+)
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 db_dep = Depends(get_db)
 
+def _duplicate_lookup(db: Session, batch: dict[str, tuple[str, str]] | None = None) -> DuplicateLookup:
+    """
+    Lookup sha256 -> documento originale, per la dedup in fase di upload.
+    `batch` contiene gli originali dello stesso bulk upload, non ancora a DB.
+    """
+    def lookup(sha256: str) -> tuple[str, str] | None:
+        if batch is not None and sha256 in batch:
+            return batch[sha256]
+        original = find_original_by_sha256(db, sha256)
+        return (original.id, original.storage_path) if original is not None else None
+
+    return lookup
+
 @router.post("/upload", response_model=DocumentRead)
 def upload_document(file: UploadFile = File(...), db: Session = db_dep) -> DocumentRead:
     mime_type = file.content_type or ""
@@ -28,7 +67,11 @@ def upload_document(file: UploadFile = File(...), db: Session = db_dep) -> Docum
             detail=f"Unsupported media type: {mime_type}. Allowed: images/*, application/pdf",
         )
 
-    saved = save_uploaded_document(base_dir=settings.storage_path, upload=file)
+    saved = save_uploaded_document(
+        base_dir=settings.storage_path,
+        upload=file,
+        find_duplicate=_duplicate_lookup(db) if settings.upload_dedup else None,
+    )
 
     doc = create_document(
         db,
@@ -38,10 +81,155 @@ def upload_document(file: UploadFile = File(...), db: Session = db_dep) -> Docum
         storage_path=saved["stored_relative_path"],
         sha256=saved["sha256"],
         size_bytes=saved["size_bytes"],
+        duplicate_of=saved["duplicate_of"],
     )
 
     return DocumentRead(**saved, status=doc.status)
 
+
+@router.post("/upload:bulk", response_model=DocumentBulkUploadResponse)
+def upload_documents_bulk(
+    files: list[UploadFile] = File(...),
+    enqueue_ocr: bool = Query(False, description="Mette subito in coda l'OCR dei documenti creati"),
+    db: Session = db_dep,
+) -> DocumentBulkUploadResponse:
+    """
+    Upload di più file in una richiesta: file singoli e/o archivi zip/tar (i membri vengono
+    salvati uno per uno a chunk). I documenti sono inseriti con una sola transazione; i file
+    con tipo non ammesso finiscono in `rejected` senza far fallire il resto.
+    """
+    base_dir = settings.storage_path
+    batch_originals: dict[str, tuple[str, str]] = {}
+    find_duplicate = _duplicate_lookup(db, batch_originals) if settings.upload_dedup else None
+
+    saved_items: list[dict[str, Any]] = []
+    rejected: list[BulkUploadRejected] = []
+    seen = 0
+    written = 0
+    max_file_bytes = settings.bulk_upload_max_file_bytes
+    too_much_data = HTTPException(
+        status_code=413, detail=f"Too much data: max {settings.bulk_upload_max_bytes} bytes per request"
+    )
+    try:
+        for upload in files:
+            try:
+                for filename, mime_type, size, stream in iter_upload_members(upload):
+                    seen += 1
+                    if seen > settings.bulk_upload_max_files:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"Too many files: max {settings.bulk_upload_max_files} per request",
+                        )
+                    if not is_allowed_mime(mime_type):
+                        rejected.append(
+                            BulkUploadRejected(filename=filename, reason=f"Unsupported media type: {mime_type}")
+                        )
+                        continue
+                    # Dimensione dichiarata (header dell'archivio): scarto senza leggere nulla
+                    if size is not None and size > max_file_bytes:
+                        rejected.append(
+                            BulkUploadRejected(filename=filename, reason=str(UploadTooLarge(max_file_bytes)))
+                        )
+                        continue
+                    remaining = settings.bulk_upload_max_bytes - written
+                    if size is not None and size > remaining:
+                        raise too_much_data
+
+                    # Limiti applicati anche in lettura: la dimensione dichiarata può mentire
+                    try:
+                        saved = save_document_stream(
+                            base_dir=base_dir,
+                            stream=stream,
+                            filename=filename,
+                            mime_type=mime_type,
+                            find_duplicate=find_duplicate,
+                            max_bytes=min(max_file_bytes, remaining),
+                        )
+                    except UploadTooLarge as exc:
+                        if remaining < max_file_bytes:
+                            raise too_much_data from exc
+                        rejected.append(BulkUploadRejected(filename=filename, reason=str(exc)))
+                        continue
+                    written += saved["size_bytes"]
+                    saved_items.append(saved)
+                    if not saved["is_duplicate"]:
+                        batch_originals.setdefault(
+                            saved["sha256"], (saved["document_id"], saved["stored_relative_path"])
+                        )
+            except (zipfile.BadZipFile, tarfile.TarError) as exc:
+                rejected.append(
+                    BulkUploadRejected(filename=upload.filename or "uploaded_file", reason=f"Invalid archive: {exc}")
+                )
+            finally:
+                upload.file.close()
+
+        docs = create_documents(
+            db,
+            [
+                {
+                    "document_id": saved["document_id"],
+                    "original_filename": saved["original_filename"],
+                    "mime_type": saved["mime_type"],
+                    "storage_path": saved["stored_relative_path"],
+                    "sha256": saved["sha256"],
+                    "size_bytes": saved["size_bytes"],
+                    "duplicate_of": saved["duplicate_of"],
+                }
+                for saved in saved_items
+            ],
+        )
+    except Exception:
+        # Niente documenti orfani su disco se la richiesta fallisce
+        db.rollback()
+        for saved in saved_items:
+            discard_saved_document(base_dir, saved["document_id"])
+        raise
+
+    jobs = []
+    if enqueue_ocr and docs:
+        by_document = ocr_job_queue.enqueue_many(db, [doc.id for doc in docs])
+        jobs = [OcrJobRead.model_validate(by_document[doc.id]) for doc in docs if doc.id in by_document]
+
+    return DocumentBulkUploadResponse(
+        documents=[
+            DocumentRead(**saved, status=doc.status) for saved, doc in zip(saved_items, docs, strict=True)
+        ],
+        rejected=rejected,
+        jobs=jobs,
+    )
+
+@router.post("/process-ocr:batch", response_model=OcrBatchResponse, status_code=202)
+def process_ocr_batch(payload: OcrBatchRequest, db: Session = db_dep) -> OcrBatchResponse:
+    """
+    Mette in coda l'OCR di più documenti (lista di id o filtro per status) sul pool di worker
+    condiviso. Ritorna un job per documento; gli id inesistenti hanno status "not_found".
+    """
+    if payload.document_ids is not None:
+        document_ids = list(dict.fromkeys(payload.document_ids))
+    else:
+        document_ids = list_document_ids_by_status(db, payload.status or "", limit=payload.limit)
+
+    jobs = ocr_job_queue.enqueue_many(db, document_ids)
+
+    items = []
+    for document_id in document_ids:
+        job = jobs.get(document_id)
+        if job is None:
+            items.append(OcrBatchItem(document_id=document_id, status="not_found"))
+        else:
+            items.append(OcrBatchItem(document_id=document_id, job_id=job.job_id, status=job.status))
+
+    return OcrBatchResponse(items=items, queued=len(jobs))
+
+
+@router.get("/ocr-cache/stats", response_model=OcrCacheStats)
+def ocr_cache_stats() -> OcrCacheStats:
+    """Hit/miss della cache OCR (content-addressed su sha256 + config OCR)."""
+    cache = get_ocr_cache()
+    if cache is None:
+        return OcrCacheStats(enabled=False)
+    return OcrCacheStats(enabled=True, **cache.stats())
+
 @router.get("/{document_id}", response_model=DocumentRead)
 def read_document(
     document_id: str = Path(..., min_length=36, max_length=36),
@@ -59,6 +247,8 @@ def read_document(
         sha256=doc.sha256,
         stored_relative_path=doc.storage_path,
         created_at=doc.created_at.isoformat(),
+        is_duplicate=doc.duplicate_of is not None,
+        duplicate_of=doc.duplicate_of,
         status=doc.status,
         ocr_text_plain=doc.ocr_text_plain,
         ocr_json_path=doc.ocr_json_path,
@@ -66,34 +256,28 @@ def read_document(
     )
 
 
-@router.post("/{document_id}/process-ocr", response_model=DocumentRead)
+@router.post("/{document_id}/process-ocr", response_model=OcrJobRead, status_code=202)
 def process_ocr(
     document_id: str = Path(..., min_length=36, max_length=36),
     db: Session = db_dep,
-) -> DocumentRead:
-    doc = process_document_ocr(db, document_id)
-    if doc is None:
+) -> OcrJobRead:
+    """Mette in coda l'OCR: lo stato si legge da GET /jobs/{job_id} o GET /documents/{id}."""
+    job = ocr_job_queue.enqueue(db, document_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    return DocumentRead(
-        document_id=doc.id,
-        original_filename=doc.original_filename,
-        mime_type=doc.mime_type,
-        size_bytes=doc.size_bytes,
-        sha256=doc.sha256,
-        stored_relative_path=doc.storage_path,
-        created_at=doc.created_at.isoformat(),
-        status=doc.status,
-        ocr_text_plain=doc.ocr_text_plain,
-        ocr_json_path=doc.ocr_json_path,
-        error_message=doc.error_message,
-    )
+    return OcrJobRead.model_validate(job)
 
 @router.get("/{document_id}/ocr-json")
 def get_ocr_json(
+    request: Request,
     document_id: str = Path(..., min_length=36, max_length=36),
     db: Session = db_dep,
-) -> JSONResponse:
+) -> Response:
+    """
+    JSON OCR del documento, inviato in streaming così come è salvato (o la variante gzip
+    precompressa se il client la accetta). ETag/Last-Modified dal file: 304 sulle richieste condizionali.
+    """
     doc = get_document(db, document_id)
     if doc is None:
         raise HTTPException(status_code=404, detail="Document not found")
@@ -104,19 +288,27 @@ def get_ocr_json(
             detail="OCR not available for this document (status is not processed)",
         )
 
-    p = SysPath(doc.ocr_json_path)
-
     # Compatibilità: vecchi record salvavano "data\\documents\\..."
-    if str(p).lower().startswith("data\\") or str(p).lower().startswith("data/"):
-        abs_json = settings.storage_path.parent / p
-    else:
-        abs_json = settings.storage_path / p
-        
-    if not abs_json.exists():
-        raise HTTPException(status_code=404, detail="OCR JSON file not found on disk")
+    abs_json = resolve_ocr_json_path(doc.ocr_json_path)
+
+    if abs_json.exists():
+        abs_gz = abs_json.with_name(OCR_JSON_GZ_FILENAME)
+        if accepts_gzip(request) and abs_gz.exists():
+            return conditional_file_response(
+                request, abs_gz, media_type="application/json", content_encoding="gzip", vary="Accept-Encoding"
+            )
+        return conditional_file_response(request, abs_json, media_type="application/json", vary="Accept-Encoding")
+
+    # Solo artefatto colonnare su disco: la vista JSON è ricostruita da lì
+    abs_artifact = abs_json.with_name(OCR_ARTIFACT_FILENAME)
+    if abs_artifact.exists():
+        stat = abs_artifact.stat()
+        headers = {"ETag": file_etag(stat, variant="json"), "Cache-Control": "no-cache"}
+        if is_not_modified(request, etag=headers["ETag"], stat=stat):
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(content=OcrArtifact.open(abs_artifact).to_json(), headers=headers)
 
-    payload = json.loads(abs_json.read_text(encoding="utf-8"))
-    return JSONResponse(content=payload)
+    raise HTTPException(status_code=404, detail="OCR JSON file not found on disk")
 
 
 @router.post("/{document_id}/extract-fields", response_model=DocumentExtractionResponse)
@@ -2,15 +2,27 @@ from __future__ import annotations
 
 from datetime import date
 from decimal import Decimal
+from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Path, Query, Response
+from fastapi import APIRouter, Depends, File, HTTPException, Path, Query, Response, UploadFile
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.db import get_db
-from app.schemas.expense import ExpenseCreate, ExpenseListResponse, ExpenseRead, ExpenseUpdate
+from app.schemas.expense import (
+    CountStrategy,
+    ExpenseCreate,
+    ExpenseImportResponse,
+    ExpenseListResponse,
+    ExpenseRead,
+    ExpenseUpdate,
+)
+from app.services.expense_import import ImportFormat, import_expenses, infer_format
 from app.services.expenses import (
     create_expense,
+    decode_cursor,
     delete_expense,
+    encode_cursor,
     get_expense,
     list_expenses,
     update_expense,
@@ -18,8 +30,6 @@ from app.services.expenses import (
 
 router = APIRouter(prefix="/expenses", tags=["expenses"])
 db_dep = Depends(get_db)
-db_query = Query(default=None)
-db_query_ge0 = Query(default=None, ge=0)
 
 
 @router.post("", response_model=ExpenseRead, status_code=201)
@@ -28,22 +38,55 @@ def create_expense_endpoint(payload: ExpenseCreate, db: Session = db_dep) -> Exp
     return create_expense(db, payload)
 
 
+@router.post("/import", response_model=ExpenseImportResponse)
+def import_expenses_endpoint(
+    file: Annotated[UploadFile, File(description="CSV con header o NDJSON (un oggetto per riga)")],
+    format: Annotated[ImportFormat | None, Query(description="default: dall'estensione del file")] = None,
+    db: Session = db_dep,
+) -> ExpenseImportResponse:
+    """Import massivo di spese: righe valide inserite a blocchi, errori per riga nella risposta."""
+    fmt = format or infer_format(file.filename, file.content_type)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Unknown import format: use .csv/.ndjson or ?format=")
+    # UploadFile è già su file temporaneo oltre 1 MB: la lettura è in streaming
+    result = import_expenses(db, file.file, fmt, chunk_size=settings.expenses_import_chunk_size)
+    return ExpenseImportResponse(
+        rows=result.rows,
+        inserted=result.inserted,
+        failed=result.failed,
+        errors=[{"line": e.line, "message": e.message} for e in result.errors],
+        errors_truncated=result.errors_truncated,
+    )
+
+
 @router.get("", response_model=ExpenseListResponse)
 def list_expenses_endpoint(
     db: Session = db_dep,
-    date_from: date | None = db_query,
-    date_to: date | None = db_query,
-    merchant: str | None = db_query,
-    category: str | None = db_query,
-    source: str | None = db_query,
-    needs_review: bool | None = db_query,
-    min_amount: Decimal | None = db_query_ge0,
-    max_amount: Decimal | None = db_query_ge0,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    merchant: str | None = None,
+    category: str | None = None,
+    source: str | None = None,
+    needs_review: bool | None = None,
+    min_amount: Annotated[Decimal | None, Query(ge=0)] = None,
+    max_amount: Annotated[Decimal | None, Query(ge=0)] = None,
     limit: int = Query(default=50, ge=1, le=200),
     offset: int = Query(default=0, ge=0),
+    after: str | None = Query(default=None, description="next_cursor della pagina precedente"),
+    count: Annotated[
+        CountStrategy | None, Query(description="strategia del total (default da config)")
+    ] = None,
 ) -> ExpenseListResponse:
-    """Lista spese con filtri base + paginazione."""
-    items, total = list_expenses(
+    """Lista spese con filtri base + paginazione (offset, oppure cursore con `after`)."""
+    seek = None
+    if after is not None:
+        if offset:
+            raise HTTPException(status_code=400, detail="Use either 'after' or 'offset', not both")
+        try:
+            seek = decode_cursor(after)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor") from None
+    items, total, count_strategy = list_expenses(
         db,
         date_from=date_from,
         date_to=date_to,
@@ -55,8 +98,19 @@ def list_expenses_endpoint(
         max_amount=max_amount,
         limit=limit,
         offset=offset,
+        after=seek,
+        count=count or settings.expenses_count_default,
+    )
+    # Pagina piena: potrebbe essercene un'altra (al più una pagina vuota in coda)
+    next_cursor = encode_cursor(items[-1]) if len(items) == limit else None
+    return ExpenseListResponse(
+        items=items,
+        total=total,
+        limit=limit,
+        offset=offset,
+        next_cursor=next_cursor,
+        count_strategy=count_strategy,
     )
-    return ExpenseListResponse(items=items, total=total, limit=limit, offset=offset)
 
 
 @router.get("/{expense_id}", response_model=ExpenseRead)
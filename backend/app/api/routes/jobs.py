@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, HTTPException, Path
+
+from app.schemas.job import OcrJobRead
+from app.services.ocr_jobs import ocr_job_queue
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+@router.get("/{job_id}", response_model=OcrJobRead)
+def read_job(job_id: str = Path(..., min_length=36, max_length=36)) -> OcrJobRead:
+    """Stato di un job OCR (polling lato client)."""
+    job = ocr_job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return OcrJobRead.model_validate(job)
@@ -0,0 +1 @@
+"""Comandi da riga di comando (da backend/: python -m app.cli.<comando>)."""
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import time
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.extraction.registry import get_extractor
+from app.extraction.rule_v0 import load_ocr_pages
+from app.models.document import Document
+from app.models.document_extraction import DocumentExtraction
+from app.services.extraction import (
+    load_ocr_source,
+    primary_extraction_version,
+    resolve_ocr_json_path,
+    run_extractor,
+)
+
+"""
+Estrazione su tutto il corpus: rilancia un estrattore del registry (default: il primario) su ogni
+documento processato (es. dopo una modifica alle regole) e salva i risultati in document_extractions.
+
+- i documenti vengono letti dal DB a blocchi (keyset su id), senza caricarli tutti in memoria
+- lettura JSON + regole girano in un pool di processi
+- i risultati di ogni blocco sono inseriti con un solo INSERT multi-riga
+- senza --force si saltano i documenti con un risultato aggiornato (stessi fingerprint OCR ed estrattore);
+  quelli obsoleti vengono ricalcolati
+
+Uso (da backend/):  python -m app.cli.extract_all [--version V] [--workers N] [--batch-size N] [--force]
+"""
+
+logger = logging.getLogger(__name__)
+
+# (versione estrattore, document_id, path assoluto del JSON OCR)
+Task = tuple[str, str, str]
+# risultato pronto da salvare: (document_id, payload_json, secondi extract)
+Result = tuple[str, str, float]
+
+
+@dataclass
+class ExtractionRunStats:
+    documents: int = 0
+    skipped: int = 0
+    failed: int = 0
+    wall_s: float = 0.0
+    # tempo per fase; load/extract sono sommati sui worker (tempo dei processi, non wall)
+    stages_s: dict[str, float] = field(
+        default_factory=lambda: {"query": 0.0, "load": 0.0, "extract": 0.0, "store": 0.0}
+    )
+
+    @property
+    def docs_per_sec(self) -> float:
+        return self.documents / self.wall_s if self.wall_s > 0 else 0.0
+
+    def report(self) -> str:
+        stages = " ".join(f"{k}={v:.2f}s" for k, v in self.stages_s.items())
+        return (
+            f"documents={self.documents} skipped={self.skipped} failed={self.failed} "
+            f"wall={self.wall_s:.2f}s docs/sec={self.docs_per_sec:.1f}\n"
+            f"stages: {stages}"
+        )
+
+
+def _extract_one(task: Task) -> tuple[str, str | None, float, float]:
+    """
+    Worker: (document_id, payload_json o None se fallisce, secondi load, secondi extract).
+    Qualsiasi errore (JSON mancante, malformato o di un formato vecchio) fa fallire solo il documento:
+    un'eccezione rilanciata da pool.map interromperebbe l'intero corpus.
+    """
+    version, document_id, json_path = task
+    t0 = time.perf_counter()
+    try:
+        pages = load_ocr_pages(load_ocr_source(Path(json_path)))
+    except Exception:
+        logger.warning("extract_all: cannot load OCR document=%s path=%s", document_id, json_path, exc_info=True)
+        return document_id, None, time.perf_counter() - t0, 0.0
+    t1 = time.perf_counter()
+    try:
+        res, _latency_ms = run_extractor(get_extractor(version), document_id, pages)
+    except Exception:
+        logger.warning("extract_all: extraction failed version=%s document=%s", version, document_id, exc_info=True)
+        return document_id, None, t1 - t0, time.perf_counter() - t1
+    return document_id, res.model_dump_json(), t1 - t0, time.perf_counter() - t1
+
+
+def _iter_task_batches(
+    db: Session, *, version: str, batch_size: int, force: bool, stats: ExtractionRunStats
+) -> Iterator[tuple[list[Task], dict[str, str]]]:
+    """
+    Documenti processati a blocchi di `batch_size`, in ordine di id (keyset, niente OFFSET).
+    Per ogni blocco: task da eseguire e document_id -> fingerprint OCR del documento.
+    """
+    extractor_fingerprint = get_extractor(version).fingerprint
+    last_id = ""
+    while True:
+        t0 = time.perf_counter()
+        stmt = (
+            select(Document.id, Document.ocr_json_path, Document.ocr_fingerprint)
+            .where(
+                Document.status == "processed",
+                Document.ocr_json_path.is_not(None),
+                Document.id > last_id,
+            )
+            .order_by(Document.id)
+            .limit(batch_size)
+        )
+        rows = db.execute(stmt).all()
+        if not rows:
+            stats.stages_s["query"] += time.perf_counter() - t0
+            return
+        last_id = rows[-1].id
+
+        ocr_fingerprints = {r.id: r.ocr_fingerprint for r in rows}
+        done: set[str] = set()
+        if not force:
+            # già estratti e aggiornati: stesso estrattore e stesso OCR del documento
+            current = db.execute(
+                select(DocumentExtraction.document_id, DocumentExtraction.ocr_fingerprint).where(
+                    DocumentExtraction.document_id.in_(list(ocr_fingerprints)),
+                    DocumentExtraction.extraction_version == version,
+                    DocumentExtraction.extractor_fingerprint == extractor_fingerprint,
+                )
+            ).all()
+            done = {d for d, fp in current if fp == ocr_fingerprints[d]}
+        stats.stages_s["query"] += time.perf_counter() - t0
+        stats.skipped += len(done)
+
+        tasks = [
+            (version, r.id, str(resolve_ocr_json_path(r.ocr_json_path))) for r in rows if r.id not in done
+        ]
+        if tasks:
+            yield tasks, ocr_fingerprints
+
+
+def _store_batch(
+    db: Session, results: list[Result], *, version: str, ocr_fingerprints: dict[str, str]
+) -> None:
+    # Le righe esistenti del blocco sono obsolete (o --force): sostituite
+    ids = [document_id for document_id, _, _ in results]
+    db.execute(
+        delete(DocumentExtraction).where(
+            DocumentExtraction.document_id.in_(ids),
+            DocumentExtraction.extraction_version == version,
+        )
+    )
+    shadow = version != primary_extraction_version()
+    extractor_fingerprint = get_extractor(version).fingerprint
+    db.execute(
+        insert(DocumentExtraction),
+        [
+            {
+                "document_id": document_id,
+                "extraction_version": version,
+                "payload_json": payload,
+                "latency_ms": extract_s * 1000,
+                "shadow": shadow,
+                "ocr_fingerprint": ocr_fingerprints[document_id],
+                "extractor_fingerprint": extractor_fingerprint,
+            }
+            for document_id, payload, extract_s in results
+        ],
+    )
+    db.commit()
+
+
+def run_extract_all(
+    db: Session,
+    *,
+    version: str | None = None,
+    workers: int | None = None,
+    batch_size: int = 500,
+    force: bool = False,
+) -> ExtractionRunStats:
+    """
+    Estrae i campi di tutti i documenti processati. Senza `force` salta quelli che hanno già
+    un risultato aggiornato per la versione corrente; con `force` li ricalcola e li sostituisce.
+    workers=1 esegue tutto nel processo corrente (utile per debug e test).
+    """
+    version = get_extractor(version or primary_extraction_version()).version
+    workers = workers or os.cpu_count() or 1
+    stats = ExtractionRunStats()
+    started = time.perf_counter()
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for tasks, ocr_fingerprints in _iter_task_batches(
+            db, version=version, batch_size=batch_size, force=force, stats=stats
+        ):
+            if pool is not None:
+                chunksize = max(1, len(tasks) // (workers * 4))
+                outcomes = pool.map(_extract_one, tasks, chunksize=chunksize)
+            else:
+                outcomes = map(_extract_one, tasks)
+
+            results: list[Result] = []
+            for document_id, payload, load_s, extract_s in outcomes:
+                stats.stages_s["load"] += load_s
+                stats.stages_s["extract"] += extract_s
+                if payload is None:
+                    stats.failed += 1
+                    continue
+                results.append((document_id, payload, extract_s))
+
+            if results:
+                t0 = time.perf_counter()
+                _store_batch(db, results, version=version, ocr_fingerprints=ocr_fingerprints)
+                stats.stages_s["store"] += time.perf_counter() - t0
+                stats.documents += len(results)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    stats.wall_s = time.perf_counter() - started
+    return stats
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Estrazione campi su tutti i documenti processati")
+    parser.add_argument("--version", default=None, help="estrattore del registry (default: il primario)")
+    parser.add_argument("--workers", type=int, default=None, help="processi del pool (default: numero di CPU)")
+    parser.add_argument("--batch-size", type=int, default=500, help="documenti letti dal DB per blocco")
+    parser.add_argument("--force", action="store_true", help="ricalcola anche i documenti già estratti")
+    args = parser.parse_args(argv)
+
+    from app.db import SessionLocal
+
+    with SessionLocal() as db:
+        stats = run_extract_all(
+            db, version=args.version, workers=args.workers, batch_size=args.batch_size, force=args.force
+        )
+    print(stats.report())
+
+
+if __name__ == "__main__":
+    main()
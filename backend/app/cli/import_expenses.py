@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from app.core.config import settings
+from app.services.expense_import import import_expenses, infer_format
+
+"""
+Import massivo di spese da file CSV o NDJSON (stesso servizio di POST /expenses/import), letto in
+streaming a blocchi: adatto agli export bancari da decine di migliaia di righe.
+
+Uso (da backend/):  python -m app.cli.import_expenses spese.csv [--format csv|ndjson] [--chunk-size N]
+"""
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Import massivo di spese da CSV/NDJSON")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--format", choices=["csv", "ndjson"], default=None, help="default: dall'estensione")
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=settings.expenses_import_chunk_size,
+        help="righe per blocco (executemany + commit)",
+    )
+    parser.add_argument("--show-errors", type=int, default=20, help="errori da stampare")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or infer_format(args.path.name, None)
+    if fmt is None:
+        parser.error("cannot infer the format from the file name: use --format")
+
+    from app.db import SessionLocal
+
+    started = time.perf_counter()
+    with SessionLocal() as db, args.path.open("rb") as f:
+        result = import_expenses(db, f, fmt, chunk_size=args.chunk_size, max_errors=args.show_errors)
+    wall = time.perf_counter() - started
+    print(
+        f"rows={result.rows} inserted={result.inserted} failed={result.failed} "
+        f"wall={wall:.2f}s rows/sec={result.rows / wall if wall > 0 else 0:.0f}"
+    )
+    for error in result.errors:
+        print(f"  line {error.line}: {error.message}", file=sys.stderr)
+    if result.errors_truncated:
+        print(f"  ... {result.failed - len(result.errors)} more", file=sys.stderr)
+    return 1 if result.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import argparse
+import time
+
+from app.services.analytics import rebuild_rollups
+
+"""
+Ricalcola da zero i rollup delle spese (expense_rollups), es. dopo import diretti a DB che non
+passano dai servizi o per verificare che i rollup incrementali non abbiano derive.
+
+Uso (da backend/):  python -m app.cli.rebuild_rollups [--batch-size N]
+"""
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Ricostruisce i rollup delle spese da expenses")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="spese lette dal DB per blocco")
+    args = parser.parse_args(argv)
+
+    from app.db import SessionLocal
+
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        stats = rebuild_rollups(db, batch_size=args.batch_size)
+    print(f"expenses={stats.expenses} rollups={stats.rollups} wall={time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,10 +21,71 @@ class Settings(BaseSettings):
     sql_echo: bool = False
     # Directory base dove salviamo file e artefatti locali (upload, OCR json, ecc.)
     storage_dir: str = "data"
+    # Upload: dedup opt-in per sha256 (i duplicati diventano hardlink/riferimenti al file esistente)
+    upload_dedup: bool = False
+    # Bulk upload: numero massimo di file per richiesta (contando i membri degli archivi)
+    bulk_upload_max_files: int = 500
+    # Bulk upload: byte massimi per file (i più grandi finiscono in `rejected`) e byte totali scritti
+    # per richiesta (oltre: 413). Contano i byte decompressi dei membri degli archivi
+    bulk_upload_max_file_bytes: int = 50 * 1024 * 1024
+    bulk_upload_max_bytes: int = 1024 * 1024 * 1024
     # OCR: percorso opzionale a tesseract.exe (se non è nel PATH)
     tesseract_cmd: str | None = None
     # OCR: lingue tesseract (es: "eng" oppure "ita+eng" se installi i language pack)
     tesseract_lang: str = "eng"
+    # OCR: page segmentation mode di tesseract (6 = blocco di testo uniforme)
+    tesseract_psm: int = 6
+    # OCR: profilo di preprocessing ("fast" | "default" | "quality")
+    preprocess_profile: str = "default"
+    # OCR: backend "subprocess" (pytesseract, un processo per chiamata) oppure
+    # "tesserocr" (handle in-process riusati; richiede il pacchetto opzionale tesserocr)
+    ocr_backend: str = "subprocess"
+    # OCR tesserocr: numero massimo di handle nel pool (default: uno per job worker)
+    ocr_engine_pool_size: int | None = None
+    # OCR asincrono: numero di worker (thread) della coda job locale
+    ocr_job_workers: int = 2
+    # OCR PDF: processi per l'OCR parallelo delle pagine (1 = sequenziale, nessun pool)
+    ocr_page_workers: int = 1
+    # OCR PDF: pagine renderizzate "in volo" al massimo (limita la memoria sui PDF lunghi)
+    ocr_inflight_pages: int = 4
+    # OCR PDF: scala di rendering delle pagine (2.0 ~ 144 dpi)
+    ocr_pdf_render_scale: float = 2.0
+    # OCR: salva anche l'artefatto colonnare (ocr_result.ocrc) accanto al JSON, letto via mmap dall'estrazione
+    ocr_columnar_artifact: bool = True
+    # OCR: salva anche ocr_result.json.gz, servito così com'è da /ocr-json ai client che accettano gzip
+    ocr_json_gzip: bool = True
+    # OCR: cache dei risultati per sha256 del file + configurazione OCR (storage_dir/ocr_cache)
+    ocr_cache_enabled: bool = True
+    # OCR: dimensione massima della cache su disco (eviction LRU oltre questa soglia)
+    ocr_cache_max_bytes: int = 512 * 1024 * 1024
+
+    # Estrazione: versione primaria (risponde alle request) e versioni in shadow mode
+    # (girano in background sulle stesse pagine OCR; env: EXTRACTION_SHADOW='["rule_v1"]')
+    extraction_primary: str = "rule_v0"
+    extraction_shadow: list[str] = []
+    extraction_shadow_workers: int = 1
+
+    # Reconciler in background: rielabora documenti/estrazioni con fingerprint obsoleti
+    # (configurazione OCR o revisione dell'estrattore cambiate), al massimo reconcile_max_per_sec al secondo
+    reconcile_enabled: bool = False
+    reconcile_max_per_sec: float = 1.0
+    reconcile_batch_size: int = 100
+    # pausa tra un passaggio e il successivo (secondi)
+    reconcile_interval_s: float = 300.0
+    # se False ricalcola solo le estrazioni (niente nuovo OCR quando cambia la configurazione OCR)
+    reconcile_reocr: bool = True
+    # se True rielabora anche le righe di prima dei fingerprint (fingerprint ""): il primo passaggio
+    # rifà l'OCR di tutti i documenti esistenti
+    reconcile_legacy: bool = False
+    # nuovi OCR solo finché la coda ha meno di questi job attivi: il resto del backlog aspetta a DB
+    reconcile_max_pending_ocr: int = 4
+
+    # GET /expenses: strategia di default per il total ("exact" | "cached" | "estimated") e numero
+    # massimo di set di filtri tenuti nella cache dei count
+    expenses_count_default: str = "exact"
+    expenses_count_cache_size: int = 1024
+    # Import massivo (POST /expenses/import): righe per blocco (un executemany/COPY + commit per blocco)
+    expenses_import_chunk_size: int = 1000
 
     @property
     def storage_path(self) -> Path:
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import hashlib
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+from app.extraction.rule_v0 import RULE_V0_REVISION, OcrPage, extract_fields_from_pages
+
+"""
+Registro degli estrattori, per nome versionato (es. "rule_v0").
+
+Ogni estrattore riceve le pagine OCR già caricate (load_ocr_pages) e ritorna
+{"needs_review": bool, "fields": {...}} nello stesso formato di rule_v0.
+La versione primaria (settings.extraction_primary) risponde alle request; le versioni in
+settings.extraction_shadow girano in background sulle stesse pagine (vedi services/extraction).
+
+La revisione va incrementata a ogni modifica delle regole che cambia l'output: il fingerprint
+salvato con i risultati permette al reconciler (services/reconciler) di trovare quelli obsoleti.
+"""
+
+ExtractorFn = Callable[[list[OcrPage]], dict[str, Any]]
+
+
+@dataclass(frozen=True)
+class Extractor:
+    # chiave salvata in document_extractions.extraction_version
+    version: str
+    fn: ExtractorFn
+    revision: int = 1
+
+    @property
+    def fingerprint(self) -> str:
+        """Fingerprint di versione + revisione (document_extractions.extractor_fingerprint)."""
+        return hashlib.sha256(f"{self.version}:{self.revision}".encode()).hexdigest()[:16]
+
+    def __call__(self, pages: list[OcrPage]) -> dict[str, Any]:
+        return self.fn(pages)
+
+
+_EXTRACTORS: dict[str, Extractor] = {}
+
+
+def register_extractor(version: str, fn: ExtractorFn, *, revision: int = 1) -> Extractor:
+    """Registra (o sostituisce) un estrattore con questa versione."""
+    extractor = Extractor(version=version, fn=fn, revision=revision)
+    _EXTRACTORS[version] = extractor
+    return extractor
+
+
+def unregister_extractor(version: str) -> None:
+    _EXTRACTORS.pop(version, None)
+
+
+def get_extractor(version: str) -> Extractor:
+    extractor = _EXTRACTORS.get(version)
+    if extractor is None:
+        raise ValueError(f"Unknown extractor: {version}. Registered: {', '.join(extractor_versions())}")
+    return extractor
+
+
+def extractor_versions() -> list[str]:
+    return sorted(_EXTRACTORS)
+
+
+register_extractor("rule_v0", extract_fields_from_pages, revision=RULE_V0_REVISION)
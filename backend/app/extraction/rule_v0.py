@@ -1,10 +1,15 @@
 from __future__ import annotations
 
 import re
+from collections.abc import Iterator, Sequence
 from dataclasses import dataclass
 from datetime import date
 from decimal import Decimal, InvalidOperation
-from typing import Any
+from typing import Any, overload
+
+import numpy as np
+
+from app.ocr.artifact import OcrArtifact
 
 """
 Estrattore a regole: prende l'output OCR (che è un JSON con testo + bbox + confidence) 
@@ -18,6 +23,10 @@ Restituisce anche una confidence, una evidence (snippet di testo e, quando possi
 e una flag needs_review
 """
 
+# Revisione delle regole: da incrementare quando l'output cambia (2: evidence bbox dal layout righe)
+RULE_V0_REVISION = 2
+
+
 # --- Tipi interni -------------------------------------------------------------
 
 @dataclass
@@ -29,12 +38,124 @@ class OcrToken:
     line_key: str | None
 
 
+@dataclass
+class OcrLine:
+    # Una riga del layout calcolato in fase di OCR
+    key: tuple[int, int, int]  # (block, par, line)
+    text: str  # token della riga uniti da spazi (come in full_text)
+    bbox: list[int] | None
+    confidence: float
+    # token della riga: tokens[token_start:token_end] della pagina
+    token_start: int
+    token_end: int
+
+
 @dataclass
 class OcrPage:
     # Una pagina del PDF
     page_index: int
     full_text: str
-    tokens: list[OcrToken]
+    tokens: Sequence[OcrToken]
+    # Layout dall'OCR; None se assente (JSON vecchi, PDF testuali): si ripiega su full_text
+    lines: list[OcrLine] | None = None
+
+    def iter_lines(self) -> Iterator[tuple[str, OcrLine | None]]:
+        """Righe della pagina: (testo, riga del layout o None), senza ri-spezzare full_text se c'è il layout."""
+        if self.lines is not None:
+            for ln in self.lines:
+                yield ln.text, ln
+        else:
+            for text in self.full_text.splitlines():
+                yield text, None
+
+
+@dataclass
+class PageTokenIndex:
+    """
+    Indice dei token di una pagina, costruito una sola volta:
+    by_text: testo normalizzato (strip) -> (bbox unione, confidence max) di tutti i token con quel testo.
+    I token di una riga si leggono dal layout (OcrLine.token_start/token_end), senza indice.
+    """
+    by_text: dict[str, tuple[list[int] | None, float]]
+
+    @classmethod
+    def build(cls, tokens: Sequence[OcrToken]) -> PageTokenIndex:
+        if isinstance(tokens, ColumnarTokens):
+            return tokens.token_index()
+        by_text: dict[str, tuple[list[int] | None, float]] = {}
+        for tok in tokens:
+            key = tok.text.strip()
+            bbox, conf = by_text.get(key, (None, 0.0))
+            by_text[key] = (_union_bbox(bbox, tok.bbox), max(conf, tok.confidence))
+        return cls(by_text=by_text)
+
+    def lookup(self, text: str) -> tuple[list[int] | None, float]:
+        """(bbox, confidence OCR) dei token uguali a `text`; (None, 0.0) se non ce ne sono."""
+        return self.by_text.get(text, (None, 0.0))
+
+
+class ColumnarTokens(Sequence[OcrToken]):
+    """
+    Token di una pagina letti dall'artefatto colonnare (mmap): gli OcrToken vengono creati
+    solo se acceduti; l'indice per testo è calcolato direttamente sugli array.
+    """
+
+    def __init__(self, artifact: OcrArtifact, start: int, end: int) -> None:
+        self.artifact = artifact
+        self.start = start
+        self.end = end
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    @overload
+    def __getitem__(self, i: int) -> OcrToken: ...
+    @overload
+    def __getitem__(self, i: slice) -> list[OcrToken]: ...
+    def __getitem__(self, i: int | slice) -> OcrToken | list[OcrToken]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        art, t = self.artifact, self.start + i
+        conf = float(art.confidences[t])
+        return OcrToken(
+            text=art.string(int(art.text_ids[t])) or "",
+            confidence=0.0 if conf != conf else conf,  # NaN (confidence assente) -> 0.0
+            bbox=art.bboxes[t].tolist() if art.bbox_present[t] else None,
+            line_key=art.string(int(art.line_ids[t])),
+        )
+
+    def token_index(self) -> PageTokenIndex:
+        art, s, e = self.artifact, self.start, self.end
+        by_text: dict[str, tuple[list[int] | None, float]] = {}
+        if e == s:
+            return PageTokenIndex(by_text=by_text)
+
+        # Aggregazione per id di stringa (vettoriale), poi per testo normalizzato (pochi id)
+        uniq, inv = np.unique(art.text_ids[s:e], return_inverse=True)
+        n = len(uniq)
+        present = art.bbox_present[s:e].astype(bool)
+        boxes = art.bboxes[s:e][present].astype(np.int64)
+        lo = np.full((n, 2), np.iinfo(np.int64).max, dtype=np.int64)
+        hi = np.full((n, 2), np.iinfo(np.int64).min, dtype=np.int64)
+        np.minimum.at(lo, inv[present], boxes[:, :2])
+        np.maximum.at(hi, inv[present], boxes[:, 2:])
+        has_bbox = np.bincount(inv[present], minlength=n) > 0
+        conf = np.zeros(n, dtype=np.float64)
+        np.maximum.at(conf, inv, np.nan_to_num(art.confidences[s:e], nan=0.0))
+
+        for u, sid in enumerate(uniq.tolist()):
+            key = (art.string(sid) or "").strip()
+            bbox = [*lo[u].tolist(), *hi[u].tolist()] if has_bbox[u] else None
+            prev = by_text.get(key)
+            if prev is None:
+                by_text[key] = (bbox, float(conf[u]))
+            else:
+                by_text[key] = (_union_bbox(prev[0], bbox), max(prev[1], float(conf[u])))
+        return PageTokenIndex(by_text=by_text)
 
 
 def _clamp01(x: float) -> float:
@@ -63,7 +184,7 @@ def _normalize_currency(text: str) -> str | None:
 
 def _parse_date_candidate(s: str) -> date | None:
     # supporto base: dd-mm-yyyy, dd/mm/yyyy, yyyy-mm-dd
-    m = re.search(r"\b(\d{2})[/-](\d{2})[/-](\d{4})\b", s)
+    m = _DATE_DMY_RE.search(s)
     if m:
         dd, mm, yyyy = int(m.group(1)), int(m.group(2)), int(m.group(3))
         try:
@@ -71,7 +192,7 @@ def _parse_date_candidate(s: str) -> date | None:
         except ValueError:
             return None
 
-    m = re.search(r"\b(\d{4})[/-](\d{2})[/-](\d{2})\b", s)
+    m = _DATE_YMD_RE.search(s)
     if m:
         yyyy, mm, dd = int(m.group(1)), int(m.group(2)), int(m.group(3))
         try:
@@ -91,11 +212,68 @@ def _union_bbox(b1: list[int] | None, b2: list[int] | None) -> list[int] | None:
     return [min(b1[0], b2[0]), min(b1[1], b2[1]), max(b1[2], b2[2]), max(b1[3], b2[3])]
 
 
-def _load_ocr_pages(ocr_json: dict[str, Any]) -> list[OcrPage]:
+def _checked_lines(lines: list[OcrLine], full_text: str) -> list[OcrLine] | None:
+    # Il layout si usa solo se è coerente con full_text (stesso testo, stesse righe)
+    if "\n".join(ln.text for ln in lines) != full_text:
+        return None
+    return lines
+
+
+def _artifact_lines(art: OcrArtifact, page: int) -> list[OcrLine] | None:
+    if not art.has_layout(page):
+        return None
+    start, _end = art.page_token_range(page)
+    layout = art.page_lines(page)
+    lines: list[OcrLine] = []
+    for key, bbox, conf, (t0, t1) in zip(
+        layout["key"].tolist(), layout["bbox"].tolist(),
+        layout["confidence"].tolist(), layout["tokens"].tolist(), strict=True,
+    ):
+        text_ids = art.text_ids[start + t0 : start + t1].tolist()
+        text = " ".join(art.string(sid) or "" for sid in text_ids)
+        lines.append(OcrLine(tuple(key), text, bbox, conf, t0, t1))
+    return _checked_lines(lines, art.page_full_text(page))
+
+
+def _json_lines(layout: dict[str, Any] | None, tokens: list[OcrToken], full_text: str) -> list[OcrLine] | None:
+    if not layout:
+        return None
+    lines: list[OcrLine] = []
+    for ln in layout.get("lines") or []:
+        t0, t1 = ln["tokens"]
+        text = " ".join(tok.text for tok in tokens[t0:t1])
+        lines.append(OcrLine(tuple(ln["key"]), text, ln.get("bbox"), float(ln.get("confidence") or 0.0), t0, t1))
+    return _checked_lines(lines, full_text)
+
+
+def _line_token_bbox(pg: OcrPage, line: OcrLine | None, text: str) -> list[int] | None:
+    # bbox unione dei token della riga uguali a `text` (None senza layout o se non ce ne sono)
+    if line is None:
+        return None
+    bbox: list[int] | None = None
+    for tok in pg.tokens[line.token_start : line.token_end]:
+        if tok.text.strip() == text:
+            bbox = _union_bbox(bbox, tok.bbox)
+    return bbox
+
+
+def load_ocr_pages(ocr_json: dict[str, Any] | OcrArtifact) -> list[OcrPage]:
     """
     Trasforma il JSON OCR, che è un dizionario complesso, in una 
-    lista di OcrPage con OcrToken.
+    lista di OcrPage con OcrToken (e le righe del layout, se l'OCR le ha salvate).
+    Con l'artefatto colonnare i token restano sugli array mappati (ColumnarTokens).
     """
+    if isinstance(ocr_json, OcrArtifact):
+        return [
+            OcrPage(
+                page_index=int(ocr_json.page_index[p]),
+                full_text=ocr_json.page_full_text(p),
+                tokens=ColumnarTokens(ocr_json, *ocr_json.page_token_range(p)),
+                lines=_artifact_lines(ocr_json, p),
+            )
+            for p in range(ocr_json.page_count)
+        ]
+
     pages_raw = ocr_json.get("pages") or []
     pages: list[OcrPage] = []
 
@@ -113,7 +291,8 @@ def _load_ocr_pages(ocr_json: dict[str, Any]) -> list[OcrPage]:
                     line_key=it.get("line_key"),
                 )
             )
-        pages.append(OcrPage(page_index=page_index, full_text=full_text, tokens=tokens))
+        lines = _json_lines(p.get("layout"), tokens, full_text)
+        pages.append(OcrPage(page_index=page_index, full_text=full_text, tokens=tokens, lines=lines))
 
     return pages
 
@@ -138,82 +317,89 @@ MERCHANT_STOP = {
     "FATTURA",
 }
 
+# Pattern compilati una volta sola, all'import
+_AMOUNT_RE = re.compile(r"\b(\d+[.,]\d{2})\b") # Numero "," o "." numero
+_TOTAL_KW_RE = re.compile("|".join(re.escape(k) for k in TOTAL_KEYWORDS))
+_DATE_DMY_RE = re.compile(r"\b(\d{2})[/-](\d{2})[/-](\d{4})\b")
+_DATE_YMD_RE = re.compile(r"\b(\d{4})[/-](\d{2})[/-](\d{2})\b")
+
+# Il merchant si cerca solo tra le prime righe non vuote della prima pagina
+MERCHANT_MAX_LINES = 10
 
-def extract_fields_rule_v0(ocr_json: dict[str, Any]) -> dict[str, dict[str, Any]]:
+
+def extract_fields_rule_v0(ocr_json: dict[str, Any] | OcrArtifact) -> dict[str, dict[str, Any]]:
     """
+    Input: payload di ocr_result.json oppure artefatto colonnare (app.ocr.artifact).
     Ritorna un dict "flat" con chiavi:
     - total, currency, date, merchant
     Ogni valore è un dict: {value, confidence, evidence{snippet,bbox,page_index}}
     """
-    pages = _load_ocr_pages(ocr_json) # Carica pagine e token
+    return extract_fields_from_pages(load_ocr_pages(ocr_json)) # Carica pagine e token
+
+
+def extract_fields_from_pages(pages: list[OcrPage]) -> dict[str, dict[str, Any]]:
+    """Come extract_fields_rule_v0, su pagine già caricate (condivisibili tra più estrattori)."""
 
-    # --- Merchant: prima riga "sensata" del testo della prima pagina
     merchant_val: str | None = None
     merchant_conf = 0.3
     merchant_evidence = None
 
-    if pages:
-        lines = [ln.strip() for ln in pages[0].full_text.splitlines() if ln.strip()]
-        for ln in lines[:10]: # Per cercare merchant che spesso sta all'inizio dello scontrino
-            up = ln.upper()
-            if up in MERCHANT_STOP:
-                continue
-            # evita righe troppo lunghe (di solito non sono merchant)
-            if 2 <= len(ln) <= 40:
-                merchant_val = ln
-                merchant_conf = 0.6
-                merchant_evidence = {"snippet": ln, "bbox": None, "page_index": pages[0].page_index}
-                break
-
-    # --- Currency: cerca EUR/€ ecc. nel testo aggregato
     currency_val: str | None = None
     currency_conf = 0.2
     currency_evidence = None
 
-    for pg in pages:
-        cur = _normalize_currency(pg.full_text)
-        if cur:
-            currency_val = cur
-            currency_conf = 0.7
-            currency_evidence = {"snippet": cur, "bbox": None, "page_index": pg.page_index}
-            break
-
-    # --- Date: prima data valida trovata nel testo (euristica v0)
     date_val: str | None = None
     date_conf = 0.2
     date_evidence = None
 
-    for pg in pages:
-        d = _parse_date_candidate(pg.full_text)
-        if d:
-            date_val = d.isoformat()
-            date_conf = 0.75
-            date_evidence = {"snippet": d.isoformat(), "bbox": None, "page_index": pg.page_index}
-            break
-
-    # --- Total: cerca righe con keyword + importo
     total_val: str | None = None
     total_conf = 0.2
     total_evidence = None
 
-    amount_re = re.compile(r"\b(\d+[.,]\d{2})\b") # Numero "," o "." numero
-
     best_score = -1.0
     best_amount: Decimal | None = None
     best_snippet = None
     best_bbox = None
     best_page = None
 
-    for pg in pages:
-        lines = pg.full_text.splitlines()
-        for ln in lines:
+    # Un solo passaggio su pagine e righe: tutti i campi vengono valutati insieme
+    for page_pos, pg in enumerate(pages):
+        # --- Currency: cerca EUR/€ ecc. nel testo della pagina (prima pagina che ne ha una)
+        if currency_val is None:
+            cur = _normalize_currency(pg.full_text)
+            if cur:
+                currency_val = cur
+                currency_conf = 0.7
+                currency_evidence = {"snippet": cur, "bbox": None, "page_index": pg.page_index}
+
+        # --- Date: prima data valida trovata nel testo (euristica v0)
+        if date_val is None:
+            d = _parse_date_candidate(pg.full_text)
+            if d:
+                date_val = d.isoformat()
+                date_conf = 0.75
+                date_evidence = {"snippet": d.isoformat(), "bbox": None, "page_index": pg.page_index}
+
+        index: PageTokenIndex | None = None  # costruito solo se la pagina ha importi
+        line_no = 0
+        for ln, layout_line in pg.iter_lines():
             ln_stripped = ln.strip()
             if not ln_stripped:
                 continue
             up = ln_stripped.upper()
 
-            has_kw = any(k in up for k in TOTAL_KEYWORDS)
-            m = amount_re.search(ln_stripped)
+            # --- Merchant: prima riga "sensata" della prima pagina (spesso è in testa allo scontrino)
+            if page_pos == 0 and merchant_val is None and line_no < MERCHANT_MAX_LINES:
+                # evita righe troppo lunghe (di solito non sono merchant)
+                if up not in MERCHANT_STOP and 2 <= len(ln_stripped) <= 40:
+                    merchant_val = ln_stripped
+                    merchant_conf = 0.6
+                    merchant_bbox = layout_line.bbox if layout_line is not None else None
+                    merchant_evidence = {"snippet": ln_stripped, "bbox": merchant_bbox, "page_index": pg.page_index}
+            line_no += 1
+
+            # --- Total: righe con keyword + importo
+            m = _AMOUNT_RE.search(ln_stripped)
             if not m:
                 continue
 
@@ -223,18 +409,15 @@ def extract_fields_rule_v0(ocr_json: dict[str, Any]) -> dict[str, dict[str, Any]
 
             # score semplice: keyword + importo grande (spesso totale è uno dei più grandi)
             score = 0.0
-            if has_kw:
+            if _TOTAL_KW_RE.search(up):
                 score += 1.0
             # importo: leggero bias verso importi più grandi (cap per non esplodere)
             score += min(float(amt), 999.0) / 999.0 * 0.2
 
-            # provo a trovare bbox del token importo nella pagina
-            bbox = None
-            ocr_conf = 0.0
-            for tok in pg.tokens:
-                if tok.text.strip() == m.group(1):
-                    bbox = _union_bbox(bbox, tok.bbox)
-                    ocr_conf = max(ocr_conf, tok.confidence)
+            # bbox e conf OCR del token importo, dall'indice della pagina
+            if index is None:
+                index = PageTokenIndex.build(pg.tokens)
+            bbox, ocr_conf = index.lookup(m.group(1))
 
             # integro conf OCR (se c'è)
             score += ocr_conf * 0.3
@@ -243,7 +426,8 @@ def extract_fields_rule_v0(ocr_json: dict[str, Any]) -> dict[str, dict[str, Any]
                 best_score = score
                 best_amount = amt
                 best_snippet = ln_stripped
-                best_bbox = bbox
+                # con il layout: bbox del token importo in questa riga (non di tutta la pagina)
+                best_bbox = _line_token_bbox(pg, layout_line, m.group(1)) or bbox
                 best_page = pg.page_index
 
     if best_amount is not None:
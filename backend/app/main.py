@@ -1,22 +1,71 @@
+import logging
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
+from app.api.routes.analytics import router as analytics_router
 from app.api.routes.documents import router as documents_router
 from app.api.routes.expenses import router as expenses_router
 from app.api.routes.health import router as health_router
+from app.api.routes.jobs import router as jobs_router
+from app.core.config import settings
+from app.db import engine, get_db
+from app.ocr.page_pool import shutdown_page_pools
+from app.services.extraction import shadow_runner
+from app.services.ocr_jobs import ocr_job_queue
+from app.services.reconciler import stale_reconciler
+
+logger = logging.getLogger(__name__)
+
+
+def _recover_ocr_jobs(app: FastAPI) -> None:
+    # I job OCR sono in memoria: i documenti rimasti queued/running dal processo precedente
+    # tornano in coda. Session dalla stessa dependency delle request (sovrascritta nei test)
+    sessions = app.dependency_overrides.get(get_db, get_db)()
+    try:
+        recovered = ocr_job_queue.recover(next(sessions))
+        if recovered:
+            logger.info("Recovered %s OCR jobs left queued/running", recovered)
+    except Exception:
+        # DB non raggiungibile all'avvio: l'API parte comunque, i documenti restano da riprendere
+        logger.exception("OCR job recovery failed")
+    finally:
+        sessions.close()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    _recover_ocr_jobs(app)
+    if settings.reconcile_enabled:
+        stale_reconciler.start(engine)
+    yield
+    stale_reconciler.stop(wait=True)
+    # Allo shutdown aspettiamo solo i job OCR in corso: quelli in coda vengono ripresi al prossimo
+    # avvio (il pool si ricrea al prossimo enqueue)
+    ocr_job_queue.shutdown(wait=True)
+    shutdown_page_pools()
+    shadow_runner.shutdown(wait=True)
 
 
 def create_app() -> FastAPI:
     """Crea e configura l'app FastAPI"""
-    app = FastAPI(title="Expense Manager AI", version="0.1.0")
+    app = FastAPI(title="Expense Manager AI", version="0.1.0", lifespan=lifespan)
 
     # Includo il router health
     app.include_router(health_router)
     
     # Router CRUD spese
     app.include_router(expenses_router)
+
+    # Analytics sulle spese (dai rollup mensili)
+    app.include_router(analytics_router)
     
     # Router per caricamento documenti
     app.include_router(documents_router)
+
+    # Stato dei job asincroni (OCR)
+    app.include_router(jobs_router)
     
     return app
 
@@ -1,5 +1,7 @@
 from .base import Base, TimestampMixin
 from .document import Document
+from .document_extraction import DocumentExtraction
 from .expense import Expense
+from .expense_rollup import ExpenseRollup
 
-__all__ = ["Base", "TimestampMixin", "Expense", "Document"]
+__all__ = ["Base", "TimestampMixin", "Expense", "ExpenseRollup", "Document", "DocumentExtraction"]
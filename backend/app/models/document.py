@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from sqlalchemy import BigInteger, String, Text
+from sqlalchemy import BigInteger, ForeignKey, Index, String, Text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.models.base import Base, TimestampMixin
@@ -8,6 +8,8 @@ from app.models.base import Base, TimestampMixin
 
 class Document(TimestampMixin, Base):
     __tablename__ = "documents"
+    # Reconciler: documenti processati con una configurazione OCR diversa da quella corrente
+    __table_args__ = (Index("ix_documents_status_ocr_fingerprint", "status", "ocr_fingerprint"),)
 
     # UUID come stringa (più semplice da gestire cross-db)
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
@@ -26,3 +28,10 @@ class Document(TimestampMixin, Base):
     ocr_text_plain: Mapped[str | None] = mapped_column(Text(), nullable=True)
     ocr_json_path: Mapped[str | None] = mapped_column(String(500), nullable=True)
     error_message: Mapped[str | None] = mapped_column(String(500), nullable=True)
+
+    # Dedup upload: id del documento originale con gli stessi byte (None se non è un duplicato)
+    duplicate_of: Mapped[str | None] = mapped_column(ForeignKey("documents.id"), nullable=True)
+
+    # Fingerprint della configurazione OCR (engine, backend, preprocessing, ...) con cui è stato processato;
+    # "" se non ancora processato o processato prima dei fingerprint (obsoleto per il reconciler)
+    ocr_fingerprint: Mapped[str] = mapped_column(String(16), nullable=False, default="", server_default="")
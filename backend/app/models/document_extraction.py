@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from sqlalchemy import ForeignKey, String, Text
+from sqlalchemy import Boolean, Float, ForeignKey, Index, String, Text, UniqueConstraint, false
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.models.base import Base, TimestampMixin
@@ -8,6 +8,16 @@ from app.models.base import Base, TimestampMixin
 
 class DocumentExtraction(TimestampMixin, Base):
     __tablename__ = "document_extractions"
+    # Un risultato per documento e versione dell'estrattore (cache dei risultati di estrazione)
+    __table_args__ = (
+        UniqueConstraint(
+            "document_id",
+            "extraction_version",
+            name="uq_document_extractions_document_id_extraction_version",
+        ),
+        # Reconciler: risultati prodotti da una revisione dell'estrattore diversa da quella corrente
+        Index("ix_document_extractions_version_fingerprint", "extraction_version", "extractor_fingerprint"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
 
@@ -18,3 +28,15 @@ class DocumentExtraction(TimestampMixin, Base):
 
     # JSON string (serializzato) con fields + needs_review
     payload_json: Mapped[str] = mapped_column(Text(), nullable=False)
+
+    # Tempo di esecuzione dell'estrattore (ms), senza il caricamento dell'OCR
+    latency_ms: Mapped[float | None] = mapped_column(Float(), nullable=True)
+
+    # True se prodotto in shadow mode (non servito alle request)
+    shadow: Mapped[bool] = mapped_column(Boolean(), nullable=False, default=False, server_default=false())
+
+    # Fingerprint degli input: configurazione OCR del documento ed estrattore (versione + revisione).
+    # "" per i risultati salvati prima dei fingerprint (obsoleti per il reconciler).
+    # Niente NULL: "" < qualsiasi fingerprint, così "!= corrente" resta un range sull'indice
+    ocr_fingerprint: Mapped[str] = mapped_column(String(16), nullable=False, default="", server_default="")
+    extractor_fingerprint: Mapped[str] = mapped_column(String(16), nullable=False, default="", server_default="")
@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import date
 from decimal import Decimal
 
-from sqlalchemy import Boolean, Date, Numeric, String, Text
+from sqlalchemy import DDL, Boolean, Date, Index, Numeric, String, Text, event
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.models.base import Base, TimestampMixin
@@ -18,6 +18,22 @@ class Expense(Base, TimestampMixin):
     """
 
     __tablename__ = "expenses"
+    # Indici sulle forme di query di list_expenses: filtro opzionale + ORDER BY expense_date desc, id desc.
+    # Con il filtro come prefisso e (expense_date, id) in coda la prima pagina si legge già ordinata.
+    __table_args__ = (
+        Index("ix_expenses_date_id", "expense_date", "id"),
+        Index("ix_expenses_category_date_id", "category", "expense_date", "id"),
+        Index("ix_expenses_source_date_id", "source", "expense_date", "id"),
+        Index("ix_expenses_review_date_id", "needs_review", "expense_date", "id"),
+        Index("ix_expenses_amount", "amount"),
+        # merchant ILIKE '%x%': trigrammi GIN su Postgres (pg_trgm); su SQLite diventa un b-tree semplice
+        Index(
+            "ix_expenses_merchant_trgm",
+            "merchant",
+            postgresql_using="gin",
+            postgresql_ops={"merchant": "gin_trgm_ops"},
+        ),
+    )
 
     # Identificativo univoco della riga
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
@@ -48,3 +64,11 @@ class Expense(Base, TimestampMixin):
 
     # Flag per revisione human-in-the-loop (bassa confidence, incongruenze, ecc.)
     needs_review: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+
+
+# L'indice a trigrammi richiede l'estensione pg_trgm anche quando la tabella è creata con create_all
+event.listen(
+    Expense.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import Date, Integer, Numeric, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+
+class ExpenseRollup(Base):
+    """
+    Aggregati mensili delle spese per (mese, categoria, merchant, valuta, source).
+
+    Mantenuti nella stessa transazione delle scritture su expenses (services/expenses.py), così le
+    query di analytics leggono solo questa tabella. Ricostruibili da zero con app.cli.rebuild_rollups.
+    """
+
+    __tablename__ = "expense_rollups"
+    # Grana del rollup: una riga per combinazione; l'indice unico serve anche ai filtri per mese
+    __table_args__ = (
+        UniqueConstraint("month", "category", "merchant", "currency", "source", name="uq_expense_rollups_grain"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+
+    # Primo giorno del mese di expense_date
+    month: Mapped[date] = mapped_column(Date, nullable=False)
+
+    # "" = non valorizzato in expenses (niente NULL: con NULL il vincolo unico non raggrupperebbe)
+    category: Mapped[str] = mapped_column(String(100), nullable=False, default="")
+    merchant: Mapped[str] = mapped_column(String(255), nullable=False, default="")
+
+    currency: Mapped[str] = mapped_column(String(3), nullable=False)
+    source: Mapped[str] = mapped_column(String(20), nullable=False)
+
+    total_amount: Mapped[Decimal] = mapped_column(Numeric(14, 2), nullable=False)
+    expense_count: Mapped[int] = mapped_column(Integer, nullable=False)
@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+"""
+Artefatto OCR colonnare (ocr_result.ocrc), salvato accanto a ocr_result.json.
+
+Stesso contenuto del JSON, ma per colonne invece che un dict per parola:
+- bbox (int32, N x 4) + maschera bbox presente, confidence (float64)
+- testo e line_key come id in una tabella di stringhe "internate" (ogni stringa salvata una volta)
+- offset dei token di ogni pagina
+- layout (se presente nel JSON): righe con chiave intera, bbox, confidence media e range di token;
+  blocchi con bbox, confidence e range di righe
+
+Layout file: MAGIC | lunghezza header (uint64 LE) | header JSON | array raw allineati a 64 byte.
+In lettura il file viene mappato in memoria (mmap): gli array sono viste sul file, senza parsing
+e senza creare oggetti per token. La vista JSON (to_json) ricostruisce lo stesso payload del JSON.
+"""
+
+OCR_ARTIFACT_FILENAME = "ocr_result.ocrc"
+
+MAGIC = b"OCRCOL1\n"
+_ALIGN = 64
+
+# Chiavi di ogni item nel JSON, nell'ordine in cui vengono scritte
+_ITEM_KEYS = ("text", "confidence", "bbox", "line_key")
+# Chiavi di pagina salvate come array (le altre finiscono in pages_meta, nell'header)
+_PAGE_ARRAY_KEYS = ("page_index", "full_text", "items", "layout")
+
+
+def _pad(n: int) -> int:
+    return (-n) % _ALIGN
+
+
+class _StringTable:
+    def __init__(self) -> None:
+        self.ids: dict[str, int] = {}
+        self.values: list[str] = []
+
+    def intern(self, value: str | None) -> int:
+        # -1 = None
+        if value is None:
+            return -1
+        sid = self.ids.get(value)
+        if sid is None:
+            sid = len(self.values)
+            self.ids[value] = sid
+            self.values.append(value)
+        return sid
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        encoded = [v.encode("utf-8") for v in self.values]
+        offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+        if encoded:
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return offsets, blob
+
+
+def build_ocr_artifact(ocr_json: dict[str, Any]) -> bytes:
+    """Serializza il payload di ocr_result.json nel formato colonnare."""
+    strings = _StringTable()
+    pages = ocr_json.get("pages") or []
+
+    page_index = np.zeros(len(pages), dtype="<i4")
+    page_text = np.zeros(len(pages), dtype="<i4")
+    page_offsets = np.zeros(len(pages) + 1, dtype="<i8")
+    pages_meta: list[dict[str, Any]] = []
+
+    n_tokens = sum(len(p.get("items") or []) for p in pages)
+    bboxes = np.zeros((n_tokens, 4), dtype="<i4")
+    bbox_present = np.zeros(n_tokens, dtype=np.uint8)
+    confidences = np.zeros(n_tokens, dtype="<f8")
+    text_ids = np.zeros(n_tokens, dtype="<i4")
+    line_ids = np.zeros(n_tokens, dtype="<i4")
+
+    layouts = [p.get("layout") for p in pages]
+    page_has_layout = np.array([lay is not None for lay in layouts], dtype=np.uint8)
+    all_lines = [ln for lay in layouts if lay is not None for ln in lay["lines"]]
+    all_blocks = [b for lay in layouts if lay is not None for b in lay["blocks"]]
+    page_line_offsets = np.zeros(len(pages) + 1, dtype="<i8")
+    page_block_offsets = np.zeros(len(pages) + 1, dtype="<i8")
+    line_keys = np.array([ln["key"] for ln in all_lines], dtype="<i4").reshape(-1, 3)
+    line_bboxes = np.array([ln["bbox"] for ln in all_lines], dtype="<i4").reshape(-1, 4)
+    line_conf = np.array([ln["confidence"] for ln in all_lines], dtype="<f8")
+    line_tokens = np.array([ln["tokens"] for ln in all_lines], dtype="<i8").reshape(-1, 2)
+    block_num = np.array([b["block"] for b in all_blocks], dtype="<i4")
+    block_bboxes = np.array([b["bbox"] for b in all_blocks], dtype="<i4").reshape(-1, 4)
+    block_conf = np.array([b["confidence"] for b in all_blocks], dtype="<f8")
+    block_lines = np.array([b["lines"] for b in all_blocks], dtype="<i8").reshape(-1, 2)
+
+    t = 0
+    for pi, p in enumerate(pages):
+        page_index[pi] = int(p.get("page_index", 1))
+        page_text[pi] = strings.intern(str(p.get("full_text") or ""))
+        pages_meta.append({k: v for k, v in p.items() if k not in _PAGE_ARRAY_KEYS})
+        lay = layouts[pi]
+        page_line_offsets[pi + 1] = page_line_offsets[pi] + (len(lay["lines"]) if lay else 0)
+        page_block_offsets[pi + 1] = page_block_offsets[pi] + (len(lay["blocks"]) if lay else 0)
+        for it in p.get("items") or []:
+            bbox = it.get("bbox")
+            if bbox is not None:
+                if len(bbox) != 4:
+                    raise ValueError(f"Unsupported bbox: {bbox!r}")
+                bboxes[t] = bbox
+                bbox_present[t] = 1
+            conf = it.get("confidence")
+            confidences[t] = np.nan if conf is None else float(conf)
+            text_ids[t] = strings.intern(str(it.get("text") or ""))
+            line_ids[t] = strings.intern(it.get("line_key"))
+            t += 1
+        page_offsets[pi + 1] = t
+
+    string_offsets, string_blob = strings.arrays()
+    arrays = {
+        "page_index": page_index,
+        "page_text": page_text,
+        "page_offsets": page_offsets,
+        "bboxes": bboxes,
+        "bbox_present": bbox_present,
+        "confidences": confidences,
+        "text_ids": text_ids,
+        "line_ids": line_ids,
+        "string_offsets": string_offsets,
+        "string_blob": string_blob,
+        "page_has_layout": page_has_layout,
+        "page_line_offsets": page_line_offsets,
+        "page_block_offsets": page_block_offsets,
+        "line_keys": line_keys,
+        "line_bboxes": line_bboxes,
+        "line_conf": line_conf,
+        "line_tokens": line_tokens,
+        "block_num": block_num,
+        "block_bboxes": block_bboxes,
+        "block_conf": block_conf,
+        "block_lines": block_lines,
+    }
+
+    # Offset relativi all'inizio della sezione dati
+    descriptors: dict[str, dict[str, Any]] = {}
+    offset = 0
+    for name, arr in arrays.items():
+        descriptors[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset += arr.nbytes + _pad(arr.nbytes)
+
+    header = json.dumps(
+        {
+            "version": 2,
+            "keys": list(ocr_json.keys()),
+            "meta": {k: v for k, v in ocr_json.items() if k != "pages"},
+            "pages_meta": pages_meta,
+            "arrays": descriptors,
+        },
+        ensure_ascii=False,
+    ).encode("utf-8")
+
+    prefix = MAGIC + struct.pack("<Q", len(header)) + header
+    chunks = [prefix, b"\0" * _pad(len(prefix))]
+    for arr in arrays.values():
+        chunks.append(np.ascontiguousarray(arr).tobytes())
+        chunks.append(b"\0" * _pad(arr.nbytes))
+    return b"".join(chunks)
+
+
+def write_ocr_artifact(path: Path, ocr_json: dict[str, Any]) -> None:
+    # Scrittura atomica (tmp + replace), come per ocr_result.json
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(build_ocr_artifact(ocr_json))
+    os.replace(tmp, path)
+
+
+class OcrArtifact:
+    """Artefatto colonnare aperto in sola lettura via mmap."""
+
+    def __init__(self, buffer: Any) -> None:
+        if bytes(buffer[: len(MAGIC)]) != MAGIC:
+            raise ValueError("Not an OCR columnar artifact")
+        (header_len,) = struct.unpack_from("<Q", buffer, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        header = json.loads(bytes(buffer[header_start : header_start + header_len]).decode("utf-8"))
+        data_start = header_start + header_len
+        data_start += _pad(data_start)
+
+        self._keys: list[str] = header["keys"]
+        self.meta: dict[str, Any] = header["meta"]
+        self.pages_meta: list[dict[str, Any]] = header["pages_meta"]
+
+        arrays: dict[str, np.ndarray] = {}
+        for name, d in header["arrays"].items():
+            dtype = np.dtype(d["dtype"])
+            count = int(np.prod(d["shape"])) if d["shape"] else 1
+            arr = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + d["offset"])
+            arrays[name] = arr.reshape(d["shape"])
+
+        self.page_index = arrays["page_index"]
+        self.page_text = arrays["page_text"]
+        self.page_offsets = arrays["page_offsets"]
+        self.bboxes = arrays["bboxes"]
+        self.bbox_present = arrays["bbox_present"]
+        self.confidences = arrays["confidences"]
+        self.text_ids = arrays["text_ids"]
+        self.line_ids = arrays["line_ids"]
+        self._string_offsets = arrays["string_offsets"]
+        self._string_blob = arrays["string_blob"]
+        self._strings: list[str | None] = [None] * (len(self._string_offsets) - 1)
+
+        # Layout (formato v2; assente negli artefatti v1)
+        self._layout = arrays if "page_has_layout" in arrays else None
+
+    @classmethod
+    def open(cls, path: Path) -> OcrArtifact:
+        with path.open("rb") as f:
+            # il mapping resta valido dopo la chiusura del file; viene rilasciato con l'oggetto
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer)
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_index)
+
+    def string(self, sid: int) -> str | None:
+        """Stringa della tabella (decodificata al primo accesso); None per id -1."""
+        if sid < 0:
+            return None
+        value = self._strings[sid]
+        if value is None:
+            start, end = int(self._string_offsets[sid]), int(self._string_offsets[sid + 1])
+            value = self._string_blob[start:end].tobytes().decode("utf-8")
+            self._strings[sid] = value
+        return value
+
+    def page_full_text(self, page: int) -> str:
+        return self.string(int(self.page_text[page])) or ""
+
+    def page_token_range(self, page: int) -> tuple[int, int]:
+        return int(self.page_offsets[page]), int(self.page_offsets[page + 1])
+
+    def has_layout(self, page: int) -> bool:
+        return self._layout is not None and bool(self._layout["page_has_layout"][page])
+
+    def page_lines(self, page: int) -> dict[str, np.ndarray]:
+        """Righe della pagina: key (N x 3), bbox (N x 4), confidence, tokens (N x 2, relativi alla pagina)."""
+        assert self._layout is not None
+        lo, hi = int(self._layout["page_line_offsets"][page]), int(self._layout["page_line_offsets"][page + 1])
+        return {
+            "key": self._layout["line_keys"][lo:hi],
+            "bbox": self._layout["line_bboxes"][lo:hi],
+            "confidence": self._layout["line_conf"][lo:hi],
+            "tokens": self._layout["line_tokens"][lo:hi],
+        }
+
+    def page_blocks(self, page: int) -> dict[str, np.ndarray]:
+        """Blocchi della pagina: block, bbox (N x 4), confidence, lines (N x 2, relativi alla pagina)."""
+        assert self._layout is not None
+        lo, hi = int(self._layout["page_block_offsets"][page]), int(self._layout["page_block_offsets"][page + 1])
+        return {
+            "block": self._layout["block_num"][lo:hi],
+            "bbox": self._layout["block_bboxes"][lo:hi],
+            "confidence": self._layout["block_conf"][lo:hi],
+            "lines": self._layout["block_lines"][lo:hi],
+        }
+
+    def _layout_json(self, page: int) -> dict[str, Any]:
+        lines, blocks = self.page_lines(page), self.page_blocks(page)
+        return {
+            "lines": [
+                {"key": k, "bbox": b, "confidence": c, "tokens": t}
+                for k, b, c, t in zip(
+                    lines["key"].tolist(), lines["bbox"].tolist(),
+                    lines["confidence"].tolist(), lines["tokens"].tolist(), strict=True,
+                )
+            ],
+            "blocks": [
+                {"block": n, "bbox": b, "confidence": c, "lines": ln}
+                for n, b, c, ln in zip(
+                    blocks["block"].tolist(), blocks["bbox"].tolist(),
+                    blocks["confidence"].tolist(), blocks["lines"].tolist(), strict=True,
+                )
+            ],
+        }
+
+    def to_json(self) -> dict[str, Any]:
+        """Vista JSON: lo stesso payload di ocr_result.json (per /ocr-json e compatibilità)."""
+        pages = []
+        for p in range(self.page_count):
+            start, end = self.page_token_range(p)
+            bboxes = self.bboxes[start:end].tolist()
+            present = self.bbox_present[start:end].tolist()
+            confs = self.confidences[start:end].tolist()
+            items = [
+                dict(
+                    zip(
+                        _ITEM_KEYS,
+                        (
+                            self.string(int(self.text_ids[t])),
+                            None if confs[i] != confs[i] else confs[i],  # NaN -> None
+                            bboxes[i] if present[i] else None,
+                            self.string(int(self.line_ids[t])),
+                        ),
+                        strict=True,
+                    )
+                )
+                for i, t in enumerate(range(start, end))
+            ]
+            page: dict[str, Any] = {
+                "page_index": int(self.page_index[p]),
+                "full_text": self.page_full_text(p),
+                "items": items,
+            }
+            if self.has_layout(p):
+                page["layout"] = self._layout_json(p)
+            pages.append({**page, **self.pages_meta[p]})
+
+        out: dict[str, Any] = {}
+        for key in self._keys:
+            out[key] = pages if key == "pages" else self.meta[key]
+        return out
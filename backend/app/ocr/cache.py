@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+from app.core.config import settings
+from app.ocr.preprocess import preprocess_version
+from app.ocr.tesseract_engine import OCR_RESULT_FORMAT
+
+"""
+Cache OCR content-addressed su disco.
+
+Chiave = sha256 del file + configurazione OCR (engine, backend, lingua, psm, versione/profilo preprocessing,
+scala di rendering PDF): stesso file + stessa configurazione => stesso ocr_result.json.
+
+Layout: <storage>/ocr_cache/<kk>/<key>/{ocr_result.json, ocr_text.txt}
+Eviction LRU con limite sulla dimensione totale delle entry:
+- dimensioni e ordine LRU sono tenuti in memoria (caricati una volta all'avvio dall'mtime delle entry,
+  poi aggiornati a ogni put/hit/eviction); l'mtime è aggiornato a ogni hit per i riavvii
+- le entry sono copie (non hardlink) dei file del documento: il limite conta byte della cache,
+  che l'eviction libera davvero. Un documento servito dalla cache condivide invece il file con la
+  entry (hardlink): dopo l'eviction quel file resta su disco con il documento
+- il conteggio è per processo: entry scritte da altri processi entrano nel conto al primo hit
+"""
+
+OCR_CACHE_DIRNAME = "ocr_cache"
+TEXT_FILENAME = "ocr_text.txt"
+
+
+def ocr_config() -> dict[str, Any]:
+    """Parametri che influenzano l'output OCR (se cambiano, cambia la chiave di cache)."""
+    return {
+        "engine": "tesseract",
+        "backend": settings.ocr_backend,
+        "lang": settings.tesseract_lang,
+        "psm": settings.tesseract_psm,
+        "preprocess": preprocess_version(),
+        "pdf_scale": settings.ocr_pdf_render_scale,
+        "format": OCR_RESULT_FORMAT,
+    }
+
+
+def ocr_config_fingerprint() -> str:
+    raw = json.dumps(ocr_config(), sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def ocr_cache_key(file_sha256: str) -> str:
+    return hashlib.sha256(f"{file_sha256}:{ocr_config_fingerprint()}".encode()).hexdigest()
+
+
+def link_or_copy(src: Path, dst: Path) -> None:
+    """
+    Pubblica `src` in `dst` con un hardlink (fallback: copia), in modo atomico.
+    Il file di destinazione viene sostituito, mai riscritto in place: gli altri link restano intatti.
+    """
+    tmp = dst.with_name(f".{dst.name}.{threading.get_ident()}.tmp")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+@dataclass
+class OcrCacheEntry:
+    key: str
+    path: Path
+
+    def file(self, name: str) -> Path:
+        return self.path / name
+
+    def read_text(self) -> str:
+        return self.file(TEXT_FILENAME).read_text(encoding="utf-8")
+
+
+class OcrResultCache:
+    def __init__(self, root: Path, *, max_bytes: int) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        # entry -> byte, dalla meno alla più recente
+        self._sizes: OrderedDict[Path, int] = OrderedDict()
+        self._total = 0
+        self._load()
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    @staticmethod
+    def _entry_size(path: Path) -> int:
+        return sum(f.stat().st_size for f in path.iterdir())
+
+    def _load(self) -> None:
+        """Unica scansione completa della cache: dimensioni e ordine LRU (mtime) delle entry esistenti."""
+        entries: list[tuple[float, Path, int]] = []
+        for entry in self.root.glob("*/*"):
+            try:
+                entries.append((entry.stat().st_mtime, entry, self._entry_size(entry)))
+            except FileNotFoundError:
+                continue
+        for _mtime, entry, size in sorted(entries):
+            self._sizes[entry] = size
+            self._total += size
+
+    def _track(self, path: Path, size: int) -> None:
+        # da chiamare con il lock
+        self._total += size - self._sizes.get(path, 0)
+        self._sizes[path] = size
+        self._sizes.move_to_end(path)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    def get(self, key: str) -> OcrCacheEntry | None:
+        path = self._entry_dir(key)
+        # ocr_text.txt viene scritto per ultimo: se c'è, la entry è completa
+        if not (path / TEXT_FILENAME).exists():
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            os.utime(path)  # LRU anche tra riavvii: la entry diventa la più recente
+            size = None if path in self._sizes else self._entry_size(path)
+        except FileNotFoundError:
+            # evicted nel frattempo
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if size is not None:
+                self._track(path, size)  # scritta da un altro processo
+            elif path in self._sizes:
+                self._sizes.move_to_end(path)
+        return OcrCacheEntry(key=key, path=path)
+
+    def put(self, key: str, *, files: dict[str, Path], text: str) -> None:
+        """Salva una copia degli artefatti OCR e applica l'eviction."""
+        path = self._entry_dir(key)
+        path.mkdir(parents=True, exist_ok=True)
+        for name, src in files.items():
+            tmp = path / f".{name}.{threading.get_ident()}.tmp"
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, path / name)
+
+        tmp_text = path / f".{TEXT_FILENAME}.tmp"
+        tmp_text.write_text(text, encoding="utf-8")
+        os.replace(tmp_text, path / TEXT_FILENAME)
+        size = self._entry_size(path)
+
+        with self._lock:
+            self.stores += 1
+            self._track(path, size)
+        self.evict()
+
+    def evict(self) -> None:
+        """Rimuove le entry meno usate di recente finché la cache non sta in max_bytes."""
+        victims: list[Path] = []
+        with self._lock:
+            while self._total > self.max_bytes and self._sizes:
+                entry, size = self._sizes.popitem(last=False)
+                self._total -= size
+                self.evictions += 1
+                victims.append(entry)
+        for entry in victims:
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+
+@lru_cache(maxsize=8)
+def _cache_for(root: str, max_bytes: int) -> OcrResultCache:
+    return OcrResultCache(Path(root), max_bytes=max_bytes)
+
+
+def get_ocr_cache() -> OcrResultCache | None:
+    """Cache OCR configurata (None se disabilitata)."""
+    if not settings.ocr_cache_enabled:
+        return None
+    root = settings.storage_path / OCR_CACHE_DIRNAME
+    return _cache_for(str(root), settings.ocr_cache_max_bytes)
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import threading
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any
+
+from PIL import Image
+
+from app.ocr.tesseract_engine import OcrResult, create_ocr_engine
+
+"""
+OCR parallelo per pagina: le pagine di un PDF vengono distribuite su un pool di processi
+(ogni processo ha il proprio engine, creato una sola volta dall'initializer).
+I risultati tornano nello stesso ordine delle pagine in input.
+"""
+
+EngineFactory = Callable[[], Any]
+
+_pools: dict[tuple[int, EngineFactory], ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+# Engine del processo worker (impostato da _init_worker)
+_worker_engine: Any = None
+
+
+def _init_worker(engine_factory: EngineFactory) -> None:
+    global _worker_engine
+    _worker_engine = engine_factory()
+
+
+def _ocr_page(img: Image.Image, page_index: int) -> OcrResult:
+    from app.ocr.pipeline import current_rss_bytes
+
+    result = _worker_engine.extract_from_pil(img, page_index=page_index)
+    # Render e OCR della pagina vivono qui, non nel processo API: l'RSS lo misura il worker
+    result.worker_rss_bytes = current_rss_bytes()
+    return result
+
+
+def _get_pool(workers: int, engine_factory: EngineFactory) -> ProcessPoolExecutor:
+    # Un pool per configurazione, riusato tra documenti (evita lo startup dei processi ogni volta)
+    key = (workers, engine_factory)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(engine_factory,),
+            )
+            _pools[key] = pool
+        return pool
+
+
+def iter_ocr_pages_parallel(
+    images: Iterable[Image.Image],
+    *,
+    workers: int,
+    window: int,
+    engine_factory: EngineFactory = create_ocr_engine,
+) -> Iterator[OcrResult]:
+    """
+    OCR in streaming su `workers` processi con al massimo `window` pagine in volo.
+
+    Le pagine vengono consumate dall'iterable solo quando c'è posto nella finestra,
+    quindi anche con un PDF lungo in memoria restano al più `window` bitmap.
+    """
+    pool = _get_pool(workers, engine_factory)
+    window = max(window, 1)
+    pending: deque[Future[OcrResult]] = deque()
+    try:
+        for page_index, img in enumerate(images, start=1):
+            pending.append(pool.submit(_ocr_page, img, page_index))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Consumer interrotto (errore o generator chiuso): niente lavoro orfano in coda
+        for fut in pending:
+            fut.cancel()
+
+
+def ocr_pages_parallel(
+    images: Sequence[Image.Image],
+    *,
+    workers: int,
+    engine_factory: EngineFactory = create_ocr_engine,
+) -> list[OcrResult]:
+    """
+    OCR di più pagine in parallelo su `workers` processi.
+    page_index è 1-based come nel loop sequenziale; l'ordine dei risultati è quello delle pagine.
+    """
+    return list(
+        iter_ocr_pages_parallel(images, workers=workers, window=len(images), engine_factory=engine_factory)
+    )
+
+
+def shutdown_page_pools(*, wait: bool = True) -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=wait)
@@ -1,19 +1,42 @@
 from __future__ import annotations
 
+from collections.abc import Iterator
 from pathlib import Path
 
 import pypdfium2 as pdfium
 from PIL import Image
 
+# Formati in cui PIL condivide il buffer del bitmap pdfium (invece di copiarlo)
+_SHARED_BUFFER_MODES = ("RGBA", "RGBX", "L")
 
-def render_pdf_to_images(pdf_path: Path, *, scale: float = 2.0) -> list[Image.Image]:
-    """Converte un PDF in una lista di immagini PIL (una per pagina)."""
+
+def iter_pdf_pages(pdf_path: Path, *, scale: float = 2.0) -> Iterator[Image.Image]:
+    """
+    Renderizza un PDF una pagina alla volta (generator).
+
+    In memoria resta solo la pagina corrente: page e bitmap pdfium vengono chiusi subito
+    dopo la conversione in PIL, il documento alla fine (o quando il generator viene chiuso).
+    """
     pdf = pdfium.PdfDocument(str(pdf_path))
-    images: list[Image.Image] = []
+    try:
+        for i in range(len(pdf)):
+            page = pdf[i]
+            try:
+                bitmap = page.render(scale=scale)
+                try:
+                    img = bitmap.to_pil()
+                    if bitmap.mode in _SHARED_BUFFER_MODES:
+                        # il buffer sta per essere liberato: serve una copia indipendente
+                        img = img.copy()
+                finally:
+                    bitmap.close()
+            finally:
+                page.close()
+            yield img
+    finally:
+        pdf.close()
 
-    for i in range(len(pdf)):
-        page = pdf[i]
-        bitmap = page.render(scale=scale)
-        images.append(bitmap.to_pil())
 
-    return images
+def render_pdf_to_images(pdf_path: Path, *, scale: float = 2.0) -> list[Image.Image]:
+    """Converte un PDF in una lista di immagini PIL (una per pagina)."""
+    return list(iter_pdf_pages(pdf_path, scale=scale))
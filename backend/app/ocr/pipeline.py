@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import os
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from typing import Any
+
+from PIL import Image
+
+from app.ocr.page_pool import EngineFactory, iter_ocr_pages_parallel
+from app.ocr.tesseract_engine import OcrResult, create_ocr_engine
+
+"""
+Pipeline OCR in streaming: render -> preprocess -> OCR una pagina alla volta.
+
+Le pagine arrivano da un generator (es. iter_pdf_pages) e i risultati escono nello stesso
+ordine; in modalità parallela al massimo `window` pagine sono in memoria contemporaneamente.
+"""
+
+
+def current_rss_bytes() -> int | None:
+    """RSS attuale del processo (psutil se installato, altrimenti /proc su Linux)."""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+
+    if psutil is not None:
+        return int(psutil.Process().memory_info().rss)
+
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        # es. Windows senza psutil: metrica non disponibile
+        return None
+
+
+@dataclass
+class PipelineStats:
+    """
+    Metriche di un documento: pagine, tempo e memoria, campionata a ogni pagina.
+
+    - process_peak_rss_bytes: picco di RSS del processo API mentre il documento era in lavorazione.
+      È del processo intero: include i documenti elaborati in parallelo dalla coda OCR
+    - process_rss_delta_bytes: quel picco meno l'RSS all'inizio del documento (vicino al costo del
+      documento solo se era l'unico in lavorazione)
+    - page_worker_peak_rss_bytes: RSS più alto dei processi del page pool (OCR_PAGE_WORKERS > 1)
+      misurato dal worker subito dopo l'OCR di una pagina del documento; None con OCR sequenziale
+    """
+    pages: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    baseline_rss_bytes: int | None = field(default_factory=current_rss_bytes)
+    process_peak_rss_bytes: int | None = None
+    page_worker_peak_rss_bytes: int | None = None
+
+    def sample_rss(self) -> None:
+        self.process_peak_rss_bytes = _max(self.process_peak_rss_bytes, current_rss_bytes())
+
+    def add_page(self, result: OcrResult) -> None:
+        self.pages += 1
+        self.sample_rss()
+        self.page_worker_peak_rss_bytes = _max(self.page_worker_peak_rss_bytes, result.worker_rss_bytes)
+
+    def as_dict(self) -> dict[str, Any]:
+        delta = None
+        if self.process_peak_rss_bytes is not None and self.baseline_rss_bytes is not None:
+            delta = max(0, self.process_peak_rss_bytes - self.baseline_rss_bytes)
+        return {
+            "pages": self.pages,
+            "elapsed_ms": round((time.perf_counter() - self.started_at) * 1000.0, 1),
+            "process_peak_rss_bytes": self.process_peak_rss_bytes,
+            "process_rss_delta_bytes": delta,
+            "page_worker_peak_rss_bytes": self.page_worker_peak_rss_bytes,
+        }
+
+
+def _max(current: int | None, sample: int | None) -> int | None:
+    if sample is None:
+        return current
+    return sample if current is None else max(current, sample)
+
+
+def iter_ocr_results(
+    images: Iterable[Image.Image],
+    *,
+    engine: Any,
+    workers: int = 1,
+    window: int = 1,
+    engine_factory: EngineFactory = create_ocr_engine,
+    stats: PipelineStats | None = None,
+) -> Iterator[OcrResult]:
+    """
+    OCR in streaming delle pagine in ordine (page_index 1-based).
+
+    - workers <= 1: stessa logica del loop sequenziale, con `engine`
+    - workers > 1: fan-out sul pool di processi con finestra limitata a `window` pagine
+    """
+    if stats is not None:
+        stats.sample_rss()
+
+    results: Iterator[OcrResult]
+    if workers > 1:
+        results = iter_ocr_pages_parallel(
+            _sampled(images, stats),
+            workers=workers,
+            window=max(window, workers),
+            engine_factory=engine_factory,
+        )
+    else:
+        results = (
+            engine.extract_from_pil(img, page_index=idx)
+            for idx, img in enumerate(_sampled(images, stats), start=1)
+        )
+
+    for res in results:
+        if stats is not None:
+            stats.add_page(res)
+        yield res
+
+
+def _sampled(images: Iterable[Image.Image], stats: PipelineStats | None) -> Iterator[Image.Image]:
+    # Campiona l'RSS subito dopo il render di ogni pagina (momento di picco tipico)
+    for img in images:
+        if stats is not None:
+            stats.sample_rss()
+        yield img
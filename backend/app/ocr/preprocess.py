@@ -1,18 +1,30 @@
 from __future__ import annotations
 
 import math
+import time
+from collections.abc import Callable
 
 import cv2
 import numpy as np
 from PIL import Image
 
+from app.core.config import settings
+
+# Versione del preprocessing: va incrementata quando cambia l'output (invalida la cache OCR)
+PREPROCESS_VERSION = "v2"
+
+# Uno stage lavora su un'immagine grayscale uint8 e ritorna il risultato
+# (può modificare l'array in place quando OpenCV lo permette)
+Stage = Callable[[np.ndarray], np.ndarray]
+
 
 def _pil_to_cv_gray(img: Image.Image) -> np.ndarray:
-    """Converte PIL -> OpenCV grayscale (uint8)."""
-    arr = np.array(img.convert("RGB"))
-    bgr = cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
-    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
-    return gray
+    """Converte PIL -> OpenCV grayscale (uint8), con una sola conversione colore."""
+    if img.mode == "L":
+        # copia scrivibile: gli stage successivi lavorano in place
+        return np.array(img)
+    rgb = img if img.mode == "RGB" else img.convert("RGB")
+    return cv2.cvtColor(np.asarray(rgb), cv2.COLOR_RGB2GRAY)
 
 
 def _cv_gray_to_pil(gray: np.ndarray) -> Image.Image:
@@ -20,10 +32,12 @@ def _cv_gray_to_pil(gray: np.ndarray) -> Image.Image:
     return Image.fromarray(gray)
 
 
-def _estimate_skew_angle(gray: np.ndarray) -> float:
+def _estimate_skew_angle_hough(gray: np.ndarray) -> float:
     """
-    Stima angolo di skew (in gradi) usando Hough su bordi.
+    Stima angolo di skew (in gradi) usando Hough su bordi, sull'immagine a piena risoluzione.
     Ritorna un angolo piccolo tipo [-15, +15] se trova linee.
+
+    Stimatore storico (v1): resta come riferimento per scripts/deskew_eval.py.
     """
     edges = cv2.Canny(gray, 50, 150)
     lines = cv2.HoughLinesP(edges, 1, math.pi / 180.0, threshold=80, minLineLength=100, maxLineGap=10)
@@ -31,7 +45,7 @@ def _estimate_skew_angle(gray: np.ndarray) -> float:
         return 0.0
 
     angles = []
-    for x1, y1, x2, y2 in lines[:, 0]:
+    for x1, y1, x2, y2 in lines.reshape(-1, 4):
         dx = x2 - x1
         dy = y2 - y1
         if dx == 0:
@@ -48,7 +62,66 @@ def _estimate_skew_angle(gray: np.ndarray) -> float:
     return float(np.median(np.array(angles)))
 
 
+def _projection_score(ys: np.ndarray, xs: np.ndarray, angle_deg: float) -> float:
+    """
+    "Nitidezza" del profilo di proiezione dei pixel di inchiostro lungo righe inclinate di
+    `angle_deg`: è massima quando l'angolo coincide con quello delle righe di testo.
+    """
+    a = math.radians(angle_deg)
+    offsets = ys * math.cos(a) - xs * math.sin(a)
+    offsets = np.rint(offsets - offsets.min()).astype(np.int64)
+    counts = np.bincount(offsets).astype(np.float64)
+    return float(np.dot(counts, counts))
+
+
+def _estimate_skew_angle(
+    gray: np.ndarray,
+    *,
+    max_side: int = 600,
+    max_angle: float = 40.0,
+    max_points: int = 20000,
+) -> float:
+    """
+    Stima dello skew (in gradi, stessa convenzione di _estimate_skew_angle_hough) su una copia
+    ridotta dell'immagine (lato massimo `max_side`), con profilo di proiezione:
+    ricerca grossolana a passi di 1° in [-max_angle, +max_angle] su un campione di pixel,
+    poi raffinamento a 0.1° su tutti i pixel di inchiostro.
+    Il costo non dipende dalla risoluzione dell'immagine originale.
+    """
+    h, w = gray.shape[:2]
+    f = min(1.0, max_side / max(h, w))
+    small = gray
+    if f < 1.0:
+        small = cv2.resize(gray, (max(1, int(w * f)), max(1, int(h * f))), interpolation=cv2.INTER_AREA)
+
+    # Inchiostro = tratti scuri rispetto all'intorno (threshold adattivo: ignora sfondi scuri estesi)
+    ink = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 15)
+    ys_idx, xs_idx = np.nonzero(ink)
+    if ys_idx.size < 50:
+        return 0.0
+
+    # Jitter sub-pixel deterministico: evita picchi spuri dovuti alla griglia dei pixel (es. a 45°)
+    rng = np.random.default_rng(0)
+    ys = ys_idx + rng.uniform(-0.5, 0.5, ys_idx.size)
+    xs = xs_idx + rng.uniform(-0.5, 0.5, xs_idx.size)
+
+    def best_of(candidates: np.ndarray, ys: np.ndarray, xs: np.ndarray) -> tuple[float, float]:
+        scores = [_projection_score(ys, xs, float(a)) for a in candidates]
+        i = int(np.argmax(scores))
+        return float(candidates[i]), scores[i]
+
+    step = max(1, ys.size // max_points)
+    coarse, _ = best_of(np.arange(-max_angle, max_angle + 0.5, 1.0), ys[::step], xs[::step])
+    angle, score = best_of(np.arange(coarse - 1.0, coarse + 1.05, 0.1), ys, xs)
+
+    # Nessuna direzione preferita (es. pagina vuota o rumore): niente rotazione
+    if score <= _projection_score(ys, xs, 0.0) * 1.001:
+        return 0.0
+    return round(angle, 2)
+
+
 def _deskew(gray: np.ndarray) -> np.ndarray:
+    # Angolo stimato sulla copia ridotta, rotazione applicata una sola volta a piena risoluzione
     angle = _estimate_skew_angle(gray)
     if abs(angle) < 0.5:
         return gray
@@ -61,29 +134,87 @@ def _deskew(gray: np.ndarray) -> np.ndarray:
     return rotated
 
 
-def preprocess_for_tesseract(img: Image.Image) -> Image.Image:
-    """
-    Preprocessing v1:
-    - grayscale
-    - denoise leggero
-    - deskew (raddrizza)
-    - threshold Otsu (automatico)
-    - (opzionale) upscale se piccola
-    """
-    gray = _pil_to_cv_gray(img)
+# --- Stage --------------------------------------------------------------------
 
+def _upscale_small(gray: np.ndarray, interpolation: int = cv2.INTER_CUBIC) -> np.ndarray:
     # Upscale se l'immagine è piccola (testo più leggibile)
     h, w = gray.shape[:2]
     if w < 1000:
-        gray = cv2.resize(gray, (w * 2, h * 2), interpolation=cv2.INTER_CUBIC)
+        return cv2.resize(gray, (w * 2, h * 2), interpolation=interpolation)
+    return gray
+
+
+def _upscale_small_linear(gray: np.ndarray) -> np.ndarray:
+    return _upscale_small(gray, interpolation=cv2.INTER_LINEAR)
+
+
+def _gaussian_blur(gray: np.ndarray) -> np.ndarray:
+    # Denoise leggero (in place)
+    return cv2.GaussianBlur(gray, (3, 3), 0, dst=gray)
+
+
+def _denoise(gray: np.ndarray) -> np.ndarray:
+    # Denoise non-local means: più lento, utile su scansioni rumorose
+    return cv2.fastNlMeansDenoising(gray, None, h=10, templateWindowSize=7, searchWindowSize=21)
+
+
+def _otsu(gray: np.ndarray) -> np.ndarray:
+    # Threshold automatico Otsu (in place)
+    _, thr = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=gray)
+    return thr
 
-    # Denoise leggero
-    gray = cv2.GaussianBlur(gray, (3, 3), 0)
 
-    # Deskew
-    gray = _deskew(gray)
+STAGES: dict[str, Stage] = {
+    "upscale_small": _upscale_small,
+    "upscale_small_linear": _upscale_small_linear,
+    "gaussian_blur": _gaussian_blur,
+    "denoise": _denoise,
+    "deskew": _deskew,
+    "otsu": _otsu,
+}
+
+# Profili: sequenze di stage applicate dopo la conversione in grayscale.
+# "default" è la pipeline v1 storica.
+PROFILES: dict[str, tuple[str, ...]] = {
+    "fast": ("upscale_small_linear", "otsu"),
+    "default": ("upscale_small", "gaussian_blur", "deskew", "otsu"),
+    "quality": ("upscale_small", "denoise", "deskew", "otsu"),
+}
+
+
+def preprocess_version(profile: str | None = None) -> str:
+    """Versione effettiva del preprocessing (versione + profilo), usata nella chiave cache OCR."""
+    return f"{PREPROCESS_VERSION}:{profile or settings.preprocess_profile}"
+
+
+def preprocess_for_tesseract(
+    img: Image.Image,
+    *,
+    profile: str | None = None,
+    timings: dict[str, float] | None = None,
+) -> Image.Image:
+    """
+    Preprocessing a stage (profilo da settings.preprocess_profile se non passato):
+    - grayscale (sempre)
+    - gli stage del profilo, es. "default": upscale se piccola, denoise leggero, deskew, Otsu
+
+    Se `timings` è passato, viene riempito con il tempo (ms) di ogni stage.
+    """
+    name = profile or settings.preprocess_profile
+    try:
+        stage_names = PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown preprocess profile: {name}. Allowed: {', '.join(PROFILES)}") from None
+
+    t0 = time.perf_counter()
+    gray = _pil_to_cv_gray(img)
+    if timings is not None:
+        timings["grayscale"] = (time.perf_counter() - t0) * 1000.0
 
-    # Threshold automatico Otsu
-    _, thr = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    for stage_name in stage_names:
+        t0 = time.perf_counter()
+        gray = STAGES[stage_name](gray)
+        if timings is not None:
+            timings[stage_name] = (time.perf_counter() - t0) * 1000.0
 
-    return _cv_gray_to_pil(thr)
+    return _cv_gray_to_pil(gray)
@@ -1,6 +1,12 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import queue
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
 from typing import Any
 
@@ -10,6 +16,12 @@ from PIL import Image
 from app.core.config import settings
 from app.ocr.preprocess import preprocess_for_tesseract
 
+# Backend OCR selezionabili via settings.ocr_backend
+OCR_BACKENDS = ("subprocess", "tesserocr")
+
+# Versione del formato dei risultati (2: + layout righe/blocchi): fa parte della chiave della cache OCR
+OCR_RESULT_FORMAT = 2
+
 
 @dataclass
 class OcrItem:
@@ -19,14 +31,142 @@ class OcrItem:
     line_key: str    # chiave utile per ricostruire righe (page/block/par/line)
 
 
+@dataclass
+class OcrLine:
+    # chiave intera della riga (block, par, line) di Tesseract
+    key: tuple[int, int, int]
+    bbox: list[int]  # unione dei bbox dei token
+    confidence: float  # media delle confidence dei token
+    # token della riga: items[token_start:token_end] (contigui, ordinati per word_num)
+    token_start: int
+    token_end: int
+
+
+@dataclass
+class OcrBlock:
+    block: int
+    bbox: list[int]
+    confidence: float
+    # righe del blocco: lines[line_start:line_end]
+    line_start: int
+    line_end: int
+
+
 @dataclass
 class OcrResult:
     engine: str
     items: list[OcrItem]
     full_text: str
+    # tempo (ms) per stage: preprocessing (uno per stage) + "ocr"
+    timings_ms: dict[str, float] = field(default_factory=dict)
+    # layout: righe e blocchi in ordine di lettura (vuoti se l'engine non li fornisce)
+    lines: list[OcrLine] = field(default_factory=list)
+    blocks: list[OcrBlock] = field(default_factory=list)
+    # RSS del processo del page pool subito dopo l'OCR della pagina (None se OCR nel processo API)
+    worker_rss_bytes: int | None = None
+
+
+def _union_bboxes(bboxes: list[list[int]]) -> list[int]:
+    return [
+        min(b[0] for b in bboxes),
+        min(b[1] for b in bboxes),
+        max(b[2] for b in bboxes),
+        max(b[3] for b in bboxes),
+    ]
+
+
+def _result_from_data(data: dict[str, Any], *, page_index: int) -> OcrResult:
+    """
+    Converte l'output "a colonne" di Tesseract (stesso formato di image_to_data / TSV)
+    in OcrResult: parole con bbox/confidence + testo ricostruito per righe + layout (righe e blocchi).
+    """
+    # (block, par, line, word) interi -> token; l'ordinamento sulle chiavi intere dà l'ordine di lettura
+    words: list[tuple[tuple[int, int, int, int], OcrItem]] = []
+
+    n = len(data.get("text", []))
+    for i in range(n):
+        txt = (data["text"][i] or "").strip()
+        conf_raw = data["conf"][i]
+
+        try:
+            conf_int = int(float(conf_raw))
+        except Exception:
+            conf_int = -1
+
+        if not txt or conf_int < 0:
+            continue
+
+        left = int(data["left"][i])
+        top = int(data["top"][i])
+        width = int(data["width"][i])
+        height = int(data["height"][i])
+        x1, y1, x2, y2 = left, top, left + width, top + height
+
+        # Per PDF usiamo page_index passato dall'esterno
+        block = int(data.get("block_num", [0])[i])
+        par = int(data.get("par_num", [0])[i])
+        line = int(data.get("line_num", [0])[i])
+        word = int(data.get("word_num", [0])[i])
+
+        line_key = f"{page_index}:{block}:{par}:{line}"
+
+        words.append(
+            (
+                (block, par, line, word),
+                OcrItem(
+                    text=txt,
+                    confidence=conf_int / 100.0,
+                    bbox=[x1, y1, x2, y2],
+                    line_key=line_key,
+                ),
+            )
+        )
+
+    # sort stabile: i token di ogni riga diventano contigui (Tesseract li emette già così)
+    words.sort(key=lambda w: w[0])
+    items = [item for _, item in words]
+
+    # Layout calcolato una volta sola: righe (range di token) e blocchi (range di righe)
+    lines: list[OcrLine] = []
+    start = 0
+    for end in range(1, len(words) + 1):
+        if end == len(words) or words[end][0][:3] != words[start][0][:3]:
+            line_items = items[start:end]
+            block, par, line, _word = words[start][0]
+            lines.append(
+                OcrLine(
+                    key=(block, par, line),
+                    bbox=_union_bboxes([it.bbox for it in line_items]),
+                    confidence=sum(it.confidence for it in line_items) / len(line_items),
+                    token_start=start,
+                    token_end=end,
+                )
+            )
+            start = end
+
+    blocks: list[OcrBlock] = []
+    start = 0
+    for end in range(1, len(lines) + 1):
+        if end == len(lines) or lines[end].key[0] != lines[start].key[0]:
+            block_items = items[lines[start].token_start : lines[end - 1].token_end]
+            blocks.append(
+                OcrBlock(
+                    block=lines[start].key[0],
+                    bbox=_union_bboxes([ln.bbox for ln in lines[start:end]]),
+                    confidence=sum(it.confidence for it in block_items) / len(block_items),
+                    line_start=start,
+                    line_end=end,
+                )
+            )
+            start = end
+
+    full_text = "\n".join(" ".join(it.text for it in items[ln.token_start : ln.token_end]) for ln in lines)
+    return OcrResult(engine="tesseract", items=items, full_text=full_text, lines=lines, blocks=blocks)
 
 
 class TesseractOcrEngine:
+    """Backend "subprocess": pytesseract lancia tesseract.exe a ogni chiamata."""
+
     def __init__(self) -> None:
         # Se l'utente non ha messo tesseract nel PATH, può configurare TESSERACT_CMD
         # TESSERACT_CMD è il percorso a tesseract.exe. Tesseract è un wrapper quindi il vero 
@@ -35,65 +175,145 @@ class TesseractOcrEngine:
             pytesseract.pytesseract.tesseract_cmd = settings.tesseract_cmd
     
     def extract_from_pil(self, img: Image.Image, *, page_index: int = 1) -> OcrResult:
-        img = preprocess_for_tesseract(img)
+        timings: dict[str, float] = {}
+        img = preprocess_for_tesseract(img, timings=timings)
 
-        config = "--psm 6"
+        t0 = time.perf_counter()
+        config = f"--psm {settings.tesseract_psm}"
         data: dict[str, Any] = pytesseract.image_to_data(
             img,
             lang=settings.tesseract_lang,
             config=config,
             output_type=pytesseract.Output.DICT,
         )
+        result = _result_from_data(data, page_index=page_index)
+        timings["ocr"] = (time.perf_counter() - t0) * 1000.0
+        result.timings_ms = timings
+        return result
 
-        items: list[OcrItem] = []
-        lines: dict[str, list[tuple[int, str]]] = {}
+    def extract_from_image(self, image_path: Path) -> OcrResult:
+        img = Image.open(image_path)
+        return self.extract_from_pil(img, page_index=1)
 
-        n = len(data.get("text", []))
-        for i in range(n):
-            txt = (data["text"][i] or "").strip()
-            conf_raw = data["conf"][i]
 
-            try:
-                conf_int = int(float(conf_raw))
-            except Exception:
-                conf_int = -1
+def _parse_tsv(tsv: str) -> dict[str, list[str]]:
+    """TSV di Tesseract (GetTSVText) -> dict di colonne come pytesseract.Output.DICT."""
+    columns = (
+        "level", "page_num", "block_num", "par_num", "line_num", "word_num",
+        "left", "top", "width", "height", "conf", "text",
+    )
+    data: dict[str, list[str]] = {c: [] for c in columns}
+    for row in tsv.splitlines():
+        parts = row.split("\t")
+        if len(parts) < len(columns):
+            # riga senza testo: la colonna text può mancare
+            parts += [""] * (len(columns) - len(parts))
+        for c, v in zip(columns, parts, strict=False):
+            data[c].append(v)
+    return data
 
-            if not txt or conf_int < 0:
-                continue
 
-            left = int(data["left"][i])
-            top = int(data["top"][i])
-            width = int(data["width"][i])
-            height = int(data["height"][i])
-            x1, y1, x2, y2 = left, top, left + width, top + height
+class TesserocrOcrEngine:
+    """
+    Backend "tesserocr": handle TessBaseAPI in-process, tenuti vivi in un pool.
 
-            # Per PDF usiamo page_index passato dall'esterno
-            block = data.get("block_num", [0])[i]
-            par = data.get("par_num", [0])[i]
-            line = data.get("line_num", [0])[i]
-            word = data.get("word_num", [0])[i]
+    - niente processo esterno né file temporanei: l'immagine passa come buffer di pixel
+    - traineddata caricato una volta per handle (non a ogni chiamata)
+    - un handle per worker: gli handle vengono creati on demand fino a `pool_size`
 
-            line_key = f"{page_index}:{block}:{par}:{line}"
+    Richiede la dipendenza opzionale `tesserocr`.
+    """
 
-            items.append(
-                OcrItem(
-                    text=txt,
-                    confidence=conf_int / 100.0,
-                    bbox=[x1, y1, x2, y2],
-                    line_key=line_key,
-                )
-            )
-            lines.setdefault(line_key, []).append((int(word), txt))
+    def __init__(self, *, pool_size: int | None = None) -> None:
+        try:
+            import tesserocr
+        except ImportError as e:  # pragma: no cover - dipende dall'ambiente
+            raise RuntimeError(
+                "OCR_BACKEND=tesserocr requires the optional 'tesserocr' package"
+            ) from e
+
+        self._tesserocr = tesserocr
+        self.pool_size = pool_size or settings.ocr_engine_pool_size or settings.ocr_job_workers
+        self._idle: queue.LifoQueue[Any] = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_handle(self) -> Any:
+        tesserocr = self._tesserocr
+        return tesserocr.PyTessBaseAPI(
+            lang=settings.tesseract_lang,
+            psm=tesserocr.PSM(settings.tesseract_psm),
+        )
+
+    @contextmanager
+    def _handle(self) -> Iterator[Any]:
+        try:
+            api = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.pool_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    api = self._new_handle()
+                except BaseException:
+                    # Slot restituito: altrimenti dopo pool_size errori (lang/PSM errati, traineddata
+                    # mancante) tutti i worker resterebbero bloccati su _idle.get()
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                # Pool pieno: si aspetta che un altro worker rilasci il suo handle
+                api = self._idle.get()
+        try:
+            yield api
+        finally:
+            api.Clear()
+            self._idle.put(api)
 
-        ordered_keys = sorted(lines.keys(), key=lambda k: [int(x) for x in k.split(":")])
-        full_lines: list[str] = []
-        for k in ordered_keys:
-            words = [w for _, w in sorted(lines[k], key=lambda t: t[0])]
-            full_lines.append(" ".join(words))
+    def extract_from_pil(self, img: Image.Image, *, page_index: int = 1) -> OcrResult:
+        timings: dict[str, float] = {}
+        gray = preprocess_for_tesseract(img, timings=timings)
+        if gray.mode != "L":
+            gray = gray.convert("L")
 
-        return OcrResult(engine="tesseract", items=items, full_text="\n".join(full_lines))
+        t0 = time.perf_counter()
+        width, height = gray.size
+        with self._handle() as api:
+            # 1 byte per pixel, righe contigue
+            api.SetImageBytes(gray.tobytes(), width, height, 1, width)
+            tsv = api.GetTSVText(0) or ""
 
+        result = _result_from_data(_parse_tsv(tsv), page_index=page_index)
+        timings["ocr"] = (time.perf_counter() - t0) * 1000.0
+        result.timings_ms = timings
+        return result
 
     def extract_from_image(self, image_path: Path) -> OcrResult:
         img = Image.open(image_path)
         return self.extract_from_pil(img, page_index=1)
+
+    def close(self) -> None:
+        while True:
+            try:
+                api = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            api.End()
+
+
+@lru_cache(maxsize=1)
+def _shared_tesserocr_engine() -> TesserocrOcrEngine:
+    # Un solo engine per processo: gli handle del pool sopravvivono tra i documenti
+    return TesserocrOcrEngine()
+
+
+def create_ocr_engine() -> TesseractOcrEngine | TesserocrOcrEngine:
+    """Ritorna l'engine OCR configurato da settings.ocr_backend."""
+    backend = settings.ocr_backend
+    if backend == "subprocess":
+        return TesseractOcrEngine()
+    if backend == "tesserocr":
+        return _shared_tesserocr_engine()
+    raise ValueError(f"Unknown OCR backend: {backend}. Allowed: {', '.join(OCR_BACKENDS)}")
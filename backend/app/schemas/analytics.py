@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+from typing import Literal
+
+from pydantic import BaseModel
+
+# Dimensioni dei rollup mensili (grana di expense_rollups), nell'ordine della chiave
+RollupDimension = Literal["month", "category", "merchant", "currency", "source"]
+ROLLUP_DIMENSIONS: tuple[RollupDimension, ...] = ("month", "category", "merchant", "currency", "source")
+
+
+class ExpenseSummaryRow(BaseModel):
+    """Un gruppo: le dimensioni non richieste in group_by restano None."""
+    month: date | None = None
+    category: str | None = None
+    merchant: str | None = None
+    currency: str | None = None
+    source: str | None = None
+    total: Decimal
+    count: int
+
+
+class ExpenseSummaryResponse(BaseModel):
+    """Totali e conteggi delle spese per gruppo, calcolati dai rollup mensili."""
+    group_by: list[RollupDimension]
+    month_from: str | None
+    month_to: str | None
+    rows: list[ExpenseSummaryRow]
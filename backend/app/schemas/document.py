@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from pydantic import BaseModel
 
+from app.schemas.job import OcrJobRead
+
 
 class DocumentUploadResponse(BaseModel):
     document_id: str
@@ -11,6 +13,9 @@ class DocumentUploadResponse(BaseModel):
     sha256: str
     stored_relative_path: str
     created_at: str
+    # Dedup upload (opt-in): stessi byte di un documento già caricato
+    is_duplicate: bool = False
+    duplicate_of: str | None = None
 
 
 class DocumentRead(DocumentUploadResponse):
@@ -18,3 +23,25 @@ class DocumentRead(DocumentUploadResponse):
     ocr_text_plain: str | None = None
     ocr_json_path: str | None = None
     error_message: str | None = None
+
+
+class BulkUploadRejected(BaseModel):
+    # nome del file (o del membro dell'archivio) scartato
+    filename: str
+    reason: str
+
+
+class DocumentBulkUploadResponse(BaseModel):
+    documents: list[DocumentRead]
+    rejected: list[BulkUploadRejected] = []
+    # job OCR creati se enqueue_ocr=true
+    jobs: list[OcrJobRead] = []
+
+
+class OcrCacheStats(BaseModel):
+    # contatori dal riavvio del processo
+    enabled: bool
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
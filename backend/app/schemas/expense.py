@@ -2,9 +2,13 @@ from __future__ import annotations
 
 from datetime import date, datetime
 from decimal import Decimal
+from typing import Literal
 
 from pydantic import BaseModel, ConfigDict, Field
 
+# Strategia del total di GET /expenses (app.services.expense_counts)
+CountStrategy = Literal["exact", "cached", "estimated"]
+
 
 class ExpenseBase(BaseModel):
     """Schema base di una spesa (campi condivisi)."""
@@ -65,3 +69,24 @@ class ExpenseListResponse(BaseModel):
     total: int
     limit: int
     offset: int
+    # Cursore per la pagina successiva (parametro `after`); None se questa è l'ultima
+    next_cursor: str | None = None
+    # Come è stato ottenuto total: "exact" (count), "cached" (count precedente, nessuna scrittura da
+    # allora) o "estimated" (stima del planner, approssimata)
+    count_strategy: CountStrategy = "exact"
+
+
+class ExpenseImportError(BaseModel):
+    """Riga del file non importata (numero di riga 1-based, header CSV compreso)."""
+    line: int
+    message: str
+
+
+class ExpenseImportResponse(BaseModel):
+    """Esito di un import massivo: le righe valide sono inserite anche se altre falliscono."""
+    rows: int
+    inserted: int
+    failed: int
+    errors: list[ExpenseImportError]
+    # True se gli errori sono più di quelli riportati in `errors`
+    errors_truncated: bool
@@ -22,6 +22,7 @@ class ExtractedField(BaseModel):
 
 class DocumentExtractionResponse(BaseModel):
     document_id: str
-    extraction_version: str = "rule_v0"
+    # versione dell'estrattore che ha prodotto il risultato (registry, es. "rule_v0")
+    extraction_version: str
     needs_review: bool
     fields: dict[str, ExtractedField]
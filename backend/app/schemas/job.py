@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+
+class OcrJobRead(BaseModel):
+    """Stato di un job OCR asincrono."""
+    model_config = ConfigDict(from_attributes=True)
+
+    job_id: str
+    document_id: str
+    # queued | running | processed | failed
+    status: str
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    error_message: str | None = None
+
+
+class OcrBatchRequest(BaseModel):
+    """
+    Batch OCR: lista esplicita di document_id oppure filtro per status
+    (es. {"status": "uploaded"} per il backfill dei documenti mai processati).
+    """
+    document_ids: list[str] | None = Field(default=None, max_length=1000)
+    status: str | None = Field(default=None, max_length=20)
+    # usato solo con il filtro status
+    limit: int = Field(default=100, ge=1, le=1000)
+
+    @model_validator(mode="after")
+    def _one_selector(self) -> OcrBatchRequest:
+        if (self.document_ids is None) == (self.status is None):
+            raise ValueError("Provide exactly one of document_ids or status")
+        return self
+
+
+class OcrBatchItem(BaseModel):
+    document_id: str
+    # None se il documento non esiste
+    job_id: str | None = None
+    # stato del job, oppure "not_found"
+    status: str
+
+
+class OcrBatchResponse(BaseModel):
+    items: list[OcrBatchItem]
+    queued: int
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any
+
+from sqlalchemy import delete, func, insert, select, text, tuple_
+from sqlalchemy.orm import Session
+
+from app.models.expense import Expense
+from app.models.expense_rollup import ExpenseRollup
+from app.schemas.analytics import ROLLUP_DIMENSIONS, RollupDimension
+
+"""
+Analytics sulle spese servite dai rollup mensili (expense_rollups), mai dalla tabella expenses.
+
+- create/update/delete di una spesa applicano i delta (importo, conteggio) alla riga del rollup
+  nella stessa transazione (apply_rollup_deltas, upsert ON CONFLICT su SQLite/Postgres)
+- summarize raggruppa i rollup per le dimensioni richieste su un intervallo di mesi
+- rebuild_rollups ricalcola tutto da zero (app.cli.rebuild_rollups)
+"""
+
+# (month, category, merchant, currency, source)
+RollupKey = tuple[date, str, str, str, str]
+# delta da applicare: (importo, numero di spese)
+RollupDeltas = dict[RollupKey, tuple[Decimal, int]]
+
+_CENT = Decimal("0.01")
+
+
+def rollup_entry(expense: Expense) -> tuple[RollupKey, Decimal]:
+    """Chiave del rollup e importo (arrotondato come Numeric(12, 2)) di una spesa."""
+    key = (
+        expense.expense_date.replace(day=1),
+        expense.category or "",
+        expense.merchant or "",
+        expense.currency,
+        expense.source,
+    )
+    return key, Decimal(expense.amount).quantize(_CENT, rounding=ROUND_HALF_UP)
+
+
+def expense_deltas(
+    *, old: tuple[RollupKey, Decimal] | None = None, new: tuple[RollupKey, Decimal] | None = None
+) -> RollupDeltas:
+    """Delta per il passaggio di una spesa da `old` a `new` (None = spesa assente prima/dopo)."""
+    deltas: RollupDeltas = {}
+    if old is not None:
+        add_delta(deltas, old[0], -old[1], -1)
+    if new is not None:
+        add_delta(deltas, new[0], new[1], 1)
+    return {k: v for k, v in deltas.items() if v != (0, 0)}
+
+
+def add_delta(deltas: RollupDeltas, key: RollupKey, amount: Decimal, count: int) -> None:
+    prev_amount, prev_count = deltas.get(key, (Decimal(0), 0))
+    deltas[key] = (prev_amount + amount, prev_count + count)
+
+
+def _upsert_insert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+
+def apply_rollup_deltas(db: Session, deltas: RollupDeltas) -> None:
+    """
+    Somma i delta alle righe dei rollup (creandole se serve) ed elimina quelle rimaste vuote.
+    Non fa commit: va chiamata dentro la transazione che scrive le spese.
+    """
+    if not deltas:
+        return
+    rows = [
+        {
+            "month": key[0],
+            "category": key[1],
+            "merchant": key[2],
+            "currency": key[3],
+            "source": key[4],
+            "total_amount": amount,
+            "expense_count": count,
+        }
+        for key, (amount, count) in deltas.items()
+    ]
+    dialect_insert = _upsert_insert(db)
+    if dialect_insert is not None:
+        # Upsert atomico: due transazioni concorrenti sulla stessa riga si sommano, non si sovrascrivono.
+        # Statement senza values (compilato una volta e in cache), eseguito in executemany sulle righe
+        stmt = dialect_insert(ExpenseRollup)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(ROLLUP_DIMENSIONS),
+            set_={
+                "total_amount": ExpenseRollup.total_amount + stmt.excluded.total_amount,
+                "expense_count": ExpenseRollup.expense_count + stmt.excluded.expense_count,
+            },
+        )
+        db.connection().execute(stmt, rows)
+    else:
+        for row in rows:
+            current = db.scalars(
+                select(ExpenseRollup)
+                .where(*(getattr(ExpenseRollup, dim) == row[dim] for dim in ROLLUP_DIMENSIONS))
+                .with_for_update()
+            ).one_or_none()
+            if current is None:
+                db.add(ExpenseRollup(**row))
+            else:
+                current.total_amount += row["total_amount"]
+                current.expense_count += row["expense_count"]
+        db.flush()
+
+    if all(count > 0 for _amount, count in deltas.values()):
+        return  # solo incrementi: nessuna riga può essersi svuotata
+    db.execute(
+        delete(ExpenseRollup).where(
+            ExpenseRollup.expense_count <= 0,
+            tuple_(*(getattr(ExpenseRollup, dim) for dim in ROLLUP_DIMENSIONS)).in_(list(deltas)),
+        )
+    )
+
+
+def summarize(
+    db: Session,
+    *,
+    group_by: Iterable[RollupDimension],
+    month_from: date | None = None,
+    month_to: date | None = None,
+    category: str | None = None,
+    merchant: str | None = None,
+    currency: str | None = None,
+    source: str | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Totale e numero di spese per le dimensioni di `group_by` (nessuna = un'unica riga) sui mesi
+    [month_from, month_to]. Le dimensioni non richieste sono None nelle righe; category/merchant
+    non valorizzati sono None. Importi di valute diverse si sommano così come sono: per totali
+    significativi raggruppare (o filtrare) per currency.
+    """
+    dims = [dim for dim in ROLLUP_DIMENSIONS if dim in set(group_by)]
+    columns = [getattr(ExpenseRollup, dim) for dim in dims]
+    stmt = select(
+        *columns,
+        func.sum(ExpenseRollup.total_amount).label("total"),
+        func.sum(ExpenseRollup.expense_count).label("count"),
+    )
+    if month_from is not None:
+        stmt = stmt.where(ExpenseRollup.month >= month_from.replace(day=1))
+    if month_to is not None:
+        stmt = stmt.where(ExpenseRollup.month <= month_to.replace(day=1))
+    for dim, value in (("category", category), ("merchant", merchant), ("currency", currency), ("source", source)):
+        if value is not None:
+            stmt = stmt.where(getattr(ExpenseRollup, dim) == value)
+    if columns:
+        stmt = stmt.group_by(*columns).order_by(*columns)
+
+    out: list[dict[str, Any]] = []
+    for row in db.execute(stmt):
+        if not row.count:
+            continue  # nessun rollup nel filtro (l'aggregato senza group_by dà comunque una riga)
+        item: dict[str, Any] = dict.fromkeys(ROLLUP_DIMENSIONS)
+        for dim in dims:
+            value = getattr(row, dim)
+            item[dim] = (value or None) if dim in ("category", "merchant") else value
+        item["total"] = Decimal(row.total).quantize(_CENT)
+        item["count"] = int(row.count)
+        out.append(item)
+    return out
+
+
+@dataclass
+class RebuildStats:
+    expenses: int = 0
+    rollups: int = 0
+
+
+def rebuild_rollups(db: Session, *, batch_size: int = 10_000) -> RebuildStats:
+    """
+    Ricalcola tutti i rollup da expenses in una sola transazione (le spese sono lette a blocchi).
+    Su Postgres blocca le scritture su expenses fino al commit, così nessun delta va perso.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE expenses IN SHARE MODE"))
+    db.execute(delete(ExpenseRollup))
+
+    stats = RebuildStats()
+    deltas: RollupDeltas = {}
+    stmt = select(
+        Expense.expense_date,
+        Expense.category,
+        Expense.merchant,
+        Expense.currency,
+        Expense.source,
+        Expense.amount,
+    ).execution_options(yield_per=batch_size)
+    for row in db.execute(stmt):
+        key, amount = rollup_entry(row)
+        add_delta(deltas, key, amount, 1)
+        stats.expenses += 1
+
+    rows = [
+        dict(zip(ROLLUP_DIMENSIONS, key, strict=True), total_amount=amount, expense_count=count)
+        for key, (amount, count) in deltas.items()
+    ]
+    for lo in range(0, len(rows), batch_size):
+        db.execute(insert(ExpenseRollup), rows[lo : lo + batch_size])
+    db.commit()
+    stats.rollups = len(rows)
+    return stats
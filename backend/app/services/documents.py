@@ -1,13 +1,37 @@
 from __future__ import annotations
 
+import gzip
+import json
+import logging
+import os
+from collections.abc import Sequence
+from contextlib import closing
 from pathlib import Path
+from typing import Any
 
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
 from app.models.document import Document
-from app.ocr.pdf_render import render_pdf_to_images
-from app.ocr.tesseract_engine import TesseractOcrEngine
+from app.ocr.artifact import OCR_ARTIFACT_FILENAME, write_ocr_artifact
+from app.ocr.cache import (
+    OcrCacheEntry,
+    get_ocr_cache,
+    link_or_copy,
+    ocr_cache_key,
+    ocr_config_fingerprint,
+)
+from app.ocr.pdf_render import iter_pdf_pages
+from app.ocr.pipeline import PipelineStats, iter_ocr_results
+from app.ocr.tesseract_engine import OcrResult, create_ocr_engine
+from app.services.extraction import invalidate_extractions
+
+logger = logging.getLogger(__name__)
+
+OCR_JSON_FILENAME = "ocr_result.json"
+# Variante precompressa del JSON OCR (stessi byte, gzip)
+OCR_JSON_GZ_FILENAME = "ocr_result.json.gz"
 
 
 def create_document(
@@ -19,68 +43,256 @@ def create_document(
     storage_path: str,
     sha256: str,
     size_bytes: int,
+    duplicate_of: str | None = None,
 ) -> Document:
-    doc = Document(
-        id=document_id,
-        original_filename=original_filename,
-        mime_type=mime_type,
-        storage_path=storage_path,
-        sha256=sha256,
-        size_bytes=size_bytes,
-        status="uploaded",
+    [doc] = create_documents(
+        db,
+        [
+            {
+                "document_id": document_id,
+                "original_filename": original_filename,
+                "mime_type": mime_type,
+                "storage_path": storage_path,
+                "sha256": sha256,
+                "size_bytes": size_bytes,
+                "duplicate_of": duplicate_of,
+            }
+        ],
     )
-    db.add(doc)
-    db.commit()
-    db.refresh(doc)
     return doc
 
 
+def create_documents(db: Session, rows: Sequence[dict[str, Any]]) -> list[Document]:
+    """
+    Inserisce più documenti in una sola transazione (un solo commit).
+    Ogni riga ha le stesse chiavi degli argomenti di create_document.
+    """
+    docs = [
+        Document(
+            id=row["document_id"],
+            original_filename=row["original_filename"],
+            mime_type=row["mime_type"],
+            storage_path=row["storage_path"],
+            sha256=row["sha256"],
+            size_bytes=row["size_bytes"],
+            status="uploaded",
+            duplicate_of=row.get("duplicate_of"),
+        )
+        for row in rows
+    ]
+    if not docs:
+        return []
+    db.add_all(docs)
+    db.commit()
+    # Una sola SELECT per ricaricare i default lato server (created_at, ...) invece di un refresh per riga
+    ids = [doc.id for doc in docs]
+    db.scalars(
+        select(Document).where(Document.id.in_(ids)).execution_options(populate_existing=True)
+    ).all()
+    return docs
+
+
 def get_document(db: Session, document_id: str) -> Document | None:
     return db.get(Document, document_id)
 
 
-def process_document_ocr(db: Session, document_id: str) -> Document | None:
+def list_document_ids_by_status(db: Session, status: str, *, limit: int) -> list[str]:
+    """Id dei documenti con un dato status (più vecchi prima), via indice ix_documents_status."""
+    stmt = (
+        select(Document.id)
+        .where(Document.status == status)
+        .order_by(Document.created_at, Document.id)
+        .limit(limit)
+    )
+    return list(db.scalars(stmt).all())
+
+
+def find_original_by_sha256(db: Session, sha256: str) -> Document | None:
+    """Primo documento (non duplicato) con lo stesso sha256: usa l'indice ix_documents_sha256."""
+    stmt = (
+        select(Document)
+        .where(Document.sha256 == sha256, Document.duplicate_of.is_(None))
+        .order_by(Document.created_at, Document.id)
+        .limit(1)
+    )
+    return db.scalars(stmt).first()
+
+
+def _page_payload(page_index: int, result: OcrResult) -> dict[str, Any]:
+    """Struttura di una pagina in ocr_result.json."""
+    return {
+        "page_index": page_index,
+        "full_text": result.full_text,
+        "items": [
+            {"text": it.text, "confidence": it.confidence, "bbox": it.bbox, "line_key": it.line_key}
+            for it in result.items
+        ],
+        **({"layout": _layout_payload(result)} if result.lines else {}),
+        "timings_ms": {stage: round(ms, 2) for stage, ms in result.timings_ms.items()},
+    }
+
+
+def _layout_payload(result: OcrResult) -> dict[str, Any]:
+    """Layout della pagina: righe (range di token in items) e blocchi (range di righe)."""
+    return {
+        "lines": [
+            {
+                "key": list(ln.key),
+                "bbox": ln.bbox,
+                "confidence": round(ln.confidence, 4),
+                "tokens": [ln.token_start, ln.token_end],
+            }
+            for ln in result.lines
+        ],
+        "blocks": [
+            {
+                "block": b.block,
+                "bbox": b.bbox,
+                "confidence": round(b.confidence, 4),
+                "lines": [b.line_start, b.line_end],
+            }
+            for b in result.blocks
+        ],
+    }
+
+
+def _write_atomic(path: Path, content: bytes) -> None:
+    # Scrittura su file temporaneo + replace: il file non viene mai riscritto in place
+    # (può essere un hardlink condiviso con la cache OCR)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(content)
+    os.replace(tmp, path)
+
+
+def _optional_artifacts() -> dict[str, bool]:
+    """File opzionali scritti accanto a ocr_result.json -> abilitato da settings."""
+    return {
+        OCR_ARTIFACT_FILENAME: settings.ocr_columnar_artifact,
+        OCR_JSON_GZ_FILENAME: settings.ocr_json_gzip,
+    }
+
+
+def _restore_from_cache(entry: OcrCacheEntry, ocr_path: Path) -> str | None:
+    """Pubblica l'ocr_result.json in cache nella cartella del documento; ritorna il testo OCR."""
+    try:
+        link_or_copy(entry.file(OCR_JSON_FILENAME), ocr_path)
+        for name, enabled in _optional_artifacts().items():
+            cached = entry.file(name)
+            if enabled and cached.exists():
+                link_or_copy(cached, ocr_path.with_name(name))
+            else:
+                # mai lasciare accanto al nuovo JSON un artefatto di un OCR precedente
+                ocr_path.with_name(name).unlink(missing_ok=True)
+        return entry.read_text()
+    except FileNotFoundError:
+        # entry rimossa dall'eviction tra get e link: si rifà l'OCR
+        return None
+
+
+def _write_optional_artifacts(
+    doc_id: str, ocr_path: Path, ocr_payload: dict[str, Any], raw_json: bytes
+) -> dict[str, Path]:
+    """
+    Scrive gli artefatti opzionali (colonnare, gzip) accanto al JSON. Quelli disabilitati o falliti
+    vengono rimossi, così non restano dati di un OCR precedente. Ritorna nome -> path dei file scritti.
+    """
+    writers = {
+        OCR_ARTIFACT_FILENAME: lambda path: write_ocr_artifact(path, ocr_payload),
+        OCR_JSON_GZ_FILENAME: lambda path: _write_atomic(path, gzip.compress(raw_json, mtime=0)),
+    }
+    written: dict[str, Path] = {}
+    for name, enabled in _optional_artifacts().items():
+        path = ocr_path.with_name(name)
+        if enabled:
+            try:
+                writers[name](path)
+                written[name] = path
+                continue
+            except (OSError, ValueError) as e:
+                # il JSON resta la fonte completa: gli artefatti sono un'ottimizzazione
+                logger.warning("OCR artifact %s failed document=%s: %s", name, doc_id, e)
+        path.unlink(missing_ok=True)
+    return written
+
+
+def _mark_processed(
+    db: Session, doc: Document, *, text: str, rel_ocr_path: str, ocr_fingerprint: str
+) -> Document:
+    doc.ocr_text_plain = text
+    doc.ocr_json_path = rel_ocr_path
+    doc.ocr_fingerprint = ocr_fingerprint
+    doc.error_message = None
+    doc.status = "processed"
+
+    db.add(doc)
+    db.commit()
+    db.refresh(doc)
+    return doc
+
+
+def process_document_ocr(db: Session, document_id: str, *, engine: Any = None) -> Document | None:
+    """
+    OCR sincrono di un documento. `engine` permette di riusare un'istanza già creata
+    (es. quella condivisa dalla coda job); se None se ne crea una da settings.
+    """
     doc = db.get(Document, document_id)
     if doc is None:
         return None
 
+    # Stato intermedio visibile da GET /documents/{id} mentre l'OCR gira.
+    # Il nuovo OCR rende obsolete le estrazioni salvate: eliminate nella stessa transazione.
+    doc.status = "running"
+    db.add(doc)
+    invalidate_extractions(db, doc.id)
+    db.commit()
+
     try:
+        doc_dir = settings.storage_path / "documents" / doc.id
+        ocr_path = doc_dir / OCR_JSON_FILENAME
+        rel_ocr_path = str(Path("documents") / doc.id / OCR_JSON_FILENAME)
+
+        # Cache content-addressed: stesso file + stessa config OCR => si riusa il risultato
+        cache = get_ocr_cache()
+        cache_key = ocr_cache_key(doc.sha256)
+        # La configurazione OCR usata (fa già parte della chiave di cache), registrata sul documento
+        ocr_fingerprint = ocr_config_fingerprint()
+        entry = cache.get(cache_key) if cache is not None else None
+        if entry is not None:
+            cached_text = _restore_from_cache(entry, ocr_path)
+            if cached_text is not None:
+                logger.info("OCR cache hit document=%s key=%s", doc.id, cache_key)
+                return _mark_processed(
+                    db, doc, text=cached_text, rel_ocr_path=rel_ocr_path, ocr_fingerprint=ocr_fingerprint
+                )
+
         abs_input = settings.storage_path / Path(doc.storage_path)
-        engine = TesseractOcrEngine()
+        if engine is None:
+            engine = create_ocr_engine()
+        stats = PipelineStats()
 
         pages_payload = []
         full_text_pages = []
 
         if doc.mime_type.startswith("image/"):
             result = engine.extract_from_image(abs_input)
-            pages_payload.append(
-                {
-                    "page_index": 1,
-                    "full_text": result.full_text,
-                    "items": [
-                        {"text": it.text, "confidence": it.confidence, "bbox": it.bbox, "line_key": it.line_key}
-                        for it in result.items
-                    ],
-                }
-            )
+            stats.add_page(result)
+            pages_payload.append(_page_payload(1, result))
             full_text_pages.append(result.full_text)
 
         elif doc.mime_type == "application/pdf":
-            pil_pages = render_pdf_to_images(abs_input, scale=2.0)
-
-            for idx, pil_img in enumerate(pil_pages, start=1):
-                page_res = engine.extract_from_pil(pil_img, page_index=idx)
-                pages_payload.append(
-                    {
-                        "page_index": idx,
-                        "full_text": page_res.full_text,
-                        "items": [
-                            {"text": it.text, "confidence": it.confidence, "bbox": it.bbox, "line_key": it.line_key}
-                            for it in page_res.items
-                        ],
-                    }
+            # Render -> preprocess -> OCR in streaming: il PDF viene chiuso anche in caso di errore
+            with closing(iter_pdf_pages(abs_input, scale=settings.ocr_pdf_render_scale)) as pil_pages:
+                page_results = iter_ocr_results(
+                    pil_pages,
+                    engine=engine,
+                    workers=settings.ocr_page_workers,
+                    window=settings.ocr_inflight_pages,
+                    engine_factory=create_ocr_engine,
+                    stats=stats,
                 )
-                full_text_pages.append(page_res.full_text)
+                for idx, page_res in enumerate(page_results, start=1):
+                    pages_payload.append(_page_payload(idx, page_res))
+                    full_text_pages.append(page_res.full_text)
 
         else:
             doc.status = "failed"
@@ -90,33 +302,39 @@ def process_document_ocr(db: Session, document_id: str) -> Document | None:
             db.refresh(doc)
             return doc
 
-        doc_dir = settings.storage_path / "documents" / doc.id
-        ocr_path = doc_dir / "ocr_result.json"
+        metrics = stats.as_dict()
+        logger.info(
+            "OCR document=%s pages=%s elapsed_ms=%s process_peak_rss_bytes=%s page_worker_peak_rss_bytes=%s",
+            doc.id, metrics["pages"], metrics["elapsed_ms"], metrics["process_peak_rss_bytes"],
+            metrics["page_worker_peak_rss_bytes"],
+        )
 
         ocr_payload = {
             "engine": "tesseract",
             "pages": pages_payload,
+            "metrics": metrics,
         }
 
-        ocr_path.write_text(
-            __import__("json").dumps(ocr_payload, ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
-
-        rel_ocr_path = str(Path("documents") / doc.id / "ocr_result.json")
+        raw_json = json.dumps(ocr_payload, ensure_ascii=False, indent=2).encode("utf-8")
+        _write_atomic(ocr_path, raw_json)
+        cache_files = {
+            OCR_JSON_FILENAME: ocr_path,
+            **_write_optional_artifacts(doc.id, ocr_path, ocr_payload, raw_json),
+        }
 
         # Aggregazione testo: separatore tra pagine
         aggregated = "\n\n----- PAGE BREAK -----\n\n".join(full_text_pages)
 
-        doc.ocr_text_plain = aggregated
-        doc.ocr_json_path = rel_ocr_path
-        doc.error_message = None
-        doc.status = "processed"
+        if cache is not None:
+            try:
+                cache.put(cache_key, files=cache_files, text=aggregated)
+            except OSError as e:
+                # la cache è un'ottimizzazione: un errore non deve far fallire l'OCR
+                logger.warning("OCR cache store failed document=%s: %s", doc.id, e)
 
-        db.add(doc)
-        db.commit()
-        db.refresh(doc)
-        return doc
+        return _mark_processed(
+            db, doc, text=aggregated, rel_ocr_path=rel_ocr_path, ocr_fingerprint=ocr_fingerprint
+        )
 
     except Exception as e:
         doc.status = "failed"
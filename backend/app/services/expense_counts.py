@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import json
+import threading
+from collections import OrderedDict
+from datetime import date
+from decimal import Decimal
+from typing import Any
+
+from sqlalchemy import Select, func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.schemas.expense import CountStrategy
+
+"""
+Strategie per il total di GET /expenses:
+
+- exact: SELECT count(*) sui filtri (sempre corretto, costa quanto una scansione dei match)
+- cached: come exact, ma il risultato resta in una cache in-process per set di filtri normalizzato,
+  invalidata da un contatore di versione che create/update/delete incrementano
+- estimated: stima del planner di Postgres (EXPLAIN); sotto _ESTIMATE_EXACT_BELOW righe conviene il
+  count esatto, su altri DB si ripiega su cached
+
+Il contatore è per processo: con più worker (es. uvicorn --workers N) una scrittura invalida solo la
+cache del processo che l'ha servita, per questo cached non è il default.
+"""
+
+# Sotto questa stima il count esatto costa poco e le stime del planner sono le meno affidabili
+_ESTIMATE_EXACT_BELOW = 1000
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value.normalize())
+    return value
+
+
+def filters_key(filters: dict[str, Any]) -> tuple[tuple[str, Any], ...]:
+    """Chiave stabile per un set di filtri: senza i None, merchant minuscolo (il filtro è ILIKE)."""
+    items = []
+    for name, value in sorted(filters.items()):
+        if value is None:
+            continue
+        if name == "merchant":
+            value = value.lower()
+        items.append((name, _normalize(value)))
+    return tuple(items)
+
+
+class ExpenseCountCache:
+    """Cache LRU (thread-safe) dei count per chiave di filtri, valida solo per la versione corrente."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, tuple[int, int]] = OrderedDict()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def bump(self) -> None:
+        """Da chiamare dopo ogni scrittura sulle spese: tutti i count in cache diventano obsoleti."""
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def get(self, key: tuple) -> int | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != self._version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, total: int, version: int) -> None:
+        # `version` è quella letta prima del count: se nel frattempo c'è stata una scrittura il valore
+        # potrebbe essere già vecchio e non va salvato
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = (version, total)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+expense_count_cache = ExpenseCountCache(max_entries=settings.expenses_count_cache_size)
+
+
+def exact_count(db: Session, stmt: Select) -> int:
+    # Il count non ha bisogno dell'ordinamento (senza, il planner non ordina/usa l'indice solo per filtrare)
+    return int(db.scalar(select(func.count()).select_from(stmt.order_by(None).subquery())) or 0)
+
+
+def estimate_count(db: Session, stmt: Select) -> int | None:
+    """Righe stimate dal planner di Postgres per la select filtrata; None su altri DB."""
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return None
+    compiled = stmt.order_by(None).compile(dialect=bind.dialect)
+    plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_expenses(
+    db: Session,
+    stmt: Select,
+    filters: dict[str, Any],
+    strategy: CountStrategy,
+    *,
+    cache_version: int,
+) -> tuple[int, CountStrategy]:
+    """
+    Total per la select filtrata `stmt` con la strategia richiesta; ritorna anche quella usata.
+
+    `cache_version` va letta prima della prima query della transazione: il count può vedere lo
+    snapshot aperto da quella query, più vecchio di una scrittura arrivata nel frattempo.
+    """
+    if strategy == "estimated":
+        estimate = estimate_count(db, stmt)
+        if estimate is not None and estimate >= _ESTIMATE_EXACT_BELOW:
+            return estimate, "estimated"
+        if estimate is not None:
+            return exact_count(db, stmt), "exact"
+        strategy = "cached"
+
+    if strategy == "cached":
+        key = filters_key(filters)
+        cached = expense_count_cache.get(key)
+        if cached is not None:
+            return cached, "cached"
+        total = exact_count(db, stmt)
+        expense_count_cache.put(key, total, cache_version)
+        return total, "exact"
+
+    return exact_count(db, stmt), "exact"
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Literal
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.models.expense import Expense
+from app.schemas.expense import ExpenseCreate
+from app.services.analytics import RollupDeltas, add_delta, apply_rollup_deltas, rollup_entry
+from app.services.expense_counts import expense_count_cache
+
+"""
+Import massivo di spese da CSV (header con i campi di ExpenseCreate) o NDJSON (un oggetto per riga).
+
+- il file è letto in streaming e validato con ExpenseCreate a blocchi di `chunk_size` righe:
+  la memoria dipende dal blocco, non dalla dimensione del file
+- ogni blocco è inserito con un solo executemany (COPY su Postgres) e committato insieme ai rollup
+- le righe non valide (parsing, validazione, errori DB) finiscono negli errori con il numero di riga,
+  senza fermare l'import; se l'inserimento di un blocco fallisce lo si ripete riga per riga
+"""
+
+ImportFormat = Literal["csv", "ndjson"]
+
+# Colonne scritte (stesso ordine per executemany e COPY); id e timestamp restano ai default del DB
+_COLUMNS = tuple(ExpenseCreate.model_fields)
+
+
+@dataclass
+class RowError:
+    line: int
+    message: str
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    inserted: int = 0
+    failed: int = 0
+    # al più max_errors errori dettagliati (failed li conta tutti)
+    errors: list[RowError] = field(default_factory=list)
+    max_errors: int = 1000
+
+    @property
+    def errors_truncated(self) -> bool:
+        return self.failed > len(self.errors)
+
+    def add_error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(RowError(line=line, message=message))
+
+
+def infer_format(filename: str | None, content_type: str | None) -> ImportFormat | None:
+    name = (filename or "").lower()
+    if name.endswith(".csv") or content_type in ("text/csv", "application/csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")) or content_type in ("application/x-ndjson", "application/jsonl"):
+        return "ndjson"
+    return None
+
+
+def iter_records(stream: BinaryIO, fmt: ImportFormat) -> Iterator[tuple[int, dict[str, Any] | str]]:
+    """(numero di riga, record) per ogni record del file; al posto del record un messaggio se illeggibile."""
+    # utf-8-sig: gli export dei fogli di calcolo spesso iniziano con il BOM; newline="" come vuole csv
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        yield from _iter_csv(text) if fmt == "csv" else _iter_ndjson(text)
+    finally:
+        text.detach()  # lo stream resta del chiamante (chiuderlo è compito suo)
+
+
+def _iter_csv(text: io.TextIOBase) -> Iterator[tuple[int, dict[str, Any] | str]]:
+    reader = csv.DictReader(text)
+    line = reader.line_num
+    for record in reader:
+        # un record può occupare più righe (campi tra virgolette): si riporta la prima
+        start, line = line + 1, reader.line_num
+        if None in record:
+            yield start, "more values than header columns"
+            continue
+        # cella vuota = campo non fornito (vale il default di ExpenseCreate)
+        yield start, {k: v for k, v in record.items() if v not in ("", None)}
+
+
+def _iter_ndjson(text: io.TextIOBase) -> Iterator[tuple[int, dict[str, Any] | str]]:
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except json.JSONDecodeError as e:
+            yield line, f"invalid JSON: {e.msg}"
+            continue
+        yield line, record if isinstance(record, dict) else "expected a JSON object"
+
+
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc']) or 'row'}: {err['msg']}" for err in e.errors())
+
+
+def _insert_rows(db: Session, rows: list[ExpenseCreate]) -> None:
+    values = [row.model_dump() for row in rows]
+    if db.get_bind().dialect.name == "postgresql":
+        # COPY sulla stessa connessione (e transazione) della session
+        driver_conn = db.connection().connection.driver_connection
+        with driver_conn.cursor() as cur:
+            with cur.copy(f"COPY expenses ({', '.join(_COLUMNS)}) FROM STDIN") as copy:
+                for value in values:
+                    copy.write_row(tuple(value[c] for c in _COLUMNS))
+        return
+    # Core sulla tabella (non bulk ORM, che con valori None eterogenei ricade su un INSERT per riga)
+    db.connection().execute(insert(Expense.__table__), values)
+
+
+def _db_errors(db: Session) -> tuple[type[BaseException], ...]:
+    # COPY passa dal driver: i suoi errori non sono wrappati da SQLAlchemy
+    return (SQLAlchemyError, db.get_bind().dialect.loaded_dbapi.Error)
+
+
+def _store_chunk(db: Session, chunk: list[tuple[int, ExpenseCreate]], result: ImportResult) -> None:
+    errors = _db_errors(db)
+    try:
+        with db.begin_nested():
+            _insert_rows(db, [row for _, row in chunk])
+        inserted = chunk
+    except errors:
+        # Una riga rifiutata dal DB fa fallire il blocco: si ripete riga per riga per isolarla
+        inserted = []
+        for line, row in chunk:
+            try:
+                with db.begin_nested():
+                    _insert_rows(db, [row])
+            except errors as e:
+                result.add_error(line, f"database error: {str(getattr(e, 'orig', e)).splitlines()[0]}")
+            else:
+                inserted.append((line, row))
+
+    deltas: RollupDeltas = {}
+    for _, row in inserted:
+        key, amount = rollup_entry(row)
+        add_delta(deltas, key, amount, 1)
+    apply_rollup_deltas(db, deltas)
+    db.commit()
+    expense_count_cache.bump()
+    result.inserted += len(inserted)
+
+
+def import_expenses(
+    db: Session, stream: BinaryIO, fmt: ImportFormat, *, chunk_size: int = 1000, max_errors: int = 1000
+) -> ImportResult:
+    """Importa le spese dal file; ogni blocco è committato appena inserito."""
+    result = ImportResult(max_errors=max_errors)
+    chunk: list[tuple[int, ExpenseCreate]] = []
+    for line, record in iter_records(stream, fmt):
+        result.rows += 1
+        if isinstance(record, str):
+            result.add_error(line, record)
+            continue
+        try:
+            chunk.append((line, ExpenseCreate.model_validate(record)))
+        except ValidationError as e:
+            result.add_error(line, _validation_message(e))
+            continue
+        if len(chunk) >= chunk_size:
+            _store_chunk(db, chunk, result)
+            chunk = []
+    if chunk:
+        _store_chunk(db, chunk, result)
+    return result
@@ -1,21 +1,27 @@
 from __future__ import annotations
 
+import base64
+import binascii
 from datetime import date
 from decimal import Decimal
 
-from sqlalchemy import Select, func, select
+from sqlalchemy import Select, and_, or_, select
 from sqlalchemy.orm import Session
 
 from app.models.expense import Expense
-from app.schemas.expense import ExpenseCreate, ExpenseUpdate
+from app.schemas.expense import CountStrategy, ExpenseCreate, ExpenseUpdate
+from app.services.analytics import apply_rollup_deltas, expense_deltas, rollup_entry
+from app.services.expense_counts import count_expenses, expense_count_cache
 
 
 def create_expense(db: Session, payload: ExpenseCreate) -> Expense:
     """Crea una spesa a DB e ritorna l'oggetto persistito."""
     expense = Expense(**payload.model_dump()) # Converte in dict il model ExpenseCreate
     db.add(expense) # Lo mette in pending nella session
+    apply_rollup_deltas(db, expense_deltas(new=rollup_entry(expense))) # Rollup nella stessa transazione
     db.commit() # Esegue insert su DB e rende persistente la riga
     db.refresh(expense) # Ricarica da DB
+    expense_count_cache.bump()
     return expense
 
 
@@ -56,6 +62,38 @@ def _apply_filters(
     return stmt
 
 
+def encode_cursor(expense: Expense) -> str:
+    """Cursore opaco della pagina successiva: (expense_date, id) dell'ultima riga restituita."""
+    raw = f"{expense.expense_date.isoformat()}|{expense.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[date, int]:
+    """Decodifica un cursore di encode_cursor. ValueError se non valido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        day, expense_id = raw.split("|")
+        return date.fromisoformat(day), int(expense_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def _seek_after(stmt: Select, after: tuple[date, int]) -> Select:
+    """
+    Predicato di seek per l'ordinamento (expense_date desc, id desc): righe strettamente "dopo" il
+    cursore. Scritto come OR esplicito (non tuple_) così funziona uguale su SQLite e Postgres;
+    `expense_date <= day` è ridondante ma dà al planner il limite del range sull'indice.
+    """
+    day, expense_id = after
+    return stmt.where(
+        Expense.expense_date <= day,
+        or_(
+            Expense.expense_date < day,
+            and_(Expense.expense_date == day, Expense.id < expense_id),
+        ),
+    )
+
+
 def list_expenses(
     db: Session,
     *,
@@ -69,27 +107,38 @@ def list_expenses(
     max_amount: Decimal | None,
     limit: int,
     offset: int,
-) -> tuple[list[Expense], int]:
-    """Lista paginata + total count (per UI e per evaluation)."""
+    after: tuple[date, int] | None = None,
+    count: CountStrategy = "exact",
+) -> tuple[list[Expense], int, CountStrategy]:
+    """
+    Lista paginata + total count (per UI e per evaluation) + strategia usata per il total.
+
+    Con `after` (cursore decodificato) la pagina parte subito dopo quella riga (keyset): il costo non
+    cresce con la profondità come con OFFSET. Il total resta quello dei soli filtri.
+    """
+    cache_version = expense_count_cache.version
+    filters = {
+        "date_from": date_from,
+        "date_to": date_to,
+        "merchant": merchant,
+        "category": category,
+        "source": source,
+        "needs_review": needs_review,
+        "min_amount": min_amount,
+        "max_amount": max_amount,
+    }
     base_stmt = select(Expense).order_by(Expense.expense_date.desc(), Expense.id.desc())
-    base_stmt = _apply_filters(
-        base_stmt,
-        date_from=date_from,
-        date_to=date_to,
-        merchant=merchant,
-        category=category,
-        source=source,
-        needs_review=needs_review,
-        min_amount=min_amount,
-        max_amount=max_amount,
-    )
-
-    count_stmt = select(func.count()).select_from(base_stmt.subquery())
-    total = int(db.scalar(count_stmt) or 0)
+    base_stmt = _apply_filters(base_stmt, **filters)
 
-    items_stmt = base_stmt.limit(limit).offset(offset)
+    items_stmt = base_stmt if after is None else _seek_after(base_stmt, after)
+    items_stmt = items_stmt.limit(limit).offset(offset)
     items = list(db.scalars(items_stmt).all())
-    return items, total # Lista paginata di expenses e numero di righe che matchano i filtri
+
+    if after is None and len(items) < limit and (items or offset == 0):
+        # Ultima pagina in modalità offset: il total è noto senza count
+        return items, offset + len(items), "exact"
+    total, used = count_expenses(db, base_stmt, filters, count, cache_version=cache_version)
+    return items, total, used # Lista paginata di expenses, righe che matchano i filtri, strategia del total
 
 
 def get_expense(db: Session, expense_id: int) -> Expense | None:
@@ -103,13 +152,16 @@ def update_expense(db: Session, expense_id: int, payload: ExpenseUpdate) -> Expe
     if expense is None:
         return None
 
+    before = rollup_entry(expense)
     data = payload.model_dump(exclude_unset=True)
     for field, value in data.items():
         setattr(expense, field, value)
 
     db.add(expense)
+    apply_rollup_deltas(db, expense_deltas(old=before, new=rollup_entry(expense)))
     db.commit()
     db.refresh(expense)
+    expense_count_cache.bump()
     return expense
 
 
@@ -120,5 +172,7 @@ def delete_expense(db: Session, expense_id: int) -> bool:
         return False
 
     db.delete(expense)
+    apply_rollup_deltas(db, expense_deltas(old=rollup_entry(expense)))
     db.commit()
+    expense_count_cache.bump()
     return True
@@ -1,25 +1,109 @@
 from __future__ import annotations
 
 import json
+import logging
+import threading
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path as SysPath
+from typing import Any
 
+from sqlalchemy import delete, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
-from app.extraction.rule_v0 import extract_fields_rule_v0
+from app.extraction.registry import Extractor, get_extractor
+from app.extraction.rule_v0 import OcrPage, load_ocr_pages
 from app.models.document import Document
+from app.models.document_extraction import DocumentExtraction
+from app.ocr.artifact import OCR_ARTIFACT_FILENAME, OcrArtifact
 from app.schemas.extraction import DocumentExtractionResponse, Evidence, ExtractedField
 
+logger = logging.getLogger(__name__)
+
+
+def primary_extraction_version() -> str:
+    """Versione dell'estrattore che risponde alle request (chiave dei risultati salvati)."""
+    return settings.extraction_primary
+
+
+def get_stored_extraction(db: Session, document_id: str, *, version: str) -> DocumentExtraction | None:
+    stmt = select(DocumentExtraction).where(
+        DocumentExtraction.document_id == document_id,
+        DocumentExtraction.extraction_version == version,
+    )
+    return db.scalars(stmt).first()
+
+
+def invalidate_extractions(db: Session, document_id: str) -> None:
+    """Elimina i risultati salvati (tutte le versioni): da chiamare quando l'OCR del documento cambia. Non fa commit."""
+    db.execute(delete(DocumentExtraction).where(DocumentExtraction.document_id == document_id))
+
+
+def _store_extraction(
+    db: Session,
+    res: DocumentExtractionResponse,
+    *,
+    latency_ms: float | None,
+    ocr_fingerprint: str,
+    extractor_fingerprint: str,
+    shadow: bool = False,
+) -> None:
+    """Salva (o aggiorna, se obsoleto) il risultato per documento/versione, con i fingerprint degli input."""
+    row = get_stored_extraction(db, res.document_id, version=res.extraction_version)
+    if row is None:
+        row = DocumentExtraction(document_id=res.document_id, extraction_version=res.extraction_version)
+    row.payload_json = res.model_dump_json()
+    row.latency_ms = latency_ms
+    row.shadow = shadow
+    row.ocr_fingerprint = ocr_fingerprint
+    row.extractor_fingerprint = extractor_fingerprint
+    db.add(row)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Salvato nel frattempo da una richiesta concorrente: il risultato è lo stesso
+        db.rollback()
+
+
+def is_stale(row: DocumentExtraction, doc: Document, extractor: Extractor) -> bool:
+    """True se il risultato non corrisponde all'OCR corrente del documento o alla revisione dell'estrattore."""
+    return row.extractor_fingerprint != extractor.fingerprint or row.ocr_fingerprint != doc.ocr_fingerprint
+
+
+def run_extractor(
+    extractor: Extractor, document_id: str, pages: list[OcrPage]
+) -> tuple[DocumentExtractionResponse, float]:
+    """Esegue un estrattore sulle pagine già caricate: (response, latenza in ms)."""
+    started = time.perf_counter()
+    out = extractor(pages)
+    latency_ms = (time.perf_counter() - started) * 1000
+    return build_extraction_response(document_id, out, version=extractor.version), latency_ms
+
 
 def extract_fields_for_document(db: Session, document_id: str) -> DocumentExtractionResponse | None:
+    """
+    Estrazione campi di un documento processato con l'estrattore primario. Il risultato viene salvato
+    in document_extractions (uno per documento/versione) e riletto da lì finché il documento non viene
+    ri-processato. Gli estrattori in shadow mode girano in background sulle stesse pagine.
+    """
     doc = db.get(Document, document_id)
     if doc is None:
         return None
 
+    primary = get_extractor(primary_extraction_version())
+    stored = get_stored_extraction(db, doc.id, version=primary.version)
+    if stored is not None and doc.status == "processed" and not is_stale(stored, doc, primary):
+        return DocumentExtractionResponse.model_validate_json(stored.payload_json)
+
     if doc.status != "processed" or not doc.ocr_json_path:
         # non pronto
         return DocumentExtractionResponse(
             document_id=doc.id,
+            extraction_version=primary.version,
             needs_review=True,
             fields={
                 "total": ExtractedField(value=None, confidence=0.0),
@@ -29,16 +113,125 @@ def extract_fields_for_document(db: Session, document_id: str) -> DocumentExtrac
             },
         )
 
-    # Path assoluto al JSON OCR (compatibilità: vecchi record con prefisso "data\\...")
-    p = SysPath(doc.ocr_json_path)
+    pages = load_ocr_pages(load_ocr_source(resolve_ocr_json_path(doc.ocr_json_path)))
+    res, latency_ms = run_extractor(primary, doc.id, pages)
+    _store_extraction(
+        db, res, latency_ms=latency_ms,
+        ocr_fingerprint=doc.ocr_fingerprint, extractor_fingerprint=primary.fingerprint,
+    )
+
+    shadow_versions = [v for v in settings.extraction_shadow if v != primary.version]
+    if shadow_versions:
+        shadow_runner.submit(db.get_bind(), res, pages, shadow_versions, ocr_fingerprint=doc.ocr_fingerprint)
+    return res
+
+
+def changed_fields(a: DocumentExtractionResponse, b: DocumentExtractionResponse) -> list[str]:
+    """Campi con valore diverso tra due risultati (per confrontare shadow e primario)."""
+    def value(res: DocumentExtractionResponse, key: str) -> str | None:
+        field = res.fields.get(key)
+        return field.value if field is not None else None
+
+    return sorted(k for k in a.fields.keys() | b.fields.keys() if value(a, k) != value(b, k))
+
+
+class ShadowExtractionRunner:
+    """
+    Esecuzione in background degli estrattori in shadow mode, su un pool di thread dedicato:
+    la latenza della request non cambia. Output e latenza finiscono in document_extractions
+    (shadow=True); le differenze rispetto al primario vengono loggate.
+    """
+
+    def __init__(self, *, max_workers: int) -> None:
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Lazy, come la coda OCR: dopo shutdown() si può riusare
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="extraction-shadow",
+                )
+            return self._executor
+
+    def submit(
+        self,
+        bind: Engine | Connection,
+        primary: DocumentExtractionResponse,
+        pages: list[OcrPage],
+        versions: Sequence[str],
+        *,
+        ocr_fingerprint: str,
+    ) -> None:
+        executor = self._get_executor()
+        for version in versions:
+            executor.submit(self._run, bind, primary, pages, version, ocr_fingerprint)
+
+    def _run(
+        self,
+        bind: Engine | Connection,
+        primary: DocumentExtractionResponse,
+        pages: list[OcrPage],
+        version: str,
+        ocr_fingerprint: str,
+    ) -> None:
+        try:
+            extractor = get_extractor(version)
+            res, latency_ms = run_extractor(extractor, primary.document_id, pages)
+            with Session(bind=bind) as session:
+                _store_extraction(
+                    session, res, latency_ms=latency_ms, shadow=True,
+                    ocr_fingerprint=ocr_fingerprint, extractor_fingerprint=extractor.fingerprint,
+                )
+        except Exception:
+            # lo shadow non deve mai avere effetti sul primario
+            logger.exception("Shadow extraction failed version=%s document=%s", version, primary.document_id)
+            return
+
+        logger.info(
+            "Shadow extraction version=%s document=%s latency_ms=%.2f changed_fields=%s",
+            version, primary.document_id, latency_ms, changed_fields(primary, res),
+        )
+
+    def shutdown(self, *, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+shadow_runner = ShadowExtractionRunner(max_workers=settings.extraction_shadow_workers)
+
+
+def resolve_ocr_json_path(ocr_json_path: str) -> SysPath:
+    """Path assoluto al JSON OCR (compatibilità: vecchi record con prefisso "data\\...")."""
+    p = SysPath(ocr_json_path)
     if str(p).lower().startswith("data\\") or str(p).lower().startswith("data/"):
-        abs_json = settings.storage_path.parent / p
-    else:
-        abs_json = settings.storage_path / p
+        return settings.storage_path.parent / p
+    return settings.storage_path / p
+
+
+def load_ocr_source(json_path: SysPath) -> dict[str, Any] | OcrArtifact:
+    """
+    Input per l'estrattore: l'artefatto colonnare accanto al JSON se c'è (mmap, niente parsing),
+    altrimenti il JSON (documenti processati prima dell'artefatto o con l'artefatto disabilitato).
+    """
+    artifact_path = json_path.with_name(OCR_ARTIFACT_FILENAME)
+    if artifact_path.exists():
+        try:
+            return OcrArtifact.open(artifact_path)
+        except (OSError, ValueError):
+            pass
+    return json.loads(json_path.read_text(encoding="utf-8"))
 
-    ocr_json = json.loads(abs_json.read_text(encoding="utf-8"))
-    out = extract_fields_rule_v0(ocr_json)
 
+def build_extraction_response(
+    document_id: str, out: dict[str, Any], *, version: str
+) -> DocumentExtractionResponse:
+    """Converte l'output di un estrattore nella response (e nel payload salvato a DB)."""
     fields: dict[str, ExtractedField] = {}
     for k, v in out["fields"].items():
         ev = v.get("evidence")
@@ -54,7 +247,8 @@ def extract_fields_for_document(db: Session, document_id: str) -> DocumentExtrac
         )
 
     return DocumentExtractionResponse(
-        document_id=doc.id,
+        document_id=document_id,
+        extraction_version=version,
         needs_review=bool(out["needs_review"]),
         fields=fields,
     )
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from datetime import UTC, datetime
+from typing import Any
+from uuid import uuid4
+
+from sqlalchemy import select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.document import Document
+from app.services import documents as documents_svc
+
+# Stati "attivi": il documento è già in coda o in lavorazione
+ACTIVE_STATUSES = ("queued", "running")
+
+
+@dataclass
+class OcrJob:
+    job_id: str
+    document_id: str
+    # queued -> running -> processed | failed (stessi valori di Document.status)
+    status: str = "queued"
+    created_at: datetime = field(default_factory=lambda: datetime.now(UTC))
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    error_message: str | None = None
+
+
+class OcrJobQueue:
+    """
+    Coda locale di job OCR servita da un pool di thread.
+
+    - l'endpoint fa solo enqueue (latenza costante, indipendente dall'OCR in coda)
+    - ogni worker apre una propria Session sullo stesso engine DB della request
+    - tutti i worker condividono un'unica istanza dell'engine OCR
+    - il registro dei job è in memoria e limitato a `max_history` voci:
+      lo stato persistente resta comunque su Document.status
+    - i job non sopravvivono al processo: all'avvio recover() rimette in coda i documenti rimasti
+      queued/running, e shutdown() scarta i job non ancora partiti (ripresi dal recover successivo)
+    """
+
+    def __init__(self, *, max_workers: int, max_history: int = 1000) -> None:
+        self.max_workers = max_workers
+        self.max_history = max_history
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict[str, OcrJob] = OrderedDict()
+        self._active_by_document: dict[str, str] = {}
+        self._executor: ThreadPoolExecutor | None = None
+        self._engine: Any = None
+
+    def _get_engine(self) -> Any:
+        # Un solo engine condiviso da tutti i worker (gli engine sono thread-safe:
+        # subprocess è stateless, tesserocr ha il proprio pool di handle)
+        with self._lock:
+            if self._engine is None:
+                self._engine = documents_svc.create_ocr_engine()
+            return self._engine
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Creato in modo lazy: dopo shutdown() la coda può essere riusata
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="ocr-job",
+            )
+        return self._executor
+
+    def enqueue(self, db: Session, document_id: str, *, mark_queued: bool = True) -> OcrJob | None:
+        """
+        Mette in coda l'OCR di un documento e ritorna il job (None se il documento non esiste).
+        Se il documento ha già un job attivo, ritorna quello (enqueue idempotente).
+        """
+        return self.enqueue_many(db, [document_id], mark_queued=mark_queued).get(document_id)
+
+    def enqueue_many(
+        self, db: Session, document_ids: Sequence[str], *, mark_queued: bool = True
+    ) -> dict[str, OcrJob]:
+        """
+        Enqueue di più documenti con una sola query e un solo commit.
+        Ritorna document_id -> job; i documenti inesistenti non compaiono nel risultato.
+        Con mark_queued=False Document.status non cambia finché l'OCR non parte ("running"):
+        un documento già processato resta leggibile, e se il job si perde resta com'era.
+        """
+        unique_ids = list(dict.fromkeys(document_ids))
+        if not unique_ids:
+            return {}
+        docs = db.scalars(select(Document).where(Document.id.in_(unique_ids))).all()
+
+        jobs: dict[str, OcrJob] = {}
+        new_job_ids: list[str] = []
+        with self._lock:
+            for doc in docs:
+                active_id = self._active_by_document.get(doc.id)
+                if active_id is not None and active_id in self._jobs:
+                    jobs[doc.id] = replace(self._jobs[active_id])
+                    continue
+
+                job = OcrJob(job_id=str(uuid4()), document_id=doc.id)
+                self._jobs[job.job_id] = job
+                self._active_by_document[doc.id] = job.job_id
+                jobs[doc.id] = replace(job)
+                new_job_ids.append(job.job_id)
+
+                if mark_queued:
+                    doc.status = "queued"
+                    doc.error_message = None
+                    db.add(doc)
+            self._prune_locked()
+
+        db.commit()
+
+        executor = self._get_executor()
+        bind = db.get_bind()
+        for job_id in new_job_ids:
+            executor.submit(self._run, job_id, bind)
+        return jobs
+
+    def recover(self, db: Session, *, batch_size: int = 500) -> int:
+        """
+        Rimette in coda i documenti rimasti "queued"/"running" senza un job in questo processo
+        (job persi con un riavvio o un crash). Da chiamare all'avvio; ritorna i documenti ripresi.
+        """
+        recovered = 0
+        last_id = ""
+        while True:
+            ids = db.scalars(
+                select(Document.id)
+                .where(Document.status.in_(ACTIVE_STATUSES), Document.id > last_id)
+                .order_by(Document.id)
+                .limit(batch_size)
+            ).all()
+            if not ids:
+                return recovered
+            last_id = ids[-1]
+            with self._lock:
+                orphans = [d for d in ids if d not in self._active_by_document]
+            recovered += len(self.enqueue_many(db, orphans))
+
+    def is_active(self, document_id: str) -> bool:
+        """True se il documento ha un job in coda o in corso in questo processo."""
+        with self._lock:
+            return document_id in self._active_by_document
+
+    def active_count(self) -> int:
+        """Job in coda o in corso in questo processo."""
+        with self._lock:
+            return len(self._active_by_document)
+
+    def get(self, job_id: str) -> OcrJob | None:
+        """Snapshot del job (copia, per non esporre lo stato mutabile del worker)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return replace(job) if job is not None else None
+
+    def shutdown(self, *, wait: bool = True) -> None:
+        """
+        Ferma il pool: con wait aspetta solo i job in corso, quelli ancora in coda vengono scartati
+        (il documento resta "queued" a DB e viene ripreso da recover() al prossimo avvio).
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.status == "queued":
+                    del self._jobs[job_id]
+                    self._active_by_document.pop(job.document_id, None)
+        self._engine = None
+
+    def _update(self, job_id: str, **changes: object) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            for key, value in changes.items():
+                setattr(job, key, value)
+            if job.status not in ACTIVE_STATUSES:
+                self._active_by_document.pop(job.document_id, None)
+
+    def _prune_locked(self) -> None:
+        # Elimina i job terminati più vecchi oltre max_history (quelli attivi restano)
+        overflow = len(self._jobs) - self.max_history
+        if overflow <= 0:
+            return
+        for job_id in list(self._jobs.keys()):
+            if overflow <= 0:
+                break
+            if self._jobs[job_id].status not in ACTIVE_STATUSES:
+                del self._jobs[job_id]
+                overflow -= 1
+
+    def _run(self, job_id: str, bind: Engine | Connection) -> None:
+        job = self.get(job_id)
+        if job is None:
+            return
+
+        self._update(job_id, status="running", started_at=datetime.now(UTC))
+        try:
+            with Session(bind=bind, autoflush=False, expire_on_commit=False) as session:
+                doc = documents_svc.process_document_ocr(
+                    session, job.document_id, engine=self._get_engine()
+                )
+                if doc is None:
+                    status, error = "failed", "Document not found"
+                else:
+                    status, error = doc.status, doc.error_message
+        except Exception as e:
+            status, error = "failed", f"OCR job failed: {type(e).__name__}: {e}"
+
+        self._update(job_id, status=status, error_message=error, finished_at=datetime.now(UTC))
+
+
+ocr_job_queue = OcrJobQueue(max_workers=settings.ocr_job_workers)
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import ColumnElement, and_, or_, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import InstrumentedAttribute, Session
+
+from app.core.config import settings
+from app.extraction.registry import extractor_versions, get_extractor
+from app.extraction.rule_v0 import load_ocr_pages
+from app.models.document import Document
+from app.models.document_extraction import DocumentExtraction
+from app.ocr.cache import ocr_config_fingerprint
+from app.services.extraction import (
+    _store_extraction,
+    load_ocr_source,
+    primary_extraction_version,
+    resolve_ocr_json_path,
+    run_extractor,
+)
+from app.services.ocr_jobs import ocr_job_queue
+
+"""
+Reconciler in background: trova i risultati obsoleti rispetto alla configurazione corrente
+e rielabora solo quelli, a velocità limitata.
+
+- documenti processati con un fingerprint OCR diverso da quello corrente (engine, preprocessing, ...):
+  OCR rimesso in coda (ocr_job_queue), che invalida anche le estrazioni salvate. Il documento resta
+  "processed" (col vecchio OCR) finché il job non parte, e al massimo `max_pending_ocr` job OCR attivi
+  alla volta: il backlog resta a DB, non in memoria
+- estrazioni con un fingerprint dell'estrattore diverso da quello registrato: ricalcolate sull'OCR salvato
+
+Le righe obsolete si trovano con gli indici (status, ocr_fingerprint) e (extraction_version,
+extractor_fingerprint). Fingerprint "" = provenienza sconosciuta (righe di prima dei fingerprint):
+rielaborate solo con `legacy` (RECONCILE_LEGACY), perché il primo passaggio rifarebbe l'OCR di
+tutto il corpus esistente.
+Lo stato è tutto a DB (una riga rielaborata non è più obsoleta, e sparisce dalla query):
+dopo un riavvio si riparte da dove ci si era fermati.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def _stale(
+    prefix: ColumnElement[bool], column: InstrumentedAttribute[str], current: str, *, legacy: bool
+) -> ColumnElement[bool]:
+    # "prefix AND column != current" scritto come due range completi sull'indice (prefix, column):
+    # SQLite (MULTI-INDEX OR) e Postgres (BitmapOr) li risolvono con due range scan.
+    # Senza legacy il primo range parte dopo "" (provenienza sconosciuta)
+    below = and_(prefix, column < current) if legacy else and_(prefix, column > "", column < current)
+    return or_(below, and_(prefix, column > current))
+
+
+@dataclass
+class ReconcileStats:
+    reocr: int = 0
+    reextracted: int = 0
+    failed: int = 0
+
+    @property
+    def processed(self) -> int:
+        return self.reocr + self.reextracted
+
+
+class StaleReconciler:
+    """
+    Un thread daemon che esegue un passaggio di riconciliazione ogni `interval_s` secondi.
+    Al massimo `max_per_sec` documenti/estrazioni al secondo (OCR in coda + estrazioni), e nuovi OCR
+    solo finché la coda ha meno di `max_pending_ocr` job attivi (contando anche quelli delle request).
+    """
+
+    def __init__(
+        self,
+        *,
+        max_per_sec: float,
+        batch_size: int,
+        interval_s: float,
+        reocr: bool,
+        legacy: bool = False,
+        max_pending_ocr: int = 4,
+    ) -> None:
+        self.max_per_sec = max_per_sec
+        self.batch_size = batch_size
+        self.interval_s = interval_s
+        self.reocr = reocr
+        self.legacy = legacy
+        self.max_pending_ocr = max_pending_ocr
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._next_at = 0.0
+
+    def start(self, bind: Engine | Connection) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(bind,), name="stale-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self, *, wait: bool = True) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None and wait:
+            thread.join()
+
+    def _loop(self, bind: Engine | Connection) -> None:
+        while not self._stop.is_set():
+            try:
+                with Session(bind=bind, autoflush=False, expire_on_commit=False) as db:
+                    stats = self.run_pass(db)
+                if stats.processed or stats.failed:
+                    logger.info(
+                        "Reconcile pass reocr=%s reextracted=%s failed=%s",
+                        stats.reocr, stats.reextracted, stats.failed,
+                    )
+            except Exception:
+                logger.exception("Reconcile pass failed")
+            self._stop.wait(self.interval_s)
+
+    def _throttle(self) -> bool:
+        """Attende il prossimo slot disponibile; False se nel frattempo è stato chiesto lo stop."""
+        now = time.monotonic()
+        if self._next_at > now and self._stop.wait(self._next_at - now):
+            return False
+        self._next_at = max(now, self._next_at) + 1.0 / self.max_per_sec
+        return not self._stop.is_set()
+
+    def _wait_ocr_slot(self, poll_s: float = 0.5) -> bool:
+        """Attende che la coda OCR scenda sotto max_pending_ocr; False se è stato chiesto lo stop."""
+        while ocr_job_queue.active_count() >= self.max_pending_ocr:
+            if self._stop.wait(poll_s):
+                return False
+        return not self._stop.is_set()
+
+    def run_pass(self, db: Session) -> ReconcileStats:
+        """Un passaggio completo: prima gli OCR obsoleti, poi le estrazioni obsolete."""
+        stats = ReconcileStats()
+        if self.reocr:
+            self._reocr_stale_documents(db, stats)
+        for version in extractor_versions():
+            self._reextract_stale(db, version, stats)
+        return stats
+
+    def _reocr_stale_documents(self, db: Session, stats: ReconcileStats) -> None:
+        stale = _stale(
+            Document.status == "processed", Document.ocr_fingerprint, ocr_config_fingerprint(), legacy=self.legacy
+        )
+        # Il documento resta "processed" finché l'OCR non parte: resta tra gli obsoleti, quindi
+        # keyset su id (un passaggio lo vede una volta sola) e salto di quelli già in coda.
+        # Se il job si perde (riavvio prima che parta) il documento è ancora obsoleto e viene ripreso
+        last_id = ""
+        while True:
+            ids = db.scalars(
+                select(Document.id)
+                .where(stale, Document.id > last_id)
+                .order_by(Document.id)
+                .limit(self.batch_size)
+            ).all()
+            if not ids:
+                return
+            last_id = ids[-1]
+            for document_id in ids:
+                if ocr_job_queue.is_active(document_id):
+                    continue
+                if not self._wait_ocr_slot() or not self._throttle():
+                    return
+                ocr_job_queue.enqueue(db, document_id, mark_queued=False)
+                stats.reocr += 1
+
+    def _reextract_stale(self, db: Session, version: str, stats: ReconcileStats) -> None:
+        extractor = get_extractor(version)
+        shadow = version != primary_extraction_version()
+        stale = _stale(
+            DocumentExtraction.extraction_version == version,
+            DocumentExtraction.extractor_fingerprint,
+            extractor.fingerprint,
+            legacy=self.legacy,
+        )
+        skipped: set[int] = set()  # falliti in questo passaggio (o documento non processato)
+        while True:
+            stmt = select(DocumentExtraction.id, DocumentExtraction.document_id).where(stale)
+            if skipped:
+                stmt = stmt.where(DocumentExtraction.id.not_in(skipped))
+            rows = db.execute(stmt.limit(self.batch_size)).all()
+            if not rows:
+                return
+            docs = {
+                d.id: d
+                for d in db.execute(
+                    select(Document.id, Document.ocr_json_path, Document.ocr_fingerprint).where(
+                        Document.id.in_([document_id for _, document_id in rows]),
+                        Document.status == "processed",
+                        Document.ocr_json_path.is_not(None),
+                    )
+                ).all()
+            }
+            for row_id, document_id in rows:
+                doc = docs.get(document_id)
+                if doc is None or ocr_job_queue.is_active(document_id):
+                    # OCR in coda, in corso o fallito: il risultato verrà invalidato o ricalcolato dopo l'OCR
+                    skipped.add(row_id)
+                    continue
+                if not self._throttle():
+                    return
+                try:
+                    pages = load_ocr_pages(load_ocr_source(resolve_ocr_json_path(doc.ocr_json_path)))
+                    res, latency_ms = run_extractor(extractor, document_id, pages)
+                except Exception:
+                    # saltato in questo passaggio, riprovato al prossimo
+                    logger.exception("Reconcile extraction failed version=%s document=%s", version, document_id)
+                    skipped.add(row_id)
+                    stats.failed += 1
+                    continue
+                _store_extraction(
+                    db, res, latency_ms=latency_ms, shadow=shadow,
+                    ocr_fingerprint=doc.ocr_fingerprint, extractor_fingerprint=extractor.fingerprint,
+                )
+                stats.reextracted += 1
+
+
+stale_reconciler = StaleReconciler(
+    max_per_sec=settings.reconcile_max_per_sec,
+    batch_size=settings.reconcile_batch_size,
+    interval_s=settings.reconcile_interval_s,
+    reocr=settings.reconcile_reocr,
+    legacy=settings.reconcile_legacy,
+    max_pending_ocr=settings.reconcile_max_pending_ocr,
+)
@@ -2,9 +2,15 @@ from __future__ import annotations
 
 import hashlib
 import json
+import mimetypes
+import os
+import shutil
+import tarfile
+import zipfile
+from collections.abc import Callable, Iterator
 from datetime import UTC, datetime
 from pathlib import Path
-from typing import Any
+from typing import Any, BinaryIO
 from uuid import uuid4
 
 from fastapi import UploadFile
@@ -12,33 +18,171 @@ from fastapi import UploadFile
 ALLOWED_MIME_PREFIXES = ("image/",)
 ALLOWED_MIME_EXACT = ("application/pdf",)
 
+# Scrittura a chunk da 1MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Lookup per la dedup: sha256 -> (document_id, stored_relative_path) di un documento già salvato
+DuplicateLookup = Callable[[str], tuple[str, str] | None]
+
+
+# Archivi accettati dal bulk upload (riconosciuti da mime o estensione)
+ARCHIVE_MIME_TYPES = (
+    "application/zip",
+    "application/x-zip-compressed",
+    "application/x-tar",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-gtar",
+)
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz")
+
+
+class UploadTooLarge(Exception):
+    """Lo stream supera il limite di byte: il documento parzialmente scritto è già stato rimosso."""
+
+    def __init__(self, max_bytes: int) -> None:
+        super().__init__(f"File too large: max {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
 
 def is_allowed_mime(mime_type: str) -> bool:
     return mime_type.startswith(ALLOWED_MIME_PREFIXES) or mime_type in ALLOWED_MIME_EXACT
 
 
+def is_archive(filename: str | None, mime_type: str | None) -> bool:
+    if mime_type in ARCHIVE_MIME_TYPES:
+        return True
+    return (filename or "").lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def guess_mime_type(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def iter_archive_members(stream: BinaryIO, filename: str | None) -> Iterator[tuple[str, int, BinaryIO]]:
+    """
+    Itera i file di un archivio zip/tar come (nome, dimensione dichiarata, stream), senza estrarli su disco.
+    Il tar viene letto in streaming ("r|*"); lo zip richiede uno stream seekable
+    (UploadFile.file lo è: SpooledTemporaryFile). Cartelle e metadati macOS vengono saltati.
+    La dimensione viene dall'header dell'archivio: i limiti vanno comunque applicati in lettura.
+    """
+    if (filename or "").lower().endswith(".zip") or zipfile.is_zipfile(stream):
+        stream.seek(0)
+        with zipfile.ZipFile(stream) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or _is_hidden_member(info.filename):
+                    continue
+                with zf.open(info) as member:
+                    yield info.filename, info.file_size, member
+        return
+
+    stream.seek(0)
+    with tarfile.open(fileobj=stream, mode="r|*") as tf:
+        for info in tf:
+            if not info.isfile() or _is_hidden_member(info.name):
+                continue
+            member = tf.extractfile(info)
+            if member is None:
+                continue
+            with member:
+                yield info.name, info.size, member
+
+
+def iter_upload_members(upload: UploadFile) -> Iterator[tuple[str, str, int | None, BinaryIO]]:
+    """
+    (filename, mime_type, dimensione se nota, stream) dei file contenuti in un upload: l'upload stesso
+    se è un file singolo, altrimenti i membri dell'archivio (mime dedotto dall'estensione).
+    """
+    if is_archive(upload.filename, upload.content_type):
+        for name, size, member in iter_archive_members(upload.file, upload.filename):
+            yield Path(name).name, guess_mime_type(name), size, member
+        return
+
+    filename = upload.filename or "uploaded_file"
+    yield filename, upload.content_type or guess_mime_type(filename), upload.size, upload.file
+
+
+def discard_saved_document(base_dir: Path, document_id: str) -> None:
+    """Rimuove la cartella di un documento salvato ma mai registrato a DB (rollback del bulk upload)."""
+    shutil.rmtree(base_dir / "documents" / document_id, ignore_errors=True)
+
+
+def _is_hidden_member(name: str) -> bool:
+    return name.startswith("__MACOSX/") or Path(name).name.startswith(".")
+
+
 def ensure_dir(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
 
+def _dedup_stored_file(base_dir: Path, stored_path: Path, existing_rel: str) -> str | None:
+    """
+    Sostituisce la copia appena scritta con un hardlink al file già presente.
+    Se l'hardlink non è possibile (es. filesystem diversi) la copia viene eliminata e si usa
+    direttamente il path esistente (riferimento): in quel caso ritorna il path relativo da salvare.
+    """
+    existing_abs = base_dir / existing_rel
+    tmp = stored_path.with_name(f".{stored_path.name}.tmp")
+    try:
+        os.link(existing_abs, tmp)
+        os.replace(tmp, stored_path)
+        return None
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        stored_path.unlink(missing_ok=True)
+        return existing_rel
+
+
 def save_uploaded_document(
     *,
     base_dir: Path,
     upload: UploadFile,
+    find_duplicate: DuplicateLookup | None = None,
 ) -> dict[str, Any]:
     """
     Salva un UploadFile su disco in:
     base_dir/documents/<uuid>/original.<ext>
     e crea anche metadata.json.
 
+    Dedup (opt-in, se `find_duplicate` è passato): lo sha256 viene calcolato durante lo streaming;
+    se esiste già un documento con gli stessi byte, la copia viene sostituita da un hardlink
+    (o da un riferimento al file esistente) e la response riporta `is_duplicate`/`duplicate_of`.
+
     Ritorna un dizionario con metadati utili per API response.
     """
+    try:
+        return save_document_stream(
+            base_dir=base_dir,
+            stream=upload.file,
+            filename=upload.filename,
+            mime_type=upload.content_type,
+            find_duplicate=find_duplicate,
+        )
+    finally:
+        # Chiudiamo il file upload
+        upload.file.close()
+
+
+def save_document_stream(
+    *,
+    base_dir: Path,
+    stream: BinaryIO,
+    filename: str | None,
+    mime_type: str | None,
+    find_duplicate: DuplicateLookup | None = None,
+    max_bytes: int | None = None,
+) -> dict[str, Any]:
+    """
+    Come save_uploaded_document, ma da un qualsiasi stream binario (es. membro di un archivio).
+    Lo stream viene letto a chunk e non viene chiuso. Oltre `max_bytes` letti la scrittura si
+    interrompe, la cartella del documento viene rimossa e si solleva UploadTooLarge.
+    """
     document_id = str(uuid4())
     doc_dir = base_dir / "documents" / document_id
     ensure_dir(doc_dir)
 
-    original_name = upload.filename or "uploaded_file"
-    mime_type = upload.content_type or "application/octet-stream"
+    original_name = filename or "uploaded_file"
+    mime_type = mime_type or "application/octet-stream"
 
     # Estensione: se manca, usiamo un default in base al mime
     suffix = Path(original_name).suffix
@@ -60,18 +204,28 @@ def save_uploaded_document(
     # Scrittura a chunk per non caricare tutto in RAM
     with stored_path.open("wb") as f:
         while True:
-            chunk = upload.file.read(1024 * 1024)  # 1MB
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
             if not chunk:
                 break
+            size_bytes += len(chunk)
+            if max_bytes is not None and size_bytes > max_bytes:
+                # es. membro di un archivio che si espande molto più del dichiarato
+                break
             f.write(chunk)
             sha256.update(chunk)
-            size_bytes += len(chunk)
-
-    # Chiudiamo il file upload
-    upload.file.close()
+    if max_bytes is not None and size_bytes > max_bytes:
+        discard_saved_document(base_dir, document_id)
+        raise UploadTooLarge(max_bytes)
 
     created_at = datetime.now(UTC).isoformat()
-    stored_rel = Path("documents") / document_id / stored_name
+    stored_rel = str(Path("documents") / document_id / stored_name)
+
+    duplicate_of: str | None = None
+    if find_duplicate is not None:
+        existing = find_duplicate(sha256.hexdigest())
+        if existing is not None and (base_dir / existing[1]).exists():
+            duplicate_of = existing[0]
+            stored_rel = _dedup_stored_file(base_dir, stored_path, existing[1]) or stored_rel
 
     metadata = {
         "document_id": document_id,
@@ -79,8 +233,10 @@ def save_uploaded_document(
         "mime_type": mime_type,
         "size_bytes": size_bytes,
         "sha256": sha256.hexdigest(),
-        "stored_relative_path": str(stored_rel),
+        "stored_relative_path": stored_rel,
         "created_at": created_at,
+        "is_duplicate": duplicate_of is not None,
+        "duplicate_of": duplicate_of,
     }
 
     # Salviamo metadata.json accanto al file
@@ -95,4 +251,6 @@ def save_uploaded_document(
         "sha256": metadata["sha256"],
         "stored_relative_path": metadata["stored_relative_path"],
         "created_at": created_at,
+        "is_duplicate": metadata["is_duplicate"],
+        "duplicate_of": duplicate_of,
     }
@@ -0,0 +1,335 @@
+from __future__ import annotations
+
+import io
+import shutil
+import tempfile
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Any
+
+import cv2
+import numpy as np
+from PIL import Image
+from sqlalchemy import Engine, create_engine, insert
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from starlette.datastructures import Headers, UploadFile
+
+from app.extraction.rule_v0 import extract_fields_rule_v0, load_ocr_pages
+from app.models.base import Base
+from app.models.expense import Expense
+from app.ocr.artifact import OcrArtifact, write_ocr_artifact
+from app.ocr.preprocess import preprocess_for_tesseract
+from app.services.analytics import rebuild_rollups, summarize
+from app.services.expense_import import import_expenses
+from app.services.expenses import list_expenses
+from app.storage import save_uploaded_document
+
+"""
+Casi del benchmark: fixture sintetiche e deterministiche (seed fisso), niente rete né Tesseract,
+DB SQLite in memoria. `scale` riduce le dimensioni delle fixture (es. 0.01 nei test).
+
+Ogni caso ha un setup (non misurato) che prepara lo stato e una funzione misurata che lo usa.
+"""
+
+SEED = 1234
+
+
+@dataclass(frozen=True)
+class BenchCase:
+    name: str
+    # setup(scale) -> (stato, unità di lavoro per esecuzione, nome dell'unità)
+    setup: Callable[[float], tuple[Any, int, str]]
+    run: Callable[[Any], Any]
+    teardown: Callable[[Any], None] | None = None
+
+
+def _scaled(n: int, scale: float) -> int:
+    return max(1, int(n * scale))
+
+
+# --- Preprocessing ------------------------------------------------------------
+
+def _receipt_image(scale: float) -> Image.Image:
+    # Scontrino sintetico (A4 a 150 dpi a scala 1), ruotato di 3 gradi per far lavorare il deskew
+    h, w = max(64, int(1754 * scale**0.5)), max(64, int(1240 * scale**0.5))
+    page = np.full((h, w), 235, dtype=np.uint8)
+    rng = np.random.default_rng(SEED)
+    font = max(0.3, w / 1240 * 1.1)
+    for i, y in enumerate(range(int(40 * font), h - 20, max(12, int(42 * font)))):
+        text = f"{i:03d} ARTICOLO {rng.integers(0, 100):02d} {rng.integers(0, 100)},{rng.integers(0, 100):02d} EUR"
+        cv2.putText(page, text, (int(30 * font), y), cv2.FONT_HERSHEY_SIMPLEX, font, 25, 2, cv2.LINE_AA)
+    page = cv2.add(page, rng.integers(0, 12, page.shape, dtype=np.uint8))  # rumore
+    m = cv2.getRotationMatrix2D((w // 2, h // 2), 3.0, 1.0)
+    page = cv2.warpAffine(page, m, (w, h), borderMode=cv2.BORDER_REPLICATE)
+    return Image.fromarray(page).convert("RGB")
+
+
+def _setup_preprocess(scale: float) -> tuple[Any, int, str]:
+    return _receipt_image(scale), 1, "pages"
+
+
+# --- OCR JSON / estrazione ----------------------------------------------------
+
+def synthetic_ocr_json(n_lines: int, tokens_per_line: int = 8, pages: int = 2) -> dict[str, Any]:
+    """Payload OCR con n_lines righe per pagina (token con bbox/confidence/line_key) e layout."""
+    rng = np.random.default_rng(SEED)
+    words = ["ARTICOLO", "PANE", "LATTE", "IVA", "SCONTO", "EUR", "TOTALE", "CONTANTI", "RESTO", "X"]
+    out_pages = []
+    for p in range(1, pages + 1):
+        items: list[dict[str, Any]] = []
+        lines_text: list[str] = []
+        layout_lines: list[dict[str, Any]] = []
+        for ln in range(n_lines):
+            start = len(items)
+            texts = [str(rng.choice(words)) for _ in range(tokens_per_line - 1)]
+            texts.append(f"{rng.integers(0, 500)},{rng.integers(0, 100):02d}")
+            if ln == n_lines - 3:
+                texts[0] = "TOTALE"
+            y = 10 + ln * 14
+            for k, text in enumerate(texts):
+                items.append(
+                    {
+                        "text": text,
+                        "confidence": round(float(rng.uniform(0.5, 0.99)), 2),
+                        "bbox": [10 + k * 60, y, 60 + k * 60, y + 12],
+                        "line_key": f"{p}:1:1:{ln + 1}",
+                    }
+                )
+            lines_text.append(" ".join(texts))
+            layout_lines.append(
+                {
+                    "key": [1, 1, ln + 1],
+                    "bbox": [10, y, 60 + (tokens_per_line - 1) * 60, y + 12],
+                    "confidence": 0.8,
+                    "tokens": [start, len(items)],
+                }
+            )
+        lines_text[1] = "03/03/2024"
+        out_pages.append(
+            {
+                "page_index": p,
+                "full_text": "\n".join(lines_text),
+                "items": items,
+                "layout": {
+                    "lines": layout_lines,
+                    "blocks": [{"block": 1, "bbox": [10, 10, 500, 10 + n_lines * 14], "confidence": 0.8,
+                                "lines": [0, n_lines]}],
+                },
+                "timings_ms": {"ocr": 1.0},
+            }
+        )
+    return {"engine": "tesseract", "pages": out_pages, "metrics": {"pages": pages}}
+
+
+def _setup_ocr_json(scale: float) -> tuple[Any, int, str]:
+    payload = synthetic_ocr_json(_scaled(2500, scale))
+    tokens = sum(len(p["items"]) for p in payload["pages"])
+    return payload, tokens, "tokens"
+
+
+@dataclass
+class _ArtifactState:
+    tmpdir: Path
+    path: Path
+
+
+def _setup_artifact(scale: float) -> tuple[Any, int, str]:
+    payload, tokens, unit = _setup_ocr_json(scale)
+    tmpdir = Path(tempfile.mkdtemp(prefix="bench-artifact-"))
+    path = tmpdir / "ocr_result.ocrc"
+    write_ocr_artifact(path, payload)
+    return _ArtifactState(tmpdir=tmpdir, path=path), tokens, unit
+
+
+# --- Spese ----------------------------------------------------------------------
+
+@dataclass
+class _ExpensesState:
+    session: Session
+    filters: dict[str, Any]
+
+
+def populate_expenses(engine: Engine, n: int) -> None:
+    """Inserisce n spese sintetiche (seed fisso) in una tabella expenses già creata."""
+    rng = np.random.default_rng(SEED)
+    merchants = ["Coop", "Esselunga", "Conad", "Bar Sport", "Trattoria Il Gabbiano", "Amazon", "Trenitalia"]
+    categories = ["food", "transport", "restaurant", "shopping", None]
+    start = date(2020, 1, 1)
+    days = rng.integers(0, 365 * 5, n)
+    amounts = rng.integers(100, 50_000, n)
+    merchant_idx = rng.integers(0, len(merchants), n)
+    category_idx = rng.integers(0, len(categories), n)
+    review = rng.random(n) < 0.1
+    with engine.begin() as conn:
+        for lo in range(0, n, 10_000):
+            conn.execute(
+                insert(Expense),
+                [
+                    {
+                        "amount": Decimal(int(amounts[i])) / 100,
+                        "currency": "EUR",
+                        "expense_date": start + timedelta(days=int(days[i])),
+                        "merchant": merchants[merchant_idx[i]],
+                        "category": categories[category_idx[i]],
+                        "source": "manual" if i % 3 else "ocr",
+                        "needs_review": bool(review[i]),
+                    }
+                    for i in range(lo, min(n, lo + 10_000))
+                ],
+            )
+
+
+def _expenses_db(scale: float) -> tuple[Session, int]:
+    engine = create_engine(
+        "sqlite+pysqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    n = _scaled(120_000, scale)
+    populate_expenses(engine, n)
+    return Session(bind=engine), n
+
+
+_NO_FILTERS: dict[str, Any] = {
+    "date_from": None,
+    "date_to": None,
+    "merchant": None,
+    "category": None,
+    "source": None,
+    "needs_review": None,
+    "min_amount": None,
+    "max_amount": None,
+}
+
+
+def _expenses_setup(**overrides: Any) -> Callable[[float], tuple[Any, int, str]]:
+    def setup(scale: float) -> tuple[Any, int, str]:
+        session, n = _expenses_db(scale)
+        filters = {**_NO_FILTERS, "limit": 50, "offset": 0, **overrides}
+        if filters["offset"] == "deep":
+            filters["offset"] = max(0, n - 1000)
+        if filters.get("after") == "deep":
+            # stessa profondità di list_deep_offset, raggiunta con il cursore
+            filters["after"] = None
+            deep = list_expenses(session, **{**filters, "offset": max(0, n - 1001), "limit": 1})[0]
+            filters["after"] = (deep[0].expense_date, deep[0].id) if deep else None
+        return _ExpensesState(session=session, filters=filters), 1, "queries"
+
+    return setup
+
+
+def _close_expenses(state: _ExpensesState) -> None:
+    bind = state.session.get_bind()
+    state.session.close()
+    bind.dispose()
+
+
+def _setup_analytics(scale: float) -> tuple[Any, int, str]:
+    session, _n = _expenses_db(scale)
+    rebuild_rollups(session)
+    return _ExpensesState(session=session, filters={}), 1, "queries"
+
+
+def _run_analytics(state: _ExpensesState) -> Any:
+    return summarize(state.session, group_by=["month", "category"], month_from=date(2022, 1, 1))
+
+
+def _setup_import(scale: float) -> tuple[Any, int, str]:
+    # Export bancario sintetico in CSV (righe valide, qualche campo vuoto)
+    n = _scaled(50_000, scale)
+    rng = np.random.default_rng(SEED)
+    lines = ["amount,currency,expense_date,merchant,category,source"]
+    for i in range(n):
+        day = date(2024, 1, 1) + timedelta(days=int(rng.integers(0, 365)))
+        lines.append(f"{rng.integers(100, 50_000) / 100:.2f},EUR,{day},Merchant {i % 500},{'food' if i % 3 else ''},bank")
+    return ("\n".join(lines) + "\n").encode(), n, "rows"
+
+
+def _run_import(data: bytes) -> None:
+    engine = create_engine("sqlite+pysqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    with Session(bind=engine) as db:
+        result = import_expenses(db, io.BytesIO(data), "csv")
+    engine.dispose()
+    assert result.failed == 0
+
+
+# --- Upload ---------------------------------------------------------------------
+
+@dataclass
+class _UploadState:
+    tmpdir: Path
+    data: bytes
+
+
+def _setup_upload(scale: float) -> tuple[Any, int, str]:
+    size = _scaled(32 * 1024 * 1024, scale)
+    data = np.random.default_rng(SEED).integers(0, 256, size, dtype=np.uint8).tobytes()
+    return _UploadState(tmpdir=Path(tempfile.mkdtemp(prefix="bench-upload-")), data=data), max(1, size // 1024), "KiB"
+
+
+def _run_upload(state: _UploadState) -> None:
+    upload = UploadFile(
+        file=io.BytesIO(state.data),
+        filename="receipt.pdf",
+        headers=Headers({"content-type": "application/pdf"}),
+    )
+    saved = save_uploaded_document(base_dir=state.tmpdir, upload=upload)
+    shutil.rmtree(state.tmpdir / "documents" / saved["document_id"])
+
+
+def _remove_tmpdir(state: _UploadState | _ArtifactState) -> None:
+    shutil.rmtree(state.tmpdir, ignore_errors=True)
+
+
+CASES: dict[str, BenchCase] = {
+    case.name: case
+    for case in [
+        BenchCase("preprocess.default", _setup_preprocess, lambda img: preprocess_for_tesseract(img, profile="default")),
+        BenchCase("preprocess.fast", _setup_preprocess, lambda img: preprocess_for_tesseract(img, profile="fast")),
+        BenchCase("ocr_pages.load_json", _setup_ocr_json, load_ocr_pages),
+        BenchCase("rule_v0.extract_json", _setup_ocr_json, extract_fields_rule_v0),
+        BenchCase(
+            "rule_v0.extract_artifact",
+            _setup_artifact,
+            lambda st: extract_fields_rule_v0(OcrArtifact.open(st.path)),
+            teardown=_remove_tmpdir,
+        ),
+        BenchCase(
+            "expenses.list_first_page",
+            _expenses_setup(),
+            lambda st: list_expenses(st.session, **st.filters),
+            teardown=_close_expenses,
+        ),
+        BenchCase(
+            "expenses.list_filtered",
+            _expenses_setup(merchant="gabbiano", date_from=date(2022, 1, 1), needs_review=False),
+            lambda st: list_expenses(st.session, **st.filters),
+            teardown=_close_expenses,
+        ),
+        BenchCase(
+            "expenses.list_filtered_cached",
+            _expenses_setup(merchant="gabbiano", date_from=date(2022, 1, 1), needs_review=False, count="cached"),
+            lambda st: list_expenses(st.session, **st.filters),
+            teardown=_close_expenses,
+        ),
+        BenchCase(
+            "expenses.list_deep_offset",
+            _expenses_setup(offset="deep"),
+            lambda st: list_expenses(st.session, **st.filters),
+            teardown=_close_expenses,
+        ),
+        BenchCase(
+            "expenses.list_deep_cursor",
+            _expenses_setup(after="deep"),
+            lambda st: list_expenses(st.session, **st.filters),
+            teardown=_close_expenses,
+        ),
+        BenchCase("expenses.bulk_import_csv", _setup_import, _run_import),
+        BenchCase("analytics.month_category", _setup_analytics, _run_analytics, teardown=_close_expenses),
+        BenchCase("upload.save_stream", _setup_upload, _run_upload, teardown=_remove_tmpdir),
+    ]
+}
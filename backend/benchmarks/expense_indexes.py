@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import Engine, create_engine, event, text
+from sqlalchemy.orm import Session
+
+from app.models.expense import Expense
+from app.services.expenses import list_expenses
+from benchmarks.cases import populate_expenses
+
+"""
+Piani di esecuzione e latenza di list_expenses prima/dopo gli indici di `expenses` (SQLite).
+
+Popola un DB SQLite temporaneo (default 1M righe, seed fisso) senza indici secondari, misura ogni
+forma di query (filtro + ORDER BY expense_date desc, id desc, con il count), crea gli indici del
+modello (gli stessi della migrazione) e ripete. Per ogni forma stampa latenza mediana e piano di
+items/count.
+
+Uso (da backend/):
+  python -m benchmarks.expense_indexes                 # 1M righe
+  python -m benchmarks.expense_indexes --rows 200000 --out /tmp/indexes.json
+"""
+
+SHAPES: dict[str, dict[str, Any]] = {
+    "first_page": {},
+    "date_range": {"date_from": date(2023, 1, 1), "date_to": date(2023, 3, 31)},
+    "category": {"category": "restaurant"},
+    "category_since": {"category": "food", "date_from": date(2024, 1, 1)},
+    "source": {"source": "ocr"},
+    "needs_review": {"needs_review": True},
+    "amount_range": {"min_amount": Decimal("450"), "max_amount": Decimal("455")},
+    "merchant_substring": {"merchant": "gabbiano"},
+    "deep_cursor": {"after": "deep"},
+}
+
+_NO_FILTERS: dict[str, Any] = {
+    "date_from": None,
+    "date_to": None,
+    "merchant": None,
+    "category": None,
+    "source": None,
+    "needs_review": None,
+    "min_amount": None,
+    "max_amount": None,
+    "limit": 50,
+    "offset": 0,
+}
+
+
+def _filters(db: Session, shape: dict[str, Any], rows: int) -> dict[str, Any]:
+    filters = {**_NO_FILTERS, **shape}
+    if filters.get("after") == "deep":
+        deep = list_expenses(db, **{**_NO_FILTERS, "offset": max(0, rows - 1001), "limit": 1})[0]
+        filters["after"] = (deep[0].expense_date, deep[0].id) if deep else None
+    return filters
+
+
+def _capture_sql(engine: Engine, db: Session, filters: dict[str, Any]) -> list[tuple[str, Any]]:
+    """Statement SQL (con parametri) eseguiti da una chiamata a list_expenses."""
+    captured: list[tuple[str, Any]] = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        list_expenses(db, **filters)
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+    return captured
+
+
+def _plan(db: Session, statement: str, parameters: Any) -> list[str]:
+    rows = db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return [row[-1] for row in rows]
+
+
+def measure(engine: Engine, rows: int, *, repeat: int) -> dict[str, Any]:
+    out: dict[str, Any] = {}
+    with Session(bind=engine) as db:
+        for name, shape in SHAPES.items():
+            filters = _filters(db, shape, rows)
+            statements = _capture_sql(engine, db, filters)  # anche warmup
+            timings = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                list_expenses(db, **filters)
+                timings.append(time.perf_counter() - t0)
+            # items e poi count (assente se la pagina è l'ultima: il total è noto senza count)
+            items_sql, count_sql = statements[0], statements[1:]
+            out[name] = {
+                "median_ms": round(statistics.median(timings) * 1000, 2),
+                "count_plan": _plan(db, *count_sql[0]) if count_sql else [],
+                "items_plan": _plan(db, *items_sql),
+            }
+    return out
+
+
+def _create_db(path: Path, rows: int) -> Engine:
+    engine = create_engine(f"sqlite+pysqlite:///{path}")
+    Expense.__table__.create(engine)
+    for ix in Expense.__table__.indexes:
+        ix.drop(engine)
+    populate_expenses(engine, rows)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    return engine
+
+
+def _create_indexes(engine: Engine) -> None:
+    for ix in Expense.__table__.indexes:
+        ix.create(engine)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+
+def _print_report(report: dict[str, Any]) -> None:
+    before, after = report["before"], report["after"]
+    print(f"rows={report['rows']} repeat={report['repeat']}")
+    print(f"{'shape':<20} {'before':>10} {'after':>10} {'speedup':>8}")
+    for name in SHAPES:
+        b, a = before[name]["median_ms"], after[name]["median_ms"]
+        print(f"{name:<20} {b:>8.2f}ms {a:>8.2f}ms {b / a if a else 0:>7.1f}x")
+    for name in SHAPES:
+        print(f"\n{name}")
+        for phase in ("before", "after"):
+            print(f"  {phase:<6} items: {' / '.join(report[phase][name]['items_plan'])}")
+            print(f"  {'':<6} count: {' / '.join(report[phase][name]['count_plan'])}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Piani e latenza di list_expenses prima/dopo gli indici")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", type=Path, default=None, help="scrive il report JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="bench-expense-indexes-") as tmp:
+        engine = _create_db(Path(tmp) / "expenses.db", args.rows)
+        try:
+            report = {"rows": args.rows, "repeat": args.repeat}
+            report["before"] = measure(engine, args.rows, repeat=args.repeat)
+            _create_indexes(engine)
+            report["after"] = measure(engine, args.rows, repeat=args.repeat)
+        finally:
+            engine.dispose()
+
+    _print_report(report)
+    if args.out is not None:
+        args.out.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
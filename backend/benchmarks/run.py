@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+from benchmarks.cases import CASES, BenchCase
+
+"""
+Benchmark dei percorsi caldi con baseline e soglia di regressione.
+
+- ogni caso: setup non misurato, 1 esecuzione di warmup, poi `repeat` esecuzioni misurate
+- si confronta la mediana con quella del baseline: oltre baseline * (1 + threshold) il caso è una
+  regressione e il comando esce con codice 1 (da usare prima del deploy / in CI)
+- il baseline dipende dalla macchina: non è versionato, va registrato (--update-baseline) sulla
+  macchina che fa il gate; un baseline di un'altra macchina viene rifiutato (exit 2)
+
+Uso (da backend/):
+  python -m benchmarks.run --update-baseline     # registra il baseline locale (benchmarks/baseline.json)
+  python -m benchmarks.run                       # confronta con il baseline
+  python -m benchmarks.run -k expenses --repeat 10 --threshold 0.5
+"""
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+BASELINE_SCHEMA = 1
+DEFAULT_THRESHOLD = 0.25
+
+
+@dataclass
+class CaseResult:
+    name: str
+    median_s: float
+    min_s: float
+    repeat: int
+    units: int
+    unit: str
+
+    @property
+    def throughput(self) -> float:
+        return self.units / self.median_s if self.median_s > 0 else 0.0
+
+
+@dataclass
+class Comparison:
+    name: str
+    baseline_s: float
+    current_s: float
+    threshold: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current_s / self.baseline_s if self.baseline_s > 0 else 1.0
+
+    @property
+    def regressed(self) -> bool:
+        return self.ratio > 1.0 + self.threshold
+
+
+def run_case(case: BenchCase, *, repeat: int, scale: float) -> CaseResult:
+    state, units, unit = case.setup(scale)
+    try:
+        case.run(state)  # warmup (cache, import lazy, pagine del file system)
+        timings: list[float] = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            case.run(state)
+            timings.append(time.perf_counter() - t0)
+    finally:
+        if case.teardown is not None:
+            case.teardown(state)
+    return CaseResult(
+        name=case.name,
+        median_s=statistics.median(timings),
+        min_s=min(timings),
+        repeat=repeat,
+        units=units,
+        unit=unit,
+    )
+
+
+def machine_info() -> dict[str, Any]:
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def build_baseline(results: list[CaseResult], *, scale: float, threshold: float) -> dict[str, Any]:
+    return {
+        "schema": BASELINE_SCHEMA,
+        "created_at": datetime.now(UTC).isoformat(timespec="seconds"),
+        "machine": machine_info(),
+        "scale": scale,
+        "threshold": threshold,
+        "cases": {r.name: {k: v for k, v in asdict(r).items() if k != "name"} for r in results},
+    }
+
+
+def compare(
+    results: list[CaseResult], baseline: dict[str, Any], *, threshold: float | None = None
+) -> list[Comparison]:
+    """
+    Confronto con il baseline (solo i casi presenti in entrambi). Soglia: quella passata, altrimenti
+    quella per caso nel baseline ("threshold" dentro il caso), altrimenti quella globale del baseline.
+    """
+    comparisons: list[Comparison] = []
+    for r in results:
+        base = baseline["cases"].get(r.name)
+        if base is None:
+            continue
+        case_threshold = threshold
+        if case_threshold is None:
+            case_threshold = base.get("threshold", baseline.get("threshold", DEFAULT_THRESHOLD))
+        comparisons.append(
+            Comparison(name=r.name, baseline_s=base["median_s"], current_s=r.median_s, threshold=case_threshold)
+        )
+    return comparisons
+
+
+def _format_result(r: CaseResult, cmp: Comparison | None) -> str:
+    line = (
+        f"{r.name:<32} median={r.median_s * 1000:9.2f}ms min={r.min_s * 1000:9.2f}ms "
+        f"{r.throughput:12.1f} {r.unit}/s"
+    )
+    if cmp is not None:
+        status = "REGRESSION" if cmp.regressed else "ok"
+        line += f"  baseline={cmp.baseline_s * 1000:9.2f}ms x{cmp.ratio:.2f} (max x{1 + cmp.threshold:.2f}) {status}"
+    return line
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark dei percorsi caldi con gate sul baseline")
+    parser.add_argument("-k", "--case", action="append", default=None, help="filtro sul nome (sottostringa)")
+    parser.add_argument("--repeat", type=int, default=5, help="esecuzioni misurate per caso")
+    parser.add_argument("--scale", type=float, default=1.0, help="fattore di scala delle fixture")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=None, help="regressione massima (0.25 = +25%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="scrive il baseline invece di confrontare")
+    parser.add_argument("--list", action="store_true", help="elenca i casi")
+    args = parser.parse_args(argv)
+
+    cases = [c for name, c in CASES.items() if not args.case or any(k in name for k in args.case)]
+    if args.list:
+        print("\n".join(c.name for c in cases))
+        return 0
+
+    baseline: dict[str, Any] | None = None
+    if not args.update_baseline:
+        if not args.baseline.exists():
+            print(f"Baseline not found: {args.baseline} (run with --update-baseline)", file=sys.stderr)
+            return 2
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline.get("scale") != args.scale:
+            print(f"Baseline recorded with scale={baseline.get('scale')}, not {args.scale}", file=sys.stderr)
+            return 2
+        if baseline.get("machine") != machine_info():
+            # Tempi di un'altra macchina: il gate darebbe falsi positivi (o nasconderebbe regressioni)
+            print(
+                f"Baseline recorded on another machine: {baseline.get('machine')}, this is {machine_info()} "
+                "(record a local one with --update-baseline)",
+                file=sys.stderr,
+            )
+            return 2
+
+    results: list[CaseResult] = []
+    comparisons: dict[str, Comparison] = {}
+    for case in cases:
+        result = run_case(case, repeat=args.repeat, scale=args.scale)
+        results.append(result)
+        if baseline is not None:
+            for cmp in compare([result], baseline, threshold=args.threshold):
+                comparisons[cmp.name] = cmp
+        print(_format_result(result, comparisons.get(result.name)), flush=True)
+
+    if args.update_baseline:
+        threshold = args.threshold if args.threshold is not None else DEFAULT_THRESHOLD
+        if args.baseline.exists() and args.case:
+            # aggiornamento parziale: gli altri casi restano quelli registrati
+            previous = json.loads(args.baseline.read_text(encoding="utf-8"))
+            merged = build_baseline(results, scale=args.scale, threshold=threshold)
+            merged["cases"] = {**previous.get("cases", {}), **merged["cases"]}
+            data = merged
+        else:
+            data = build_baseline(results, scale=args.scale, threshold=threshold)
+        args.baseline.write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+        print(f"baseline written: {args.baseline}")
+        return 0
+
+    regressions = [c for c in comparisons.values() if c.regressed]
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(c.name for c in regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from app.ocr.preprocess import (
+    _estimate_skew_angle,
+    _estimate_skew_angle_hough,
+    _gaussian_blur,
+    _pil_to_cv_gray,
+    _upscale_small,
+)
+
+"""
+Confronto tra lo stimatore di skew storico (Hough a piena risoluzione) e quello multi-risoluzione
+(profilo di proiezione su copia ridotta).
+
+Fixture: i sample in scripts/samples + una pagina sintetica formato A4 a 300 dpi, ruotati di angoli noti.
+Per i sample lo skew "vero" non è noto: l'errore è misurato rispetto alla stima dello stesso
+stimatore sull'immagine non ruotata (errore relativo). Per la pagina sintetica l'errore è assoluto.
+
+Uso (da backend/):  python -m scripts.deskew_eval
+"""
+
+ANGLES = (-10.0, -6.0, -3.0, -1.0, 2.0, 4.0, 7.0)
+ESTIMATORS = {
+    "hough_full": _estimate_skew_angle_hough,
+    "projection_multires": _estimate_skew_angle,
+}
+
+
+def _prepare(img: Image.Image) -> np.ndarray:
+    # Stesso input che il deskew riceve nel profilo "default"
+    return _gaussian_blur(_upscale_small(_pil_to_cv_gray(img)))
+
+
+def _synthetic_page() -> np.ndarray:
+    page = np.full((3508, 2480), 245, dtype=np.uint8)
+    for i, y in enumerate(range(250, 3300, 90)):
+        text = f"{i:03d} ARTICOLO DI PROVA {i * 7 % 100:02d},{i * 13 % 100:02d} EUR"
+        cv2.putText(page, text, (180, y), cv2.FONT_HERSHEY_SIMPLEX, 2.0, 20, 4, cv2.LINE_AA)
+    return page
+
+
+def _rotate(gray: np.ndarray, angle: float) -> np.ndarray:
+    # Rotazione antioraria di `angle`: lo skew atteso (convenzione degli stimatori) è -angle
+    h, w = gray.shape[:2]
+    M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+    return cv2.warpAffine(gray, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+
+
+def main() -> None:
+    fixtures: list[tuple[str, np.ndarray, bool]] = []
+    for p in sorted((Path("scripts") / "samples").glob("*.*")):
+        fixtures.append((p.name, _prepare(Image.open(p)), False))
+    fixtures.append(("synthetic_a4_300dpi", _synthetic_page(), True))
+
+    errors: dict[str, list[float]] = {name: [] for name in ESTIMATORS}
+    seconds: dict[str, float] = {name: 0.0 for name in ESTIMATORS}
+    disagreement: list[float] = []
+
+    for fixture_name, gray, absolute in fixtures:
+        baselines = {name: 0.0 if absolute else est(gray) for name, est in ESTIMATORS.items()}
+        fixture_seconds = {name: 0.0 for name in ESTIMATORS}
+        for angle in ANGLES:
+            rotated = _rotate(gray, angle)
+            estimates = {}
+            for name, est in ESTIMATORS.items():
+                t0 = time.perf_counter()
+                estimates[name] = est(rotated)
+                fixture_seconds[name] += time.perf_counter() - t0
+                errors[name].append(abs(estimates[name] - baselines[name] - (-angle)))
+            disagreement.append(abs(estimates["projection_multires"] - estimates["hough_full"]))
+        for name in ESTIMATORS:
+            seconds[name] += fixture_seconds[name]
+        timing = "  ".join(f"{name}={fixture_seconds[name] / len(ANGLES) * 1000:.1f}ms" for name in ESTIMATORS)
+        print(f"{fixture_name:<22} size={gray.shape[1]}x{gray.shape[0]}  {timing}")
+
+    runs = len(fixtures) * len(ANGLES)
+    print("=" * 80)
+    for name in ESTIMATORS:
+        errs = np.array(errors[name])
+        print(
+            f"{name:<20} mean_abs_err={errs.mean():6.2f}°  max_abs_err={errs.max():6.2f}°  "
+            f"mean_time={seconds[name] / runs * 1000:8.1f} ms"
+        )
+    print(f"speedup (hough_full / projection_multires): {seconds['hough_full'] / seconds['projection_multires']:.1f}x")
+    print(f"mean |projection - hough|: {np.mean(disagreement):.2f}°")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ from app.main import create_app
 from app.models.base import Base
 from app.models.document import Document  # noqa: F401
 from app.models.expense import Expense  # noqa: F401
+from app.services.expense_counts import expense_count_cache
 
 # Expense va importato comunque altrimenti create_all potrebbe non creare tabelle
 
@@ -21,6 +22,8 @@ def engine():
         poolclass=StaticPool, # Assicura stessa connessione
     )
     Base.metadata.create_all(bind=engine)
+    # DB nuovo: i count in cache del test precedente non valgono più
+    expense_count_cache.bump()
     return engine
 
 
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import insert, select
+
+from app.models.expense import Expense
+from app.models.expense_rollup import ExpenseRollup
+from app.services.analytics import rebuild_rollups
+
+
+def _rollups(db_session) -> set[tuple]:
+    db_session.expire_all()
+    rows = db_session.scalars(select(ExpenseRollup)).all()
+    return {
+        (r.month.isoformat(), r.category, r.merchant, r.currency, r.source, Decimal(r.total_amount), r.expense_count)
+        for r in rows
+    }
+
+
+def test_rollups_follow_expense_writes_and_serve_analytics(client, db_session):
+    def create(**fields):
+        payload = {"amount": "10.00", "expense_date": "2026-01-05", "merchant": "Coop", "category": "food", **fields}
+        resp = client.post("/expenses", json=payload)
+        assert resp.status_code == 201
+        return resp.json()["id"]
+
+    create()
+    create(amount="5.50", expense_date="2026-01-28")
+    moved = create(amount="7.00", expense_date="2026-02-02", category="transport", merchant="Trenitalia")
+    gone = create(amount="3.00", expense_date="2026-02-10", category=None, merchant=None, source="ocr")
+
+    # PATCH: la spesa cambia gruppo (mese e categoria) e importo; DELETE: il gruppo si svuota e sparisce
+    assert client.patch(f"/expenses/{moved}", json={"expense_date": "2026-01-15", "amount": "8.00"}).status_code == 200
+    assert client.delete(f"/expenses/{gone}").status_code == 204
+
+    incremental = _rollups(db_session)
+    assert incremental == {
+        ("2026-01-01", "food", "Coop", "EUR", "manual", Decimal("15.50"), 2),
+        ("2026-01-01", "transport", "Trenitalia", "EUR", "manual", Decimal("8.00"), 1),
+    }
+
+    data = client.get("/analytics/expenses", params={"group_by": ["month", "category"]}).json()
+    assert data["group_by"] == ["month", "category"]
+    assert [(r["month"], r["category"], r["merchant"], r["total"], r["count"]) for r in data["rows"]] == [
+        ("2026-01-01", "food", None, "15.50", 2),
+        ("2026-01-01", "transport", None, "8.00", 1),
+    ]
+    # senza group_by: un'unica riga; intervallo di mesi senza spese: nessuna riga
+    assert client.get("/analytics/expenses").json()["rows"][0]["total"] == "23.50"
+    assert client.get("/analytics/expenses", params={"month_from": "2026-02"}).json()["rows"] == []
+    data = client.get("/analytics/expenses", params={"group_by": "merchant", "category": "food", "month_to": "2026-01"})
+    assert [(r["merchant"], r["count"]) for r in data.json()["rows"]] == [("Coop", 2)]
+    assert client.get("/analytics/expenses", params={"month_from": "2026-13"}).status_code == 422
+    assert client.get("/analytics/expenses", params={"group_by": "day"}).status_code == 422
+
+    # Il rebuild da zero produce gli stessi rollup di quelli incrementali
+    assert rebuild_rollups(db_session).rollups == 2
+    assert _rollups(db_session) == incremental
+
+
+def test_rebuild_rollups_picks_up_rows_written_outside_the_services(db_session):
+    db_session.execute(
+        insert(Expense),
+        [
+            {"amount": Decimal("1.25"), "currency": "EUR", "expense_date": date(2025, m, d), "source": "manual"}
+            for m in (1, 2)
+            for d in (1, 2, 3)
+        ],
+    )
+    db_session.commit()
+    assert _rollups(db_session) == set()
+
+    stats = rebuild_rollups(db_session, batch_size=2)
+    assert (stats.expenses, stats.rollups) == (6, 2)
+    assert _rollups(db_session) == {
+        ("2025-01-01", "", "", "EUR", "manual", Decimal("3.75"), 3),
+        ("2025-02-01", "", "", "EUR", "manual", Decimal("3.75"), 3),
+    }
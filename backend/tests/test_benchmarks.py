@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import json
+
+from benchmarks import expense_indexes
+from benchmarks.cases import CASES
+from benchmarks.run import CaseResult, compare, main
+
+
+def test_benchmark_suite_records_baseline_and_gates_regressions(tmp_path, capsys):
+    baseline = tmp_path / "baseline.json"
+    args = ["--scale", "0.001", "--repeat", "1", "--baseline", str(baseline)]
+
+    assert main([*args, "--update-baseline"]) == 0
+    data = json.loads(baseline.read_text(encoding="utf-8"))
+    assert set(data["cases"]) == set(CASES)
+    assert data["scale"] == 0.001
+
+    # Stesso codice, soglia larga: nessuna regressione
+    assert main([*args, "-k", "rule_v0", "--threshold", "100"]) == 0
+
+    # Baseline "più veloce" di quanto si possa fare: il gate fallisce
+    for case in data["cases"].values():
+        case["median_s"] = 1e-9
+    baseline.write_text(json.dumps(data), encoding="utf-8")
+    assert main([*args, "-k", "upload"]) == 1
+    assert "REGRESSION" in capsys.readouterr().out
+
+    # Scala diversa dal baseline: confronto rifiutato
+    assert main(["--scale", "0.002", "--baseline", str(baseline)]) == 2
+
+    # Baseline registrato su un'altra macchina: niente gate
+    data["machine"] = {**data["machine"], "cpu_count": -1}
+    baseline.write_text(json.dumps(data), encoding="utf-8")
+    assert main([*args, "-k", "upload"]) == 2
+    assert "another machine" in capsys.readouterr().err
+
+
+def test_compare_uses_per_case_threshold():
+    baseline = {"threshold": 0.25, "cases": {"a": {"median_s": 1.0, "threshold": 1.0}, "b": {"median_s": 1.0}}}
+    results = [CaseResult("a", 1.8, 1.8, 1, 1, "x"), CaseResult("b", 1.3, 1.3, 1, 1, "x")]
+    assert [(c.name, c.regressed) for c in compare(results, baseline)] == [("a", False), ("b", True)]
+
+
+def test_expense_indexes_report_shows_plan_changes(tmp_path, capsys):
+    out = tmp_path / "indexes.json"
+    assert expense_indexes.main(["--rows", "3000", "--repeat", "1", "--out", str(out)]) == 0
+    report = json.loads(out.read_text(encoding="utf-8"))
+    assert set(report["after"]) == set(expense_indexes.SHAPES)
+
+    # Senza indici: scan + sort; con gli indici del modello: range sull'indice giusto, niente sort
+    assert "USE TEMP B-TREE FOR ORDER BY" in report["before"]["category_since"]["items_plan"]
+    items_plan = " ".join(report["after"]["category_since"]["items_plan"])
+    assert "ix_expenses_category_date_id" in items_plan and "TEMP B-TREE" not in items_plan
+    assert "ix_expenses_date_id (expense_date<?)" in " ".join(report["after"]["deep_cursor"]["items_plan"])
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+import pytest
+
+
+@pytest.fixture()
+def bulk_storage(tmp_path, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "storage_dir", str(tmp_path), raising=False)
+    monkeypatch.setattr(settings, "upload_dedup", True, raising=False)
+    return tmp_path
+
+
+def _zip_bytes(members: dict[str, bytes]) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("scans/", b"")
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+def _tar_gz_bytes(members: dict[str, bytes]) -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tf:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+def test_bulk_upload_files_and_archives(client, db_session, bulk_storage):
+    files = [
+        ("files", ("a.png", b"receipt a", "image/png")),
+        ("files", ("month.zip", _zip_bytes({"scans/b.jpg": b"receipt b", "notes.txt": b"x"}), "application/zip")),
+        ("files", ("more.tar.gz", _tar_gz_bytes({"c.pdf": b"%PDF receipt c", "a-copy.png": b"receipt a"}), "application/gzip")),
+    ]
+    resp = client.post("/documents/upload:bulk", files=files)
+    assert resp.status_code == 200
+    body = resp.json()
+
+    names = [d["original_filename"] for d in body["documents"]]
+    assert names == ["a.png", "b.jpg", "c.pdf", "a-copy.png"]
+    assert [d["mime_type"] for d in body["documents"]] == ["image/png", "image/jpeg", "application/pdf", "image/png"]
+    assert all(d["status"] == "uploaded" for d in body["documents"])
+    assert body["rejected"] == [{"filename": "notes.txt", "reason": "Unsupported media type: text/plain"}]
+    assert body["jobs"] == []
+
+    # Dedup anche tra file della stessa richiesta (l'originale non è ancora a DB)
+    first, copy = body["documents"][0], body["documents"][3]
+    assert copy["duplicate_of"] == first["document_id"]
+    assert os.path.samefile(bulk_storage / first["stored_relative_path"], bulk_storage / copy["stored_relative_path"])
+
+    for doc in body["documents"]:
+        assert client.get(f"/documents/{doc['document_id']}").status_code == 200
+
+
+def test_bulk_upload_limit_rolls_back_written_files(client, bulk_storage, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "bulk_upload_max_files", 2, raising=False)
+    archive = _zip_bytes({f"r{i}.png": f"receipt {i}".encode() for i in range(3)})
+    resp = client.post("/documents/upload:bulk", files=[("files", ("r.zip", archive, "application/zip"))])
+
+    assert resp.status_code == 413
+    assert list((bulk_storage / "documents").iterdir()) == []
+
+
+def test_bulk_upload_caps_uncompressed_bytes(client, bulk_storage, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "bulk_upload_max_file_bytes", 1000, raising=False)
+    # 100 KB di zeri compressi in pochi byte: scartato dall'header, senza scriverlo su disco
+    archive = _zip_bytes({"ok.png": b"receipt", "bomb.png": bytes(100_000)})
+    resp = client.post("/documents/upload:bulk", files=[("files", ("r.zip", archive, "application/zip"))])
+    assert resp.status_code == 200
+    body = resp.json()
+    assert [d["original_filename"] for d in body["documents"]] == ["ok.png"]
+    assert body["rejected"] == [{"filename": "bomb.png", "reason": "File too large: max 1000 bytes"}]
+    assert len(list((bulk_storage / "documents").iterdir())) == 1
+
+    # Totale della richiesta: 413 e nessun file lasciato su disco
+    monkeypatch.setattr(settings, "bulk_upload_max_bytes", 1500, raising=False)
+    archive = _tar_gz_bytes({f"r{i}.png": bytes([i]) * 600 for i in range(3)})
+    resp = client.post("/documents/upload:bulk", files=[("files", ("r.tar.gz", archive, "application/gzip"))])
+    assert resp.status_code == 413
+    assert len(list((bulk_storage / "documents").iterdir())) == 1
+
+
+def test_save_document_stream_enforces_max_bytes_while_reading(tmp_path):
+    from app.storage import UploadTooLarge, save_document_stream
+
+    # Anche se la dimensione dichiarata non c'è (o mente) la lettura si ferma al limite
+    with pytest.raises(UploadTooLarge):
+        save_document_stream(
+            base_dir=tmp_path, stream=io.BytesIO(bytes(5000)), filename="x.png", mime_type="image/png", max_bytes=4096
+        )
+    assert list((tmp_path / "documents").iterdir()) == []
+    saved = save_document_stream(
+        base_dir=tmp_path, stream=io.BytesIO(bytes(4096)), filename="x.png", mime_type="image/png", max_bytes=4096
+    )
+    assert saved["size_bytes"] == 4096
+
+
+def test_bulk_upload_enqueues_ocr(client, db_session, bulk_storage, monkeypatch):
+    import app.services.documents as docs_svc
+    from app.ocr import tesseract_engine as te
+    from app.services.ocr_jobs import ocr_job_queue
+
+    class FakeEngine:
+        def extract_from_image(self, _path):
+            return te.OcrResult(engine="fake", items=[], full_text="TOT 1.00")
+
+    monkeypatch.setattr(docs_svc, "create_ocr_engine", FakeEngine)
+    # Il DB di test è una sola connessione SQLite condivisa: un worker alla volta
+    monkeypatch.setattr(ocr_job_queue, "max_workers", 1)
+
+    files = [("files", (f"r{i}.png", f"receipt {i}".encode(), "image/png")) for i in range(3)]
+    resp = client.post("/documents/upload:bulk", params={"enqueue_ocr": "true"}, files=files)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert [j["document_id"] for j in body["jobs"]] == [d["document_id"] for d in body["documents"]]
+
+    deadline = time.monotonic() + 10
+    for job in body["jobs"]:
+        while client.get(f"/jobs/{job['job_id']}").json()["status"] not in ("processed", "failed"):
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+        final = client.get(f"/jobs/{job['job_id']}").json()
+        assert final["status"] == "processed", final["error_message"]
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import os
+
+import pytest
+
+
+@pytest.fixture()
+def dedup_storage(tmp_path, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "storage_dir", str(tmp_path), raising=False)
+    monkeypatch.setattr(settings, "upload_dedup", True, raising=False)
+    return tmp_path
+
+
+def _upload(client, content: bytes, name: str = "receipt.png") -> dict:
+    resp = client.post("/documents/upload", files={"file": (name, content, "image/png")})
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def test_upload_dedup_links_duplicates_to_original(client, dedup_storage):
+    first = _upload(client, b"same bytes")
+    second = _upload(client, b"same bytes", name="copy.png")
+    other = _upload(client, b"different bytes")
+
+    assert first["is_duplicate"] is False
+    assert second["is_duplicate"] is True
+    assert second["duplicate_of"] == first["document_id"]
+    assert other["is_duplicate"] is False
+
+    # Il duplicato non occupa una nuova copia: stesso inode (hardlink) o stesso path (riferimento)
+    first_path = dedup_storage / first["stored_relative_path"]
+    second_path = dedup_storage / second["stored_relative_path"]
+    assert os.path.samefile(first_path, second_path)
+
+    got = client.get(f"/documents/{second['document_id']}").json()
+    assert got["is_duplicate"] is True
+    assert got["duplicate_of"] == first["document_id"]
+
+
+def test_upload_without_dedup_keeps_separate_copies(client, tmp_path, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "storage_dir", str(tmp_path), raising=False)
+    first = _upload(client, b"same bytes")
+    second = _upload(client, b"same bytes")
+
+    assert second["is_duplicate"] is False
+    assert not os.path.samefile(tmp_path / first["stored_relative_path"], tmp_path / second["stored_relative_path"])
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import json
+import os
+import time
 from pathlib import Path
 
 import pytest
@@ -35,7 +37,7 @@ def temp_storage(tmp_path, monkeypatch):
 def fake_ocr(monkeypatch):
     """
     Monkeypatch del Tesseract engine per rendere deterministico il risultato.
-    Patchiamo il simbolo già importato in app.services.documents.
+    Patchiamo la factory già importata in app.services.documents.
     """
     import app.services.documents as docs_svc
     from app.ocr import tesseract_engine as te
@@ -54,13 +56,26 @@ def fake_ocr(monkeypatch):
         def extract_from_pil(self, _img, *, page_index=1):
             return self.extract_from_image(None)
 
-    monkeypatch.setattr(docs_svc, "TesseractOcrEngine", FakeEngine)
+    monkeypatch.setattr(docs_svc, "create_ocr_engine", FakeEngine)
 
 
-def test_documents_upload_process_and_fetch_json(client, temp_storage, fake_ocr, tmp_path, monkeypatch):
+def _wait_job(client, job_id: str, timeout: float = 10.0) -> dict:
+    """Polling di GET /jobs/{id} finché il job non termina."""
+    deadline = time.monotonic() + timeout
+    while True:
+        resp = client.get(f"/jobs/{job_id}")
+        assert resp.status_code == 200
+        job = resp.json()
+        if job["status"] in ("processed", "failed"):
+            return job
+        assert time.monotonic() < deadline, f"job non terminato: {job}"
+        time.sleep(0.02)
+
+
+def test_documents_upload_process_and_fetch_json(client, db_session, temp_storage, fake_ocr, tmp_path, monkeypatch):
     """
     Integration test API-first:
-    upload -> process-ocr -> get ocr-json
+    upload -> process-ocr (job asincrono) -> get ocr-json
     """
     # 1) upload
     dummy = _make_dummy_png(tmp_path)
@@ -74,8 +89,20 @@ def test_documents_upload_process_and_fetch_json(client, temp_storage, fake_ocr,
     doc_id = data["document_id"]
     assert data["status"] == "uploaded"
 
-    # 2) process-ocr
+    # 2) process-ocr: 202 + job id, poi polling dello stato
     resp = client.post(f"/documents/{doc_id}/process-ocr")
+    assert resp.status_code == 202
+    job = resp.json()
+    assert job["document_id"] == doc_id
+    assert job["status"] in ("queued", "running", "processed")
+
+    job = _wait_job(client, job["job_id"])
+    assert job["status"] == "processed"
+    assert job["error_message"] is None
+
+    # La session del test è condivisa tra request: scartiamo lo stato in cache
+    db_session.expire_all()
+    resp = client.get(f"/documents/{doc_id}")
     assert resp.status_code == 200
     processed = resp.json()
     assert processed["status"] == "processed"
@@ -91,3 +118,353 @@ def test_documents_upload_process_and_fetch_json(client, temp_storage, fake_ocr,
     assert payload["pages"][0]["page_index"] == 1
     assert payload["pages"][0]["full_text"] == "TOT 12.34"
     assert len(payload["pages"][0]["items"]) == 2
+
+
+def test_process_ocr_unknown_document_and_job(client):
+    missing = "00000000-0000-0000-0000-000000000000"
+    assert client.post(f"/documents/{missing}/process-ocr").status_code == 404
+    assert client.get(f"/jobs/{missing}").status_code == 404
+
+
+def test_process_ocr_reuses_cached_result_for_same_file(client, db_session, temp_storage, fake_ocr, tmp_path, monkeypatch):
+    import app.services.documents as docs_svc
+
+    calls = []
+    make_fake = docs_svc.create_ocr_engine
+
+    def counting_factory():
+        calls.append(1)
+        return make_fake()
+
+    monkeypatch.setattr(docs_svc, "create_ocr_engine", counting_factory)
+
+    dummy = _make_dummy_png(tmp_path)
+    doc_ids = []
+    for _ in range(2):
+        with dummy.open("rb") as f:
+            resp = client.post("/documents/upload", files={"file": ("dummy.png", f, "image/png")})
+        doc_ids.append(resp.json()["document_id"])
+
+    for doc_id in doc_ids:
+        job = client.post(f"/documents/{doc_id}/process-ocr").json()
+        assert _wait_job(client, job["job_id"])["status"] == "processed"
+
+    # Secondo upload identico: risultato dalla cache, Tesseract non viene richiamato
+    assert len(calls) == 1
+    stats = client.get("/documents/ocr-cache/stats").json()
+    assert stats["enabled"] is True
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+    db_session.expire_all()
+    second = client.get(f"/documents/{doc_ids[1]}").json()
+    assert second["status"] == "processed"
+    assert second["ocr_text_plain"] == "TOT 12.34"
+    assert client.get(f"/documents/{doc_ids[1]}/ocr-json").json()["pages"][0]["full_text"] == "TOT 12.34"
+
+
+def test_ocr_cache_evicts_least_recently_used(tmp_path):
+    from app.ocr.cache import OcrResultCache
+
+    cache = OcrResultCache(tmp_path / "cache", max_bytes=250)
+    src = tmp_path / "ocr_result.json"
+    src.write_text("x" * 100, encoding="utf-8")
+
+    for key in ("a" * 64, "b" * 64):
+        cache.put(key, files={"ocr_result.json": src}, text="t")
+    # "a" diventa la più recente: all'inserimento di "c" si elimina "b"
+    old = tmp_path / "cache" / "bb" / ("b" * 64)
+    os.utime(old, (1, 1))
+    assert cache.get("a" * 64) is not None
+    cache.put("c" * 64, files={"ocr_result.json": src}, text="t")
+
+    assert cache.get("b" * 64) is None
+    assert cache.get("a" * 64) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ocr_cache_tracks_sizes_without_rescanning(tmp_path, monkeypatch):
+    from app.ocr.cache import OcrResultCache
+
+    root = tmp_path / "cache"
+    src = tmp_path / "ocr_result.json"
+    src.write_text("x" * 100, encoding="utf-8")
+    OcrResultCache(root, max_bytes=10_000).put("a" * 64, files={"ocr_result.json": src}, text="t")
+    # La entry è una copia: l'eviction libera davvero i suoi byte
+    assert (root / "aa" / ("a" * 64) / "ocr_result.json").stat().st_nlink == 1
+
+    # Riavvio: le entry esistenti sono caricate una volta, poi put non riscandisce la cache
+    cache = OcrResultCache(root, max_bytes=150)
+    assert cache.total_bytes == 101
+    monkeypatch.setattr(Path, "glob", lambda *a, **k: pytest.fail("full cache scan on put"))
+    cache.put("b" * 64, files={"ocr_result.json": src}, text="t")
+
+    assert cache.total_bytes == 101
+    assert cache.get("a" * 64) is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_process_ocr_batch_by_ids_and_status(client, db_session, temp_storage, fake_ocr, tmp_path, monkeypatch):
+    from app.services.ocr_jobs import ocr_job_queue
+
+    # Il DB di test è una sola connessione SQLite condivisa: un worker alla volta
+    monkeypatch.setattr(ocr_job_queue, "max_workers", 1)
+    dummy = _make_dummy_png(tmp_path)
+    doc_ids = []
+    for i in range(3):
+        # byte diversi: niente cache hit tra i documenti
+        content = dummy.read_bytes() + bytes([i])
+        resp = client.post("/documents/upload", files={"file": (f"r{i}.png", content, "image/png")})
+        doc_ids.append(resp.json()["document_id"])
+
+    missing = "00000000-0000-0000-0000-000000000000"
+    resp = client.post("/documents/process-ocr:batch", json={"document_ids": [doc_ids[0], missing]})
+    assert resp.status_code == 202
+    body = resp.json()
+    assert body["queued"] == 1
+    assert [it["document_id"] for it in body["items"]] == [doc_ids[0], missing]
+    assert body["items"][1] == {"document_id": missing, "job_id": None, "status": "not_found"}
+    assert _wait_job(client, body["items"][0]["job_id"])["status"] == "processed"
+
+    # Backfill: tutti i documenti ancora "uploaded"
+    db_session.expire_all()
+    resp = client.post("/documents/process-ocr:batch", json={"status": "uploaded"})
+    assert resp.status_code == 202
+    body = resp.json()
+    assert sorted(it["document_id"] for it in body["items"]) == sorted(doc_ids[1:])
+    for it in body["items"]:
+        assert _wait_job(client, it["job_id"])["status"] == "processed"
+
+    # Serve esattamente uno tra document_ids e status
+    assert client.post("/documents/process-ocr:batch", json={}).status_code == 422
+
+
+def test_process_ocr_batch_survives_restart(client, db_session, temp_storage, fake_ocr, tmp_path, monkeypatch):
+    import threading
+
+    from fastapi.testclient import TestClient
+
+    import app.services.ocr_jobs as jobs_mod
+    from app.db import get_db
+    from app.main import create_app
+    from app.models.document import Document
+    from app.services.ocr_jobs import ocr_job_queue
+
+    monkeypatch.setattr(ocr_job_queue, "max_workers", 1)
+    dummy = _make_dummy_png(tmp_path)
+    doc_ids = []
+    for i in range(3):
+        content = dummy.read_bytes() + bytes([i])
+        resp = client.post("/documents/upload", files={"file": (f"r{i}.png", content, "image/png")})
+        doc_ids.append(resp.json()["document_id"])
+
+    # Il primo job resta in corso finché il processo non viene fermato
+    started, release = threading.Event(), threading.Event()
+    ran: list[str] = []
+    real_process = jobs_mod.documents_svc.process_document_ocr
+
+    def slow_process(db, document_id, *, engine=None):
+        ran.append(document_id)
+        started.set()
+        release.wait(10)
+        return real_process(db, document_id, engine=engine)
+
+    monkeypatch.setattr(jobs_mod.documents_svc, "process_document_ocr", slow_process)
+    resp = client.post("/documents/process-ocr:batch", json={"document_ids": doc_ids})
+    assert resp.json()["queued"] == 3
+    assert started.wait(10)
+
+    # Stop del processo: il job in corso termina, gli altri restano "queued" a DB senza job
+    stopper = threading.Thread(target=ocr_job_queue.shutdown)
+    stopper.start()
+    time.sleep(0.05)
+    release.set()
+    stopper.join(10)
+    assert len(ran) == 1
+    _wait_status(db_session, [d for d in doc_ids if d not in ran], "queued")
+
+    # Riavvio: il lifespan riprende il resto del batch
+    monkeypatch.setattr(jobs_mod.documents_svc, "process_document_ocr", real_process)
+    app = create_app()
+    app.dependency_overrides[get_db] = lambda: (yield db_session)
+    with TestClient(app):
+        _wait_status(db_session, doc_ids, "processed")
+    assert all(db_session.get(Document, d).ocr_text_plain == "TOT 12.34" for d in doc_ids)
+
+
+def _stranded_doc(doc_id: str, status: str):
+    from app.models.document import Document
+
+    return Document(
+        id=doc_id,
+        original_filename="r.png",
+        mime_type="image/png",
+        storage_path=f"documents/{doc_id}/original.png",
+        sha256=doc_id[-1] * 64,
+        size_bytes=1,
+        status=status,
+    )
+
+
+def _wait_status(db_session, doc_ids: list[str], status: str, timeout: float = 10.0) -> None:
+    from app.models.document import Document
+
+    deadline = time.monotonic() + timeout
+    while True:
+        db_session.expire_all()
+        statuses = [db_session.get(Document, d).status for d in doc_ids]
+        if all(st == status for st in statuses):
+            return
+        assert time.monotonic() < deadline, f"documenti non {status}: {statuses}"
+        time.sleep(0.02)
+
+
+def test_startup_recovers_documents_left_queued_or_running(db_session, temp_storage, fake_ocr, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app.db import get_db
+    from app.main import create_app
+    from app.models.document import Document
+    from app.services.ocr_jobs import ocr_job_queue
+
+    monkeypatch.setattr(ocr_job_queue, "max_workers", 1)
+    # Stato lasciato da un processo terminato con job ancora in coda / in corso
+    docs = [_stranded_doc("d1", "queued"), _stranded_doc("d2", "running"), _stranded_doc("d3", "uploaded")]
+    for doc in docs:
+        original = temp_storage / doc.storage_path
+        original.parent.mkdir(parents=True)
+        _make_dummy_png(original.parent).rename(original)
+    db_session.add_all(docs)
+    db_session.commit()
+
+    app = create_app()
+    app.dependency_overrides[get_db] = lambda: (yield db_session)
+    with TestClient(app):
+        _wait_status(db_session, ["d1", "d2"], "processed")
+    assert db_session.get(Document, "d3").status == "uploaded"
+
+
+def test_shutdown_drops_pending_jobs_and_recover_requeues_them(db_session, monkeypatch):
+    import threading
+
+    import app.services.ocr_jobs as jobs_mod
+    from app.models.document import Document
+    from app.services.ocr_jobs import OcrJobQueue
+
+    started, release = threading.Event(), threading.Event()
+    calls: list[str] = []
+
+    def fake_process(db, document_id, *, engine=None):
+        calls.append(document_id)
+        started.set()
+        release.wait(10)
+        doc = db.get(Document, document_id)
+        doc.status = "processed"
+        db.commit()
+        return doc
+
+    monkeypatch.setattr(jobs_mod.documents_svc, "process_document_ocr", fake_process)
+    monkeypatch.setattr(jobs_mod.documents_svc, "create_ocr_engine", lambda: None)
+    db_session.add_all([_stranded_doc(f"d{i}", "uploaded") for i in range(3)])
+    db_session.commit()
+
+    queue = OcrJobQueue(max_workers=1)
+    jobs = queue.enqueue_many(db_session, ["d0", "d1", "d2"])
+    assert started.wait(10)
+    stopper = threading.Thread(target=queue.shutdown)
+    stopper.start()
+    time.sleep(0.05)
+    release.set()
+    stopper.join(10)
+
+    # Solo il job in corso è stato completato; gli altri non bloccano lo shutdown e restano "queued"
+    assert calls == ["d0"]
+    _wait_status(db_session, ["d1", "d2"], "queued")
+    assert queue.get(jobs["d1"].job_id) is None
+
+    # Nuovo avvio: i documenti rimasti in coda vengono ripresi
+    assert OcrJobQueue(max_workers=1).recover(db_session) == 2
+    _wait_status(db_session, ["d0", "d1", "d2"], "processed")
+    assert sorted(calls) == ["d0", "d1", "d2"]
+
+
+def test_extract_fields_is_stored_and_invalidated_by_reocr(client, db_session, temp_storage, fake_ocr, tmp_path, monkeypatch):
+    import app.services.extraction as extraction_svc
+    from app.models.document_extraction import DocumentExtraction
+
+    dummy = _make_dummy_png(tmp_path)
+    doc_id = client.post("/documents/upload", files={"file": ("r.png", dummy.read_bytes(), "image/png")}).json()["document_id"]
+    job = client.post(f"/documents/{doc_id}/process-ocr").json()
+    assert _wait_job(client, job["job_id"])["status"] == "processed"
+    db_session.expire_all()
+
+    first = client.post(f"/documents/{doc_id}/extract-fields")
+    assert first.status_code == 200
+    assert first.json()["fields"]["total"]["value"] == "12.34"
+    assert db_session.query(DocumentExtraction).filter_by(document_id=doc_id).count() == 1
+
+    # Fingerprint degli input registrati su documento e risultato
+    from app.extraction.registry import get_extractor
+    from app.models.document import Document
+    from app.ocr.cache import ocr_config_fingerprint
+
+    row = db_session.query(DocumentExtraction).filter_by(document_id=doc_id).one()
+    assert db_session.get(Document, doc_id).ocr_fingerprint == row.ocr_fingerprint == ocr_config_fingerprint()
+    assert row.extractor_fingerprint == get_extractor("rule_v0").fingerprint
+
+    # Seconda chiamata: servita dalla tabella, senza rileggere l'OCR né rieseguire le regole
+    def _no_ocr_read(_path):
+        raise AssertionError("extraction should be served from document_extractions")
+
+    monkeypatch.setattr(extraction_svc, "load_ocr_source", _no_ocr_read)
+    second = client.post(f"/documents/{doc_id}/extract-fields")
+    assert second.json() == first.json()
+
+    # Re-OCR: il risultato salvato viene invalidato
+    job = client.post(f"/documents/{doc_id}/process-ocr").json()
+    assert _wait_job(client, job["job_id"])["status"] == "processed"
+    db_session.expire_all()
+    assert db_session.query(DocumentExtraction).filter_by(document_id=doc_id).count() == 0
+
+
+def test_process_ocr_writes_columnar_artifact(client, db_session, temp_storage, fake_ocr, tmp_path):
+    dummy = _make_dummy_png(tmp_path)
+    doc_id = client.post("/documents/upload", files={"file": ("r.png", dummy.read_bytes(), "image/png")}).json()["document_id"]
+    job = client.post(f"/documents/{doc_id}/process-ocr").json()
+    assert _wait_job(client, job["job_id"])["status"] == "processed"
+    db_session.expire_all()
+
+    doc_dir = temp_storage / "documents" / doc_id
+    assert (doc_dir / "ocr_result.ocrc").exists()
+    expected = client.get(f"/documents/{doc_id}/ocr-json").json()
+
+    # Senza JSON su disco la vista /ocr-json viene ricostruita dall'artefatto
+    (doc_dir / "ocr_result.json").unlink()
+    assert client.get(f"/documents/{doc_id}/ocr-json").json() == expected
+    assert client.post(f"/documents/{doc_id}/extract-fields").json()["fields"]["total"]["value"] == "12.34"
+
+
+def test_ocr_json_is_streamed_with_etag_and_gzip(client, db_session, temp_storage, fake_ocr, tmp_path):
+    dummy = _make_dummy_png(tmp_path)
+    doc_id = client.post("/documents/upload", files={"file": ("r.png", dummy.read_bytes(), "image/png")}).json()["document_id"]
+    job = client.post(f"/documents/{doc_id}/process-ocr").json()
+    assert _wait_job(client, job["job_id"])["status"] == "processed"
+    db_session.expire_all()
+    url = f"/documents/{doc_id}/ocr-json"
+    raw = (temp_storage / "documents" / doc_id / "ocr_result.json").read_bytes()
+
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert plain.status_code == 200
+    assert "content-encoding" not in plain.headers
+    assert plain.content == raw  # byte per byte, senza ri-serializzazione
+
+    gz = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert gz.headers["content-encoding"] == "gzip"
+    assert gz.json() == plain.json()
+    assert gz.headers["etag"] != plain.headers["etag"]
+
+    not_modified = client.get(url, headers={"Accept-Encoding": "identity", "If-None-Match": plain.headers["etag"]})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert client.get(url, headers={"If-Modified-Since": plain.headers["last-modified"]}).status_code == 304
+    assert client.get(url, headers={"If-None-Match": '"stale"'}).status_code == 200
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import importlib.util
+import json
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+from app.ocr import tesseract_engine as te
+
+EVAL_SCRIPT = Path(__file__).resolve().parents[2] / "eval" / "run_eval.py"
+
+
+def _load_harness():
+    spec = importlib.util.spec_from_file_location("run_eval", EVAL_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    # registrato prima dell'exec: i dataclass del modulo lo cercano in sys.modules
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class ScriptedEngine:
+    """Engine finto: restituisce i testi nell'ordine in cui arrivano i documenti."""
+
+    def __init__(self, texts: list[str]) -> None:
+        self.texts = list(texts)
+
+    def extract_from_image(self, _path):
+        text = self.texts.pop(0)
+        return te.OcrResult(engine="fake", items=[], full_text=text, timings_ms={"grayscale": 1.0, "ocr": 4.0})
+
+
+def test_eval_harness_reports_accuracy_latency_and_compares(tmp_path, capsys):
+    harness = _load_harness()
+
+    for name in ("a.png", "b.png"):
+        Image.new("RGB", (60, 20), color=(255, 255, 255)).save(tmp_path / name)
+    labels = tmp_path / "labels.jsonl"
+    labels.write_text(
+        "\n".join(
+            json.dumps(row)
+            for row in [
+                {"file": "a.png", "fields": {"merchant": "Bar  sport", "total": "7.20", "date": "2024-05-05"}},
+                {"file": "b.png", "fields": {"merchant": "COOP", "total": "3.00", "currency": "EUR"}},
+            ]
+        ),
+        encoding="utf-8",
+    )
+    engine = ScriptedEngine(["BAR SPORT\nTOTALE 7,20\n05/05/2024", "ESSELUNGA\nTOTALE 3,10 EUR"])
+
+    out = tmp_path / "run.json"
+    report = harness.main(["--labels", str(labels), "--out", str(out)], engine=engine)
+    assert json.loads(out.read_text(encoding="utf-8")) == report
+
+    summary = report["summary"]
+    assert (summary["documents"], summary["failed"], summary["pages"]) == (2, 0, 2)
+    assert summary["fields"]["merchant"] == {"labeled": 2, "correct": 1, "accuracy": 0.5}
+    assert summary["fields"]["total"] == {"labeled": 2, "correct": 1, "accuracy": 0.5}
+    assert summary["fields"]["date"]["accuracy"] == 1.0
+    assert summary["fields"]["currency"]["accuracy"] == 1.0
+    for stage in ("upload", "render", "preprocess.grayscale", "ocr", "ocr_total", "extract", "end_to_end"):
+        assert summary["stages"][stage]["count"] == 2
+        assert summary["stages"][stage]["p95_ms"] >= summary["stages"][stage]["p50_ms"]
+    assert summary["stages"]["ocr"]["pages_per_sec"] == 250.0
+    assert report["documents"][1]["fields"]["total"] == {"expected": "3.00", "predicted": "3.10", "correct": False}
+
+    # Confronto con un baseline: accuratezza per campo e latenze per stage
+    baseline = json.loads(json.dumps(report))
+    baseline["summary"]["fields"]["total"]["accuracy"] = 1.0
+    lines = harness.compare(report, baseline)
+    assert any("total" in line and "(-0.500)" in line for line in lines)
+    assert any(line.strip().startswith("ocr ") for line in lines)
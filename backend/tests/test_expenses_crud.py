@@ -54,3 +54,62 @@ def test_expenses_not_found(client):
     assert client.get("/expenses/999999").status_code == 404
     assert client.patch("/expenses/999999", json={"merchant": "x"}).status_code == 404
     assert client.delete("/expenses/999999").status_code == 404
+
+
+def test_expenses_cursor_pagination(client):
+    # 7 spese su 3 date (con pareggi sulla data): l'ordine è (expense_date desc, id desc)
+    days = ["2026-01-01", "2026-01-02", "2026-01-02", "2026-01-02", "2026-01-03", "2026-01-03", "2026-01-04"]
+    for day in days:
+        assert client.post("/expenses", json={"amount": "1.00", "expense_date": day}).status_code == 201
+
+    expected = [row["id"] for row in client.get("/expenses", params={"limit": 100}).json()["items"]]
+    assert len(expected) == 7
+
+    seen: list[int] = []
+    params: dict = {"limit": 3}
+    while True:
+        data = client.get("/expenses", params=params).json()
+        assert data["total"] == 7
+        seen += [row["id"] for row in data["items"]]
+        if data["next_cursor"] is None:
+            break
+        params = {"limit": 3, "after": data["next_cursor"]}
+    assert seen == expected
+
+    # Il cursore rispetta i filtri
+    data = client.get("/expenses", params={"limit": 2, "date_to": "2026-01-02"}).json()
+    data = client.get("/expenses", params={"limit": 2, "date_to": "2026-01-02", "after": data["next_cursor"]}).json()
+    assert [row["expense_date"] for row in data["items"]] == ["2026-01-02", "2026-01-01"]
+    assert data["next_cursor"] is not None  # pagina piena
+
+    assert client.get("/expenses", params={"after": "not-a-cursor"}).status_code == 400
+    assert client.get("/expenses", params={"after": data["next_cursor"], "offset": 2}).status_code == 400
+
+
+def test_expenses_count_strategies(client):
+    for day in ["2026-01-01", "2026-01-02", "2026-01-03"]:
+        assert client.post("/expenses", json={"amount": "1.00", "expense_date": day}).status_code == 201
+
+    def page(**params):
+        data = client.get("/expenses", params={"limit": 1, **params}).json()
+        return data["total"], data["count_strategy"]
+
+    assert page() == (3, "exact")
+    # cached: il primo count si calcola, il secondo (stessi filtri normalizzati) viene dalla cache
+    assert page(count="cached") == (3, "exact")
+    assert page(count="cached") == (3, "cached")
+    assert page(count="cached", min_amount="1.0") == (3, "exact")
+    assert page(count="cached", min_amount="1.00") == (3, "cached")
+
+    # ogni scrittura invalida la cache
+    expense_id = client.post("/expenses", json={"amount": "1.00", "expense_date": "2026-01-04"}).json()["id"]
+    assert page(count="cached") == (4, "exact")
+    assert page(count="cached") == (4, "cached")
+    assert client.delete(f"/expenses/{expense_id}").status_code == 204
+    assert page(count="cached") == (3, "exact")
+
+    # estimated: su SQLite non c'è stima del planner, si ripiega su cached
+    assert page(count="estimated") == (3, "cached")
+    # ultima pagina in modalità offset: total noto senza count
+    assert client.get("/expenses", params={"count": "cached"}).json()["count_strategy"] == "exact"
+    assert client.get("/expenses", params={"count": "approx"}).status_code == 422
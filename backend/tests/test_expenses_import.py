@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import io
+import json
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app.models.expense import Expense
+from app.services import expense_import
+from app.services.expense_import import import_expenses
+
+CSV = (
+    "﻿amount,expense_date,merchant,category,needs_review,unknown_column\n"
+    "12.30,2026-01-02,Coop,,true,x\n"
+    "abc,2026-01-02,Coop,,,\n"
+    '"7.00",2026-01-20,"Bar, Sport",food,false,\n'
+    "5.00,,Coop,,,\n"
+    "1.00,2026-02-01,Coop,food,,,extra\n"
+    "2.50,2026-02-03,Conad,,,\n"
+)
+
+
+def test_import_csv_reports_row_errors_and_keeps_valid_rows(client, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "expenses_import_chunk_size", 2, raising=False)
+    # la lista prima dell'import: il count in cache deve essere invalidato
+    assert client.get("/expenses", params={"limit": 1, "count": "cached"}).json()["total"] == 0
+
+    resp = client.post("/expenses/import", files={"file": ("bank.csv", CSV.encode(), "text/csv")})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert (data["rows"], data["inserted"], data["failed"], data["errors_truncated"]) == (6, 3, 3, False)
+    assert data["errors"] == [
+        {"line": 3, "message": "amount: Input should be a valid decimal"},
+        {"line": 5, "message": "expense_date: Field required"},
+        {"line": 6, "message": "more values than header columns"},
+    ]
+
+    listed = client.get("/expenses", params={"count": "cached", "limit": 1}).json()
+    assert (listed["total"], listed["count_strategy"]) == (3, "exact")
+    rows = client.get("/expenses").json()["items"]
+    assert [(r["merchant"], r["amount"], r["category"], r["needs_review"], r["currency"]) for r in rows] == [
+        ("Conad", "2.50", None, False, "EUR"),
+        ("Bar, Sport", "7.00", "food", False, "EUR"),
+        ("Coop", "12.30", None, True, "EUR"),
+    ]
+    # i rollup seguono l'import
+    summary = client.get("/analytics/expenses", params={"group_by": "month"}).json()["rows"]
+    assert [(r["month"], r["total"], r["count"]) for r in summary] == [("2026-01-01", "19.30", 2), ("2026-02-01", "2.50", 1)]
+
+
+def test_import_ndjson_and_format_detection(client):
+    lines = [
+        json.dumps({"amount": "3.10", "expense_date": "2026-03-01", "source": "bank"}),
+        "",
+        "{not json",
+        json.dumps([1, 2]),
+        json.dumps({"amount": -1, "expense_date": "2026-03-01"}),
+    ]
+    body = "\n".join(lines).encode()
+    data = client.post("/expenses/import", files={"file": ("export.jsonl", body, "application/octet-stream")}).json()
+    assert (data["rows"], data["inserted"], data["failed"]) == (4, 1, 3)
+    assert [e["line"] for e in data["errors"]] == [3, 4, 5]
+
+    resp = client.post("/expenses/import", files={"file": ("export.txt", body, "text/plain")})
+    assert resp.status_code == 415
+    resp = client.post("/expenses/import?format=ndjson", files={"file": ("export.txt", body, "text/plain")})
+    assert resp.json()["inserted"] == 1
+
+
+def test_import_falls_back_to_single_rows_when_a_chunk_fails(db_session, monkeypatch):
+    insert_rows = expense_import._insert_rows
+
+    def failing_insert(db, rows):
+        # il DB rifiuta le righe del merchant "BOOM" (es. vincolo violato)
+        if any(row.merchant == "BOOM" for row in rows):
+            raise IntegrityError("INSERT", {}, Exception("CHECK constraint failed: merchant"))
+        insert_rows(db, rows)
+
+    monkeypatch.setattr(expense_import, "_insert_rows", failing_insert)
+    ndjson = "\n".join(
+        json.dumps({"amount": "1.00", "expense_date": "2026-01-01", "merchant": m}) for m in ["A", "BOOM", "B", "C"]
+    )
+    result = import_expenses(db_session, io.BytesIO(ndjson.encode()), "ndjson", chunk_size=3, max_errors=0)
+    assert (result.rows, result.inserted, result.failed, result.errors_truncated) == (4, 3, 1, True)
+    assert sorted(db_session.scalars(select(Expense.merchant)).all()) == ["A", "B", "C"]
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import json
+
+from app.cli.extract_all import run_extract_all
+from app.models.document import Document
+from app.models.document_extraction import DocumentExtraction
+
+
+def _add_processed_doc(db_session, storage, doc_id: str, total: str, *, ocr: object = None) -> None:
+    doc_dir = storage / "documents" / doc_id
+    doc_dir.mkdir(parents=True)
+    if ocr is None:
+        ocr = {"pages": [{"page_index": 1, "full_text": f"SHOP\nTOTALE {total} EUR\n01/02/2024", "items": []}]}
+    (doc_dir / "ocr_result.json").write_text(json.dumps(ocr), encoding="utf-8")
+    db_session.add(
+        Document(
+            id=doc_id,
+            original_filename="r.png",
+            mime_type="image/png",
+            storage_path=f"documents/{doc_id}/original.png",
+            sha256="0" * 64,
+            size_bytes=1,
+            status="processed",
+            ocr_json_path=f"documents/{doc_id}/ocr_result.json",
+        )
+    )
+
+
+def test_extract_all_stores_skips_and_forces(db_session, tmp_path, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "storage_dir", str(tmp_path), raising=False)
+    ids = [f"00000000-0000-0000-0000-00000000000{i}" for i in range(5)]
+    for i, doc_id in enumerate(ids):
+        _add_processed_doc(db_session, tmp_path, doc_id, f"{i + 1}0,00")
+    # documento senza JSON su disco: contato come fallito
+    db_session.add(
+        Document(
+            id="00000000-0000-0000-0000-000000000009",
+            original_filename="x.png",
+            mime_type="image/png",
+            storage_path="documents/x/original.png",
+            sha256="1" * 64,
+            size_bytes=1,
+            status="processed",
+            ocr_json_path="documents/missing/ocr_result.json",
+        )
+    )
+    db_session.commit()
+
+    stats = run_extract_all(db_session, workers=1, batch_size=2)
+    assert (stats.documents, stats.skipped, stats.failed) == (5, 0, 1)
+    rows = {r.document_id: json.loads(r.payload_json) for r in db_session.query(DocumentExtraction)}
+    assert rows[ids[2]]["fields"]["total"]["value"] == "30.00"
+
+    # Seconda esecuzione: i documenti già estratti vengono saltati
+    stats = run_extract_all(db_session, workers=1, batch_size=2)
+    assert (stats.documents, stats.skipped) == (0, 5)
+
+    # --force: ricalcolo con pool di processi, senza duplicare le righe
+    stats = run_extract_all(db_session, workers=2, batch_size=10, force=True)
+    assert stats.documents == 5
+    assert db_session.query(DocumentExtraction).count() == 5
+    assert "docs/sec" in stats.report()
+
+
+def test_extract_all_counts_malformed_json_as_failed(db_session, tmp_path, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "storage_dir", str(tmp_path), raising=False)
+    malformed = [
+        [1, 2],  # non è un oggetto
+        {"pages": [{"page_index": 1, "full_text": "X", "items": [], "layout": {"lines": [{"key": [1, 1, 1]}]}}]},
+        {"pages": [{"page_index": 1, "full_text": "X", "items": 5}]},
+    ]
+    ids = [f"00000000-0000-0000-0000-00000000000{i}" for i in range(6)]
+    for i, doc_id in enumerate(ids):
+        ocr = malformed[i // 2] if i % 2 else None
+        _add_processed_doc(db_session, tmp_path, doc_id, f"{i + 1}0,00", ocr=ocr)
+    db_session.commit()
+
+    # I documenti corrotti sono contati come falliti, gli altri del blocco salvati
+    for workers in (1, 2):
+        stats = run_extract_all(db_session, workers=workers, batch_size=6, force=True)
+        assert (stats.documents, stats.failed) == (3, 3)
+    assert {r.document_id for r in db_session.query(DocumentExtraction)} == {ids[0], ids[2], ids[4]}
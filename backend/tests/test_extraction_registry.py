@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from app.extraction.registry import get_extractor, register_extractor, unregister_extractor
+from app.extraction.rule_v0 import extract_fields_from_pages
+from app.models.document import Document
+from app.models.document_extraction import DocumentExtraction
+
+DOC_ID = "00000000-0000-0000-0000-000000000001"
+
+
+@pytest.fixture()
+def processed_doc(db_session, tmp_path, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "storage_dir", str(tmp_path), raising=False)
+    doc_dir = tmp_path / "documents" / DOC_ID
+    doc_dir.mkdir(parents=True)
+    ocr = {"pages": [{"page_index": 1, "full_text": "BAR\nTOTALE 7,20 EUR\n05/05/2024", "items": []}]}
+    (doc_dir / "ocr_result.json").write_text(json.dumps(ocr), encoding="utf-8")
+    db_session.add(
+        Document(
+            id=DOC_ID,
+            original_filename="r.png",
+            mime_type="image/png",
+            storage_path=f"documents/{DOC_ID}/original.png",
+            sha256="0" * 64,
+            size_bytes=1,
+            status="processed",
+            ocr_json_path=f"documents/{DOC_ID}/ocr_result.json",
+        )
+    )
+    db_session.commit()
+    return DOC_ID
+
+
+@pytest.fixture()
+def candidate_extractors():
+    """rule_v1: come rule_v0 ma merchant in maiuscolo; broken: solleva sempre."""
+    def rule_v1(pages):
+        out = extract_fields_from_pages(pages)
+        out["fields"]["merchant"]["value"] = "BAR SPORT"
+        return out
+
+    def broken(_pages):
+        raise RuntimeError("boom")
+
+    register_extractor("rule_v1", rule_v1)
+    register_extractor("broken", broken)
+    yield
+    unregister_extractor("rule_v1")
+    unregister_extractor("broken")
+
+
+def test_shadow_extractors_run_in_background_and_are_recorded(client, db_session, processed_doc, candidate_extractors, monkeypatch):
+    from app.core.config import settings
+    from app.services.extraction import shadow_runner
+
+    monkeypatch.setattr(settings, "extraction_shadow", ["rule_v1", "broken"], raising=False)
+
+    resp = client.post(f"/documents/{processed_doc}/extract-fields")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["extraction_version"] == "rule_v0"
+    assert body["fields"]["merchant"]["value"] == "BAR"
+
+    shadow_runner.shutdown(wait=True)
+    db_session.expire_all()
+    rows = {r.extraction_version: r for r in db_session.query(DocumentExtraction).filter_by(document_id=processed_doc)}
+    # lo shadow che fallisce non lascia righe e non tocca il primario
+    assert set(rows) == {"rule_v0", "rule_v1"}
+    assert rows["rule_v0"].shadow is False
+    assert rows["rule_v1"].shadow is True
+    assert rows["rule_v1"].latency_ms is not None
+    assert json.loads(rows["rule_v1"].payload_json)["fields"]["merchant"]["value"] == "BAR SPORT"
+
+
+def test_primary_extractor_is_configurable(client, processed_doc, candidate_extractors, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "extraction_primary", "rule_v1", raising=False)
+    body = client.post(f"/documents/{processed_doc}/extract-fields").json()
+    assert body["extraction_version"] == "rule_v1"
+    assert body["fields"]["merchant"]["value"] == "BAR SPORT"
+
+    with pytest.raises(ValueError, match="Unknown extractor"):
+        get_extractor("rule_v9")
@@ -28,3 +28,38 @@ def test_extract_rule_v0_happy_path():
     assert fields["date"]["value"] == "2019-06-27"
     assert fields["total"]["value"] == "12.34"
     assert fields["total"]["confidence"] >= 0.5
+
+
+def test_extract_rule_v0_multi_page_total_evidence():
+    # Totale sulla seconda pagina: la bbox è l'unione dei token con lo stesso testo dell'importo
+    ocr_json = {
+        "pages": [
+            {
+                "page_index": 1,
+                "full_text": "FATTURA\nACME SRL\nriga 1 3,50\n",
+                "items": [
+                    {"text": "3,50", "confidence": 0.9, "bbox": [40, 20, 60, 30], "line_key": "1:1:1:3"},
+                ],
+            },
+            {
+                "page_index": 2,
+                "full_text": "subtotale 40,00\nTOTALE 40,00 €\n2024-01-15\n",
+                "items": [
+                    {"text": "40,00", "confidence": 0.6, "bbox": [50, 0, 70, 10], "line_key": "1:1:1:1"},
+                    {"text": "TOTALE", "confidence": 0.9, "bbox": [0, 12, 30, 22], "line_key": "1:1:1:2"},
+                    {"text": "40,00 ", "confidence": 0.8, "bbox": [48, 12, 72, 22], "line_key": "1:1:1:2"},
+                ],
+            },
+        ],
+    }
+
+    out = extract_fields_rule_v0(ocr_json)
+    fields = out["fields"]
+
+    assert fields["merchant"]["value"] == "ACME SRL"
+    assert fields["currency"]["evidence"] == {"snippet": "EUR", "bbox": None, "page_index": 2}
+    assert fields["date"]["value"] == "2024-01-15"
+    # "subtotale" contiene "TOT": a parità di score vince la prima riga
+    assert fields["total"]["value"] == "40.00"
+    assert fields["total"]["evidence"] == {"snippet": "subtotale 40,00", "bbox": [48, 0, 72, 22], "page_index": 2}
+    assert out["needs_review"] is False
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from app.extraction.rule_v0 import extract_fields_rule_v0
+from app.ocr.artifact import OcrArtifact, write_ocr_artifact
+
+OCR_JSON = {
+    "engine": "tesseract",
+    "pages": [
+        {
+            "page_index": 1,
+            "full_text": "CAFFÈ ROMA\nsubtotale 4,50\nTOTALE 4,50 €\n03/03/2024",
+            "items": [
+                {"text": "CAFFÈ", "confidence": 0.93, "bbox": [0, 0, 40, 10], "line_key": "1:1:1:1"},
+                {"text": "4,50", "confidence": 0.7, "bbox": [50, 12, 70, 22], "line_key": "1:1:1:2"},
+                {"text": "TOTALE", "confidence": 0.91, "bbox": None, "line_key": None},
+                {"text": "4,50 ", "confidence": 0.88, "bbox": [48, 24, 72, 34], "line_key": "1:1:1:3"},
+            ],
+            "timings_ms": {"ocr": 12.5},
+        },
+        {"page_index": 2, "full_text": "", "items": [], "timings_ms": {}},
+    ],
+    "metrics": {"pages": 2},
+}
+
+
+def test_artifact_round_trips_json_view(tmp_path):
+    path = tmp_path / "ocr_result.ocrc"
+    write_ocr_artifact(path, OCR_JSON)
+
+    art = OcrArtifact.open(path)
+    assert art.page_count == 2
+    assert art.bboxes.shape == (4, 4)
+    assert list(art.to_json()) == list(OCR_JSON)
+    assert art.to_json() == OCR_JSON
+
+
+def test_extraction_from_artifact_matches_json(tmp_path):
+    path = tmp_path / "ocr_result.ocrc"
+    write_ocr_artifact(path, OCR_JSON)
+
+    out = extract_fields_rule_v0(OcrArtifact.open(path))
+    assert out == extract_fields_rule_v0(OCR_JSON)
+    assert out["fields"]["total"]["evidence"]["bbox"] == [48, 12, 72, 34]
+
+
+def test_artifact_layout_drives_line_rules(tmp_path):
+    from app.ocr import tesseract_engine as te
+    from app.services.documents import _page_payload
+
+    data = {
+        "text": ["BAR SPORT", "TOTALE", "7,20", "7,20"],
+        "conf": [90, 95, 80, 60],
+        "left": [0, 0, 60, 0], "top": [0, 20, 20, 40], "width": [50, 40, 20, 20], "height": [10, 10, 10, 10],
+        "block_num": [1, 2, 2, 3], "par_num": [1, 1, 1, 1], "line_num": [1, 1, 1, 1], "word_num": [1, 1, 2, 1],
+    }
+    payload = {"engine": "tesseract", "pages": [_page_payload(1, te._result_from_data(data, page_index=1))]}
+    assert [ln["tokens"] for ln in payload["pages"][0]["layout"]["lines"]] == [[0, 1], [1, 3], [3, 4]]
+
+    path = tmp_path / "ocr_result.ocrc"
+    write_ocr_artifact(path, payload)
+    art = OcrArtifact.open(path)
+    assert art.to_json() == payload
+
+    out = extract_fields_rule_v0(art)
+    assert out == extract_fields_rule_v0(payload)
+    # evidence dalla geometria delle righe: merchant = bbox riga, totale = solo il token della riga TOTALE
+    assert out["fields"]["merchant"]["evidence"]["bbox"] == [0, 0, 50, 10]
+    assert out["fields"]["total"]["evidence"]["bbox"] == [60, 20, 80, 30]
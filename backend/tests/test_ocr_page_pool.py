@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import time
+
+from PIL import Image
+
+from app.ocr.page_pool import ocr_pages_parallel, shutdown_page_pools
+from app.ocr.pdf_render import iter_pdf_pages
+from app.ocr.pipeline import PipelineStats, iter_ocr_results
+from app.ocr.tesseract_engine import OcrItem, OcrResult
+
+
+class SlowFirstPageEngine:
+    """
+    Engine finto (picklable, definito a livello di modulo per i processi worker):
+    la prima pagina è la più lenta, così i risultati terminano fuori ordine.
+    """
+
+    def extract_from_pil(self, img, *, page_index=1):
+        time.sleep(0.3 if page_index == 1 else 0.01)
+        text = f"page {page_index} width {img.width}"
+        return OcrResult(
+            engine="fake",
+            items=[OcrItem(text=text, confidence=0.9, bbox=[0, 0, img.width, 10], line_key=f"{page_index}:1:1:1")],
+            full_text=text,
+        )
+
+
+def test_ocr_pages_parallel_keeps_page_order():
+    images = [Image.new("RGB", (100 + i, 20), color=(255, 255, 255)) for i in range(4)]
+    try:
+        results = ocr_pages_parallel(images, workers=2, engine_factory=SlowFirstPageEngine)
+    finally:
+        shutdown_page_pools()
+
+    assert [r.full_text for r in results] == [f"page {i + 1} width {100 + i}" for i in range(4)]
+    assert results[2].items[0].line_key == "3:1:1:1"
+
+
+def test_streaming_pipeline_bounds_inflight_pages():
+    consumed = []
+    consumed_at_first_result = []
+
+    def pages():
+        for i in range(6):
+            consumed.append(i)
+            yield Image.new("RGB", (100 + i, 20), color=(255, 255, 255))
+
+    stats = PipelineStats()
+    try:
+        results = []
+        for res in iter_ocr_results(
+            pages(), engine=None, workers=2, window=2, engine_factory=SlowFirstPageEngine, stats=stats
+        ):
+            if not results:
+                consumed_at_first_result.append(len(consumed))
+            results.append(res)
+    finally:
+        shutdown_page_pools()
+
+    assert [r.full_text for r in results] == [f"page {i + 1} width {100 + i}" for i in range(6)]
+    # Alla prima pagina pronta sono state renderizzate al massimo `window` pagine
+    assert consumed_at_first_result == [2]
+    metrics = stats.as_dict()
+    assert metrics["pages"] == 6
+    # Memoria misurata anche nei worker del page pool, dove avviene l'OCR
+    if metrics["process_peak_rss_bytes"] is not None:
+        assert metrics["page_worker_peak_rss_bytes"] > 0
+        assert metrics["process_rss_delta_bytes"] >= 0
+
+
+def test_iter_pdf_pages_renders_one_page_at_a_time(tmp_path):
+    import pypdfium2 as pdfium
+
+    pdf_path = tmp_path / "three_pages.pdf"
+    pdf = pdfium.PdfDocument.new()
+    for width in (200, 300, 400):
+        pdf.new_page(width, 100)
+    pdf.save(str(pdf_path))
+    pdf.close()
+
+    pages = iter_pdf_pages(pdf_path, scale=1.0)
+    first = next(pages)
+    assert first.size == (200, 100)
+    assert [img.width for img in pages] == [300, 400]
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from app.ocr.preprocess import PROFILES, preprocess_for_tesseract
+
+
+def _receipt_like_image() -> Image.Image:
+    img = Image.new("RGB", (400, 200), color=(250, 250, 245))
+    draw = ImageDraw.Draw(img)
+    for y in range(20, 180, 30):
+        draw.text((20, y), "TOTALE 12,34 EUR", fill=(20, 20, 20))
+    return img
+
+
+@pytest.mark.parametrize("profile", sorted(PROFILES))
+def test_profiles_return_binary_image_and_stage_timings(profile):
+    timings: dict[str, float] = {}
+    out = preprocess_for_tesseract(_receipt_like_image(), profile=profile, timings=timings)
+
+    arr = np.asarray(out)
+    assert out.mode == "L"
+    assert set(np.unique(arr)) <= {0, 255}
+    # upscale x2 (larghezza < 1000) in tutti i profili
+    assert out.size == (800, 400)
+    assert list(timings) == ["grayscale", *PROFILES[profile]]
+    assert all(ms >= 0 for ms in timings.values())
+
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError):
+        preprocess_for_tesseract(_receipt_like_image(), profile="ultra")
+
+
+@pytest.mark.parametrize("angle", [-7.0, -2.0, 3.0, 12.0])
+def test_skew_estimate_on_downsampled_copy_matches_rotation(angle):
+    import cv2
+
+    from app.ocr.preprocess import _estimate_skew_angle
+
+    page = np.full((1600, 1200), 245, dtype=np.uint8)
+    for y in range(120, 1500, 60):
+        cv2.putText(page, "ARTICOLO 1 x 3,50 EUR", (80, y), cv2.FONT_HERSHEY_SIMPLEX, 1.4, 20, 3)
+
+    M = cv2.getRotationMatrix2D((600, 800), angle, 1.0)
+    rotated = cv2.warpAffine(page, M, (1200, 1600), borderMode=cv2.BORDER_REPLICATE)
+
+    # rotazione antioraria di `angle` => skew stimato -angle
+    assert _estimate_skew_angle(rotated) == pytest.approx(-angle, abs=0.5)
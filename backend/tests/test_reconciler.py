@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from app.extraction.registry import get_extractor, register_extractor
+from app.extraction.rule_v0 import RULE_V0_REVISION, extract_fields_from_pages
+from app.models.document import Document
+from app.models.document_extraction import DocumentExtraction
+from app.ocr.cache import ocr_config_fingerprint
+from app.services.reconciler import StaleReconciler
+
+
+def _doc(doc_id: str, *, ocr_fingerprint: str) -> Document:
+    return Document(
+        id=doc_id,
+        original_filename="r.png",
+        mime_type="image/png",
+        storage_path=f"documents/{doc_id}/original.png",
+        sha256="0" * 64,
+        size_bytes=1,
+        status="processed",
+        ocr_json_path=f"documents/{doc_id}/ocr_result.json",
+        ocr_fingerprint=ocr_fingerprint,
+    )
+
+
+# fingerprint di una configurazione/revisione precedente
+OLD = "0" * 16
+
+
+@pytest.fixture()
+def corpus(db_session, tmp_path, monkeypatch):
+    """
+    4 documenti: d0 con OCR obsoleto, d1/d2 con OCR aggiornato, d3 di prima dei fingerprint ("");
+    estrazioni di d1 (obsoleta), d2 (aggiornata) e d3 ("").
+    """
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "storage_dir", str(tmp_path), raising=False)
+    current = ocr_config_fingerprint()
+    rule_v0 = get_extractor("rule_v0")
+    for i, fp in enumerate([OLD, current, current, ""]):
+        doc_id = f"d{i}"
+        doc_dir = tmp_path / "documents" / doc_id
+        doc_dir.mkdir(parents=True)
+        ocr = {"pages": [{"page_index": 1, "full_text": "BAR\nTOTALE 7,20 EUR\n05/05/2024", "items": []}]}
+        (doc_dir / "ocr_result.json").write_text(json.dumps(ocr), encoding="utf-8")
+        db_session.add(_doc(doc_id, ocr_fingerprint=fp))
+    db_session.flush()
+    db_session.add_all(
+        [
+            # salvato da una revisione precedente delle regole
+            DocumentExtraction(
+                document_id="d1", extraction_version="rule_v0", payload_json="{}",
+                ocr_fingerprint=current, extractor_fingerprint=OLD,
+            ),
+            DocumentExtraction(
+                document_id="d2", extraction_version="rule_v0", payload_json="{}",
+                ocr_fingerprint=current, extractor_fingerprint=rule_v0.fingerprint,
+            ),
+            DocumentExtraction(
+                document_id="d3", extraction_version="rule_v0", payload_json="{}",
+                ocr_fingerprint="", extractor_fingerprint="",
+            ),
+        ]
+    )
+    db_session.commit()
+
+
+def test_reconciler_reprocesses_only_stale_rows(db_session, corpus, monkeypatch):
+    from app.services.ocr_jobs import ocr_job_queue
+
+    enqueued: list[str] = []
+
+    def fake_enqueue(db, document_id, *, mark_queued=True):
+        # OCR rifatto subito con la configurazione corrente
+        enqueued.append(document_id)
+        db.get(Document, document_id).ocr_fingerprint = ocr_config_fingerprint()
+        db.commit()
+
+    monkeypatch.setattr(ocr_job_queue, "enqueue", fake_enqueue)
+    reconciler = StaleReconciler(max_per_sec=1000, batch_size=1, interval_s=0, reocr=True)
+
+    stats = reconciler.run_pass(db_session)
+    assert (stats.reocr, stats.reextracted, stats.failed) == (1, 1, 0)
+    assert enqueued == ["d0"]
+
+    db_session.expire_all()
+    row = db_session.query(DocumentExtraction).filter_by(document_id="d1").one()
+    assert row.extractor_fingerprint == get_extractor("rule_v0").fingerprint
+    assert json.loads(row.payload_json)["fields"]["total"]["value"] == "7.20"
+    # la riga aggiornata non viene toccata
+    assert db_session.query(DocumentExtraction).filter_by(document_id="d2").one().payload_json == "{}"
+
+    # niente più righe obsolete: il passaggio successivo (es. dopo un riavvio) non fa nulla
+    assert reconciler.run_pass(db_session).processed == 0
+
+
+def test_reconciler_picks_up_new_extractor_revision(db_session, corpus):
+    reconciler = StaleReconciler(max_per_sec=1000, batch_size=10, interval_s=0, reocr=False)
+    assert reconciler.run_pass(db_session).reextracted == 1
+
+    register_extractor("rule_v0", extract_fields_from_pages, revision=RULE_V0_REVISION + 1)
+    try:
+        # d1 e d2; d3 ("") resta fuori senza legacy
+        assert reconciler.run_pass(db_session).reextracted == 2
+    finally:
+        register_extractor("rule_v0", extract_fields_from_pages, revision=RULE_V0_REVISION)
+
+
+def test_reconciler_stop_interrupts_pass(db_session, corpus):
+    reconciler = StaleReconciler(max_per_sec=0.001, batch_size=10, interval_s=0, reocr=False)
+    # il primo slot è libero, il secondo arriverebbe tra 1000 s: lo stop interrompe l'attesa
+    assert reconciler._throttle()
+    reconciler.stop()
+    assert not reconciler._throttle()
+
+
+def test_reconciler_leaves_unknown_provenance_rows_unless_legacy(db_session, corpus, monkeypatch):
+    from app.services.ocr_jobs import ocr_job_queue
+
+    enqueued: list[str] = []
+
+    def fake_enqueue(db, document_id, *, mark_queued=True):
+        enqueued.append(document_id)
+        db.get(Document, document_id).ocr_fingerprint = ocr_config_fingerprint()
+        db.commit()
+
+    monkeypatch.setattr(ocr_job_queue, "enqueue", fake_enqueue)
+
+    StaleReconciler(max_per_sec=1000, batch_size=10, interval_s=0, reocr=True).run_pass(db_session)
+    assert enqueued == ["d0"]
+    assert db_session.query(DocumentExtraction).filter_by(document_id="d3").one().extractor_fingerprint == ""
+
+    StaleReconciler(max_per_sec=1000, batch_size=10, interval_s=0, reocr=True, legacy=True).run_pass(db_session)
+    assert enqueued == ["d0", "d3"]
+
+
+@pytest.fixture()
+def lossy_queue(monkeypatch):
+    """Coda OCR finta: i job restano "attivi" finché il test non li perde (riavvio)."""
+    from app.services.ocr_jobs import ocr_job_queue
+
+    active: list[str] = []
+
+    def fake_enqueue(db, document_id, *, mark_queued=True):
+        assert not mark_queued
+        active.append(document_id)
+
+    monkeypatch.setattr(ocr_job_queue, "enqueue", fake_enqueue)
+    monkeypatch.setattr(ocr_job_queue, "is_active", lambda document_id: document_id in active)
+    monkeypatch.setattr(ocr_job_queue, "active_count", lambda: len(active))
+    return active
+
+
+def test_reconciler_picks_up_reocr_lost_by_restart(db_session, corpus, lossy_queue):
+    reconciler = StaleReconciler(max_per_sec=1000, batch_size=1, interval_s=0, reocr=True)
+    assert reconciler.run_pass(db_session).reocr == 1
+    assert lossy_queue == ["d0"]
+    # in attesa dell'OCR il documento resta processato (col vecchio OCR), quindi leggibile
+    db_session.expire_all()
+    assert db_session.get(Document, "d0").status == "processed"
+    # job ancora in coda: non viene rimesso in coda
+    assert reconciler.run_pass(db_session).reocr == 0
+
+    # riavvio prima che l'OCR parta: il job si perde, d0 è ancora obsoleto e viene ripreso
+    lossy_queue.clear()
+    restarted = StaleReconciler(max_per_sec=1000, batch_size=1, interval_s=0, reocr=True)
+    assert restarted.run_pass(db_session).reocr == 1
+    assert lossy_queue == ["d0"]
+
+
+def test_reconciler_caps_pending_reocr_jobs(db_session, corpus, lossy_queue):
+    import threading
+
+    reconciler = StaleReconciler(
+        max_per_sec=1000, batch_size=10, interval_s=0, reocr=True, legacy=True, max_pending_ocr=1
+    )
+    worker = threading.Thread(target=reconciler.run_pass, args=(db_session,))
+    worker.start()
+    worker.join(0.3)
+    # d0 in coda, d3 aspetta che la coda si svuoti
+    assert worker.is_alive()
+    assert lossy_queue == ["d0"]
+    lossy_queue.clear()
+    worker.join(5)
+    assert not worker.is_alive()
+    assert lossy_queue == ["d3"]
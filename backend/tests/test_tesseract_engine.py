@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import pytest
+
+from app.ocr import tesseract_engine as te
+
+# TSV come lo produce TessBaseAPI.GetTSVText (senza header): righe page/block/par/line + parole
+TSV = "\n".join(
+    [
+        "1\t1\t0\t0\t0\t0\t0\t0\t200\t60\t-1\t",
+        "2\t1\t1\t0\t0\t0\t5\t5\t190\t50\t-1\t",
+        "4\t1\t1\t1\t1\t0\t5\t5\t190\t20\t-1\t",
+        "5\t1\t1\t1\t1\t1\t5\t5\t40\t20\t91.5\tTOTALE",
+        "5\t1\t1\t1\t1\t2\t50\t5\t40\t20\t88.0\t12,34",
+        "4\t1\t1\t1\t2\t0\t5\t30\t190\t20\t-1\t",
+        "5\t1\t1\t1\t2\t1\t5\t30\t40\t20\t77.2\tCOOP",
+        "5\t1\t1\t1\t2\t2\t50\t30\t40\t20\t60.0\t ",
+    ]
+)
+
+
+def test_tsv_backend_produces_same_structure_as_image_to_data():
+    res = te._result_from_data(te._parse_tsv(TSV), page_index=2)
+
+    assert [it.text for it in res.items] == ["TOTALE", "12,34", "COOP"]
+    assert res.items[0].confidence == pytest.approx(0.91)
+    assert res.items[1].bbox == [50, 5, 90, 25]
+    assert res.items[2].line_key == "2:1:1:2"
+    assert res.full_text == "TOTALE 12,34\nCOOP"
+
+
+def test_result_layout_lines_and_blocks():
+    res = te._result_from_data(te._parse_tsv(TSV), page_index=2)
+
+    assert [(ln.key, ln.token_start, ln.token_end) for ln in res.lines] == [((1, 1, 1), 0, 2), ((1, 1, 2), 2, 3)]
+    assert res.lines[0].bbox == [5, 5, 90, 25]
+    assert res.lines[0].confidence == pytest.approx((0.91 + 0.88) / 2)
+    assert len(res.blocks) == 1
+    assert (res.blocks[0].block, res.blocks[0].line_start, res.blocks[0].line_end) == (1, 0, 2)
+    assert res.blocks[0].bbox == [5, 5, 90, 50]
+
+
+def test_create_ocr_engine_rejects_unknown_backend(monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "ocr_backend", "nope", raising=False)
+    with pytest.raises(ValueError):
+        te.create_ocr_engine()
+
+    monkeypatch.setattr(settings, "ocr_backend", "subprocess", raising=False)
+    assert isinstance(te.create_ocr_engine(), te.TesseractOcrEngine)
+
+
+def test_tesserocr_pool_releases_slot_when_handle_creation_fails(monkeypatch):
+    import sys
+    import types
+
+    monkeypatch.setitem(sys.modules, "tesserocr", types.ModuleType("tesserocr"))
+    engine = te.TesserocrOcrEngine(pool_size=1)
+
+    class FakeApi:
+        def Clear(self):
+            pass
+
+    attempts = []
+
+    def new_handle():
+        attempts.append(1)
+        if len(attempts) <= 2:
+            raise RuntimeError("Failed loading language 'xx'")
+        return FakeApi()
+
+    monkeypatch.setattr(engine, "_new_handle", new_handle)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            with engine._handle():
+                pass
+
+    # Lo slot non è andato perso: la chiamata successiva crea l'handle invece di bloccarsi
+    with engine._handle() as api:
+        assert isinstance(api, FakeApi)
+    assert engine._created == 1
@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+EVAL_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = EVAL_DIR.parent / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.extraction.registry import get_extractor  # noqa: E402
+from app.models.base import Base  # noqa: E402
+from app.ocr.cache import ocr_config, ocr_config_fingerprint  # noqa: E402
+from app.services import documents as documents_svc  # noqa: E402
+from app.services.extraction import extract_fields_for_document, primary_extraction_version  # noqa: E402
+from app.storage import guess_mime_type, save_document_stream  # noqa: E402
+
+"""
+Valutazione end-to-end su un set di scontrini etichettati:
+upload -> render -> preprocess -> OCR -> estrattore primario (rule_v0), con gli stessi servizi dell'API,
+su un DB SQLite e uno storage temporanei (cache OCR disattivata: ogni run fa l'OCR a freddo).
+
+Riporta:
+- accuratezza per campo (solo sui campi etichettati; merchant confrontato senza maiuscole/spazi)
+- latenza p50/p95 e pagine/sec per stage: upload, render (residuo: render PDF / lettura immagine + overhead),
+  ogni stage di preprocessing, ocr, ocr_total, extract, end_to_end
+
+Il risultato va in un JSON (eval/results/ di default); con --baseline stampa le differenze rispetto
+a un run precedente.
+
+Etichette (JSONL): {"file": "<path relativo al file di etichette>", "fields": {"total": "41.00", ...}}
+Uso:  python eval/run_eval.py [--labels eval/receipts/labels.jsonl] [--out FILE] [--baseline FILE]
+"""
+
+FIELDS = ("merchant", "currency", "date", "total")
+REPORT_SCHEMA = 1
+DEFAULT_LABELS = EVAL_DIR / "receipts" / "labels.jsonl"
+RESULTS_DIR = EVAL_DIR / "results"
+# Stage misurati una volta per documento (gli altri sono per pagina)
+DOCUMENT_STAGES = frozenset({"upload", "render", "ocr_total", "extract", "end_to_end"})
+
+
+@dataclass
+class LabeledReceipt:
+    path: Path
+    fields: dict[str, str | None]
+
+
+@dataclass
+class DocumentRun:
+    file: str
+    pages: int = 0
+    # stage -> ms (stage per documento) oppure lista di ms (una per pagina)
+    stages_ms: dict[str, list[float]] = field(default_factory=dict)
+    predicted: dict[str, str | None] = field(default_factory=dict)
+    needs_review: bool = True
+    error: str | None = None
+
+    def add(self, stage: str, ms: float) -> None:
+        self.stages_ms.setdefault(stage, []).append(ms)
+
+
+def load_labels(path: Path) -> list[LabeledReceipt]:
+    receipts: list[LabeledReceipt] = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        fields = row.get("fields") or {}
+        receipts.append(
+            LabeledReceipt(path=(path.parent / row["file"]).resolve(), fields={k: fields.get(k) for k in FIELDS})
+        )
+    return receipts
+
+
+def normalize(field_name: str, value: str | None) -> str | None:
+    if value is None:
+        return None
+    if field_name == "merchant":
+        return " ".join(value.split()).casefold()
+    return value.strip()
+
+
+def _run_document(db: Session, receipt: LabeledReceipt, engine: Any) -> DocumentRun:
+    run = DocumentRun(file=str(receipt.path))
+
+    # upload: salvataggio a chunk + insert, come POST /documents/upload
+    t0 = time.perf_counter()
+    with receipt.path.open("rb") as f:
+        saved = save_document_stream(
+            base_dir=settings.storage_path,
+            stream=f,
+            filename=receipt.path.name,
+            mime_type=guess_mime_type(receipt.path.name),
+        )
+    doc = documents_svc.create_document(
+        db,
+        document_id=saved["document_id"],
+        original_filename=saved["original_filename"],
+        mime_type=saved["mime_type"],
+        storage_path=saved["stored_relative_path"],
+        sha256=saved["sha256"],
+        size_bytes=saved["size_bytes"],
+    )
+    upload_ms = (time.perf_counter() - t0) * 1000.0
+    run.add("upload", upload_ms)
+
+    # render + preprocess + OCR
+    t0 = time.perf_counter()
+    doc = documents_svc.process_document_ocr(db, doc.id, engine=engine)
+    ocr_total_ms = (time.perf_counter() - t0) * 1000.0
+    if doc is None or doc.status != "processed" or not doc.ocr_json_path:
+        run.error = doc.error_message if doc is not None else "Document not found"
+        return run
+    run.add("ocr_total", ocr_total_ms)
+
+    # tempi per pagina registrati nel JSON OCR (stage di preprocessing + "ocr")
+    payload = json.loads((settings.storage_path / doc.ocr_json_path).read_text(encoding="utf-8"))
+    pages = payload.get("pages") or []
+    run.pages = len(pages)
+    page_ms = 0.0
+    for page in pages:
+        for stage, ms in (page.get("timings_ms") or {}).items():
+            run.add(stage if stage == "ocr" else f"preprocess.{stage}", ms)
+            page_ms += ms
+    run.add("render", max(0.0, ocr_total_ms - page_ms))
+
+    # estrazione con l'estrattore primario (caricamento OCR + regole + salvataggio)
+    t0 = time.perf_counter()
+    res = extract_fields_for_document(db, doc.id)
+    extract_ms = (time.perf_counter() - t0) * 1000.0
+    run.add("extract", extract_ms)
+    run.add("end_to_end", upload_ms + ocr_total_ms + extract_ms)
+
+    if res is not None:
+        run.predicted = {k: (res.fields[k].value if k in res.fields else None) for k in FIELDS}
+        run.needs_review = res.needs_review
+    return run
+
+
+def run_pipeline(receipts: list[LabeledReceipt], *, workdir: Path, engine: Any = None) -> list[DocumentRun]:
+    """Esegue la pipeline su tutti gli scontrini, con DB e storage temporanei in `workdir`."""
+    previous = settings.storage_dir, settings.ocr_cache_enabled
+    settings.storage_dir = str(workdir / "storage")
+    settings.ocr_cache_enabled = False
+    db_engine = create_engine(f"sqlite:///{workdir / 'eval.db'}")
+    try:
+        Base.metadata.create_all(db_engine)
+        if engine is None:
+            engine = documents_svc.create_ocr_engine()
+        with Session(bind=db_engine, autoflush=False, expire_on_commit=False) as db:
+            return [_run_document(db, receipt, engine) for receipt in receipts]
+    finally:
+        db_engine.dispose()
+        settings.storage_dir, settings.ocr_cache_enabled = previous
+
+
+def summarize(receipts: list[LabeledReceipt], runs: list[DocumentRun]) -> dict[str, Any]:
+    fields: dict[str, dict[str, Any]] = {}
+    for name in FIELDS:
+        labeled = correct = 0
+        for receipt, run in zip(receipts, runs, strict=True):
+            expected = receipt.fields.get(name)
+            if expected is None:
+                continue
+            labeled += 1
+            correct += normalize(name, run.predicted.get(name)) == normalize(name, expected)
+        fields[name] = {
+            "labeled": labeled,
+            "correct": correct,
+            "accuracy": round(correct / labeled, 4) if labeled else None,
+        }
+
+    stages: dict[str, dict[str, Any]] = {}
+    stage_names = dict.fromkeys(stage for run in runs for stage in run.stages_ms)
+    for stage in stage_names:
+        values = np.array([ms for run in runs for ms in run.stages_ms.get(stage, [])], dtype=np.float64)
+        # pagine coperte dallo stage: tutte quelle del documento (stage per documento) o una per valore
+        if stage in DOCUMENT_STAGES:
+            pages = sum(run.pages for run in runs if stage in run.stages_ms)
+        else:
+            pages = int(values.size)
+        total_s = float(values.sum()) / 1000.0
+        stages[stage] = {
+            "count": int(values.size),
+            "p50_ms": round(float(np.percentile(values, 50)), 2),
+            "p95_ms": round(float(np.percentile(values, 95)), 2),
+            "total_ms": round(total_s * 1000.0, 2),
+            "pages_per_sec": round(pages / total_s, 2) if total_s > 0 else None,
+        }
+
+    processed = [run for run in runs if run.error is None]
+    return {
+        "documents": len(runs),
+        "failed": len(runs) - len(processed),
+        "pages": sum(run.pages for run in processed),
+        "needs_review_rate": round(sum(run.needs_review for run in processed) / len(processed), 4)
+        if processed else None,
+        "fields": fields,
+        "stages": stages,
+    }
+
+
+def build_report(labels_path: Path, receipts: list[LabeledReceipt], runs: list[DocumentRun]) -> dict[str, Any]:
+    extractor = get_extractor(primary_extraction_version())
+    return {
+        "schema": REPORT_SCHEMA,
+        "created_at": datetime.now(UTC).isoformat(timespec="seconds"),
+        "labels": str(labels_path),
+        "config": {
+            "ocr": ocr_config(),
+            "ocr_fingerprint": ocr_config_fingerprint(),
+            "extractor": {"version": extractor.version, "fingerprint": extractor.fingerprint},
+        },
+        "summary": summarize(receipts, runs),
+        "documents": [
+            {
+                "file": run.file,
+                "pages": run.pages,
+                "error": run.error,
+                "needs_review": run.needs_review,
+                "fields": {
+                    name: {
+                        "expected": receipt.fields.get(name),
+                        "predicted": run.predicted.get(name),
+                        "correct": None if receipt.fields.get(name) is None
+                        else normalize(name, run.predicted.get(name)) == normalize(name, receipt.fields.get(name)),
+                    }
+                    for name in FIELDS
+                },
+                "stages_ms": {stage: [round(ms, 2) for ms in values] for stage, values in run.stages_ms.items()},
+            }
+            for receipt, run in zip(receipts, runs, strict=True)
+        ],
+    }
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any]) -> list[str]:
+    """Differenze rispetto al baseline: accuratezza per campo e p50/p95 per stage."""
+    lines = [f"baseline: {baseline.get('created_at')}  extractor={baseline['config']['extractor']}"]
+    for name, cur in current["summary"]["fields"].items():
+        base = baseline["summary"]["fields"].get(name, {})
+        if cur["accuracy"] is None or base.get("accuracy") is None:
+            continue
+        delta = cur["accuracy"] - base["accuracy"]
+        lines.append(f"  {name:<22} accuracy {base['accuracy']:.3f} -> {cur['accuracy']:.3f} ({delta:+.3f})")
+    for stage, cur in current["summary"]["stages"].items():
+        base = baseline["summary"]["stages"].get(stage)
+        if base is None:
+            continue
+        parts = []
+        for key in ("p50_ms", "p95_ms"):
+            pct = (cur[key] - base[key]) / base[key] * 100.0 if base[key] else 0.0
+            parts.append(f"{key} {base[key]:.1f} -> {cur[key]:.1f} ({pct:+.1f}%)")
+        lines.append(f"  {stage:<22} " + "  ".join(parts))
+    return lines
+
+
+def format_summary(report: dict[str, Any]) -> list[str]:
+    s = report["summary"]
+    lines = [f"documents={s['documents']} failed={s['failed']} pages={s['pages']} needs_review={s['needs_review_rate']}"]
+    for name, f in s["fields"].items():
+        acc = "n/a" if f["accuracy"] is None else f"{f['accuracy']:.3f}"
+        lines.append(f"  {name:<22} accuracy={acc} ({f['correct']}/{f['labeled']})")
+    for stage, st in s["stages"].items():
+        lines.append(
+            f"  {stage:<22} p50={st['p50_ms']:.1f}ms p95={st['p95_ms']:.1f}ms pages/sec={st['pages_per_sec']}"
+        )
+    return lines
+
+
+def main(argv: list[str] | None = None, *, engine: Any = None) -> dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Valutazione end-to-end OCR + estrazione")
+    parser.add_argument("--labels", type=Path, default=DEFAULT_LABELS, help="file JSONL con le etichette")
+    parser.add_argument("--out", type=Path, default=None, help="JSON dei risultati (default: eval/results/)")
+    parser.add_argument("--baseline", type=Path, default=None, help="JSON di un run precedente da confrontare")
+    args = parser.parse_args(argv)
+
+    labels_path = args.labels.resolve()
+    receipts = load_labels(labels_path)
+    with tempfile.TemporaryDirectory(prefix="expense-eval-") as tmp:
+        runs = run_pipeline(receipts, workdir=Path(tmp), engine=engine)
+    report = build_report(labels_path, receipts, runs)
+
+    out = args.out or RESULTS_DIR / f"run-{datetime.now(UTC):%Y%m%dT%H%M%SZ}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    print("\n".join(format_summary(report)))
+    if args.baseline is not None:
+        print("\n".join(compare(report, json.loads(args.baseline.read_text(encoding="utf-8")))))
+    print(f"results: {out}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import time
 from datetime import date
 from decimal import Decimal, InvalidOperation
 
@@ -39,10 +40,19 @@ def api_get_document(document_id: str) -> dict:
 
 
 def api_get_ocr_json(document_id: str) -> dict:
+    # Cache locale per ETag: se il JSON non è cambiato l'API risponde 304 senza body
+    cache = st.session_state.setdefault("ocr_json_cache", {})
+    cached = cache.get(document_id)
+    headers = {"If-None-Match": cached[0]} if cached else {}
     with httpx.Client(timeout=10.0) as client:
-        r = client.get(f"{API_BASE_URL}/documents/{document_id}/ocr-json")
+        r = client.get(f"{API_BASE_URL}/documents/{document_id}/ocr-json", headers=headers)
+        if r.status_code == 304 and cached:
+            return cached[1]
         r.raise_for_status()
-        return r.json()
+        payload = r.json()
+        if "etag" in r.headers:
+            cache[document_id] = (r.headers["etag"], payload)
+        return payload
     
 def api_upload_document(file_name: str, file_bytes: bytes, mime_type: str) -> dict:
     with httpx.Client(timeout=30.0) as client:
@@ -53,11 +63,29 @@ def api_upload_document(file_name: str, file_bytes: bytes, mime_type: str) -> di
 
 
 def api_process_ocr(document_id: str) -> dict:
-    with httpx.Client(timeout=60.0) as client:
+    # L'API risponde subito 202 con il job: l'OCR gira in background
+    with httpx.Client(timeout=5.0) as client:
         r = client.post(f"{API_BASE_URL}/documents/{document_id}/process-ocr")
         r.raise_for_status()
         return r.json()
 
+
+def api_get_job(job_id: str) -> dict:
+    with httpx.Client(timeout=5.0) as client:
+        r = client.get(f"{API_BASE_URL}/jobs/{job_id}")
+        r.raise_for_status()
+        return r.json()
+
+
+def wait_ocr_job(job_id: str, *, timeout_s: float = 120.0, poll_s: float = 1.0) -> dict:
+    """Polling del job OCR finché non è processed/failed (o scade il timeout)."""
+    deadline = time.monotonic() + timeout_s
+    job = api_get_job(job_id)
+    while job["status"] in ("queued", "running") and time.monotonic() < deadline:
+        time.sleep(poll_s)
+        job = api_get_job(job_id)
+    return job
+
 st.set_page_config(page_title="Expense Manager AI", layout="wide")
 st.title("Expense Manager AI – Streamlit v1")
 st.caption(f"Backend API: {API_BASE_URL}")
@@ -76,7 +104,7 @@ if "filters" not in st.session_state:
     }
 
 if "pagination" not in st.session_state:
-    st.session_state["pagination"] = {"limit": 50, "offset": 0}
+    st.session_state["pagination"] = {"limit": 50, "offset": 0, "cursors": []}
 
 ok = api_health()
 if ok:
@@ -130,6 +158,7 @@ with st.sidebar:
     if apply_filters:
         # Quando applichi nuovi filtri, riparti da pagina 1
         st.session_state["pagination"]["offset"] = 0
+        st.session_state["pagination"]["cursors"] = []
         st.rerun()
 
     if reset_filters:
@@ -143,7 +172,7 @@ with st.sidebar:
             "min_amount": "",
             "max_amount": "",
         }
-        st.session_state["pagination"] = {"limit": 50, "offset": 0}
+        st.session_state["pagination"] = {"limit": 50, "offset": 0, "cursors": []}
         st.rerun()
 
 if submitted:
@@ -219,7 +248,13 @@ if do_process:
         st.warning("Nessun document_id disponibile. Prima fai upload.")
     else:
         try:
-            resp = api_process_ocr(doc_id)
+            job = api_process_ocr(doc_id)
+            with st.spinner(f"OCR in corso (job {job['job_id']})..."):
+                job = wait_ocr_job(job["job_id"])
+            if job["status"] in ("queued", "running"):
+                st.info(f"OCR ancora in corso (status={job['status']}). Riprova più tardi dal viewer.")
+                st.stop()
+            resp = api_get_document(doc_id)
             st.success(f"OCR completato. status={resp['status']}")
             if resp.get("error_message"):
                 st.error(resp["error_message"])
@@ -286,11 +321,13 @@ try:
     f = st.session_state["filters"]
     p = st.session_state["pagination"]
 
-    # Costruzione params coerente con API
-    params = {
-        "limit": p["limit"],
-        "offset": p["offset"],
-    }
+    # Costruzione params coerente con API: paginazione a cursore (keyset), lo stack dei cursori
+    # visitati serve per "Prev"; offset è solo il numero della prima riga mostrata
+    p.setdefault("cursors", [])
+    # count "cached": sfogliando le pagine con gli stessi filtri il total non viene ricalcolato
+    params = {"limit": p["limit"], "count": "cached"}
+    if p["cursors"]:
+        params["after"] = p["cursors"][-1]
 
     if f["merchant"].strip():
         params["merchant"] = f["merchant"].strip()
@@ -337,17 +374,19 @@ try:
             st.dataframe(items, width="stretch")
 
         # Paginazione: Prev/Next
-        prev_disabled = p["offset"] <= 0
-        next_disabled = (p["offset"] + p["limit"]) >= total
+        prev_disabled = not p["cursors"]
+        next_disabled = data.get("next_cursor") is None or (p["offset"] + len(items)) >= total
 
         pc1, pc2, pc3 = st.columns([1, 1, 2])
         with pc1:
             if st.button("Prev", disabled=prev_disabled):
-                st.session_state["pagination"]["offset"] = max(0, p["offset"] - p["limit"])
+                p["cursors"].pop()
+                p["offset"] = max(0, p["offset"] - p["limit"])
                 st.rerun()
         with pc2:
             if st.button("Next", disabled=next_disabled):
-                st.session_state["pagination"]["offset"] = p["offset"] + p["limit"]
+                p["cursors"].append(data["next_cursor"])
+                p["offset"] = p["offset"] + len(items)
                 st.rerun()
         with pc3:
             st.caption("Tip: usa 'Needs review=true' per vedere rapidamente le spese da revisionare (HITL).")